@@ -0,0 +1,330 @@
+"""
+Declarative agent graph configuration.
+
+Loads an agent graph (agents, prompts, tools, models, handoffs and handoff
+guards) from a TOML, JSON or YAML file, validates it against the tools and
+guards the application provides, and compiles it into Agent objects. Compiled
+graphs are cached per file and only rebuilt when the file changes on disk, so
+new tutoring flows or A/B prompt variants can be shipped as config files.
+
+A config may ``extends = "other.toml"`` to inherit every agent from a base
+graph and override individual fields, which keeps variants small.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+import tomllib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+DEFAULT_GRAPH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_graph.toml")
+
+SUPPORTED_VERSIONS = {1}
+
+
+class AgentGraphError(ValueError):
+    """Raised when an agent graph config is malformed or references unknown names"""
+
+
+@dataclass(frozen=True)
+class HandoffSpec:
+    target: str
+    guard: str | None = None
+
+
+@dataclass(frozen=True)
+class AgentSpec:
+    key: str
+    name: str
+    instructions: str
+    handoff_description: str = ""
+    model: str = ""
+    tools: Tuple[str, ...] = ()
+    handoffs: Tuple[HandoffSpec, ...] = ()
+    prompt_prefix: bool = True
+    parallel_tool_calls: bool | None = None  # None: the provider's default
+
+
+@dataclass(frozen=True)
+class GraphSpec:
+    version: int
+    entry: str
+    agents: Dict[str, AgentSpec]
+    source: str
+    digest: str
+    files: Tuple[str, ...] = ()  # the source and every file of its ``extends`` chain
+    stamps: Tuple[Tuple[int, int], ...] = ()  # (mtime, size) of ``files``, taken before each was read
+
+
+@dataclass
+class CompiledGraph:
+    spec: GraphSpec
+    agents: Dict[str, Any]
+    compile_seconds: float
+    by_name: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def entry(self) -> Any:
+        return self.agents[self.spec.entry]
+
+
+def _read_file(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        raw = f.read()
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".toml":
+        return tomllib.loads(raw.decode("utf-8"))
+    if suffix == ".json":
+        return json.loads(raw)
+    if suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise AgentGraphError(f"{path}: PyYAML is required for YAML agent graphs") from e
+        return yaml.safe_load(raw) or {}
+    raise AgentGraphError(f"{path}: unsupported agent graph format '{suffix}'")
+
+
+def _load_raw(path: str, seen: Tuple[str, ...] = (), files: List[str] | None = None,
+              stamps: List[Tuple[int, int]] | None = None) -> Dict[str, Any]:
+    path = os.path.abspath(path)
+    if path in seen:
+        raise AgentGraphError(f"Circular 'extends' chain: {' -> '.join(seen + (path,))}")
+    stat = os.stat(path)
+    data = _read_file(path)
+    if files is not None:
+        files.append(path)
+    if stamps is not None:
+        stamps.append((stat.st_mtime_ns, stat.st_size))
+
+    base_ref = data.pop("extends", None)
+    if base_ref is None:
+        return data
+    base = _load_raw(os.path.join(os.path.dirname(path), base_ref), seen + (path,), files, stamps)
+
+    merged_agents = {key: dict(value) for key, value in base.get("agents", {}).items()}
+    for key, overrides in data.pop("agents", {}).items():
+        merged_agents.setdefault(key, {}).update(overrides)
+    return {**base, **data, "agents": merged_agents}
+
+
+def load_graph_spec(path: str = DEFAULT_GRAPH_PATH) -> GraphSpec:
+    """Parse (and resolve ``extends`` of) an agent graph config"""
+    files: List[str] = []
+    stamps: List[Tuple[int, int]] = []
+    data = _load_raw(path, files=files, stamps=stamps)
+
+    version = data.get("version", 1)
+    if version not in SUPPORTED_VERSIONS:
+        raise AgentGraphError(f"{path}: unsupported agent graph version {version}")
+
+    raw_agents = data.get("agents")
+    if not isinstance(raw_agents, dict) or not raw_agents:
+        raise AgentGraphError(f"{path}: at least one [agents.<key>] table is required")
+
+    agents = {}
+    for key, entry in raw_agents.items():
+        for required in ("name", "instructions"):
+            if not entry.get(required):
+                raise AgentGraphError(f"{path}: agent '{key}' is missing '{required}'")
+        handoffs = []
+        for handoff in entry.get("handoffs", []):
+            if isinstance(handoff, str):
+                handoff = {"target": handoff}
+            if "target" not in handoff:
+                raise AgentGraphError(f"{path}: agent '{key}' has a handoff without 'target'")
+            handoffs.append(HandoffSpec(target=handoff["target"], guard=handoff.get("guard")))
+        agents[key] = AgentSpec(
+            key=key,
+            name=entry["name"],
+            instructions=entry["instructions"].strip("\n"),
+            handoff_description=entry.get("handoff_description", ""),
+            model=entry.get("model") or f"route:{key}",
+            tools=tuple(entry.get("tools", [])),
+            handoffs=tuple(handoffs),
+            prompt_prefix=entry.get("prompt_prefix", True),
+            parallel_tool_calls=entry.get("parallel_tool_calls"),
+        )
+
+    digest = hashlib.sha256(
+        json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return GraphSpec(
+        version=version,
+        entry=data.get("entry", next(iter(agents))),
+        agents=agents,
+        source=os.path.abspath(path),
+        digest=digest,
+        files=tuple(files),
+        stamps=tuple(stamps),
+    )
+
+
+def validate_graph_spec(spec: GraphSpec, tools: Dict[str, Any], guards: Dict[str, Any]) -> None:
+    """Check every reference in the graph; raises AgentGraphError listing all problems"""
+    problems: List[str] = []
+    if spec.entry not in spec.agents:
+        problems.append(f"entry agent '{spec.entry}' is not defined")
+
+    names: Dict[str, str] = {}
+    for key, agent in spec.agents.items():
+        if agent.name in names:
+            problems.append(f"agents '{names[agent.name]}' and '{key}' share the name '{agent.name}'")
+        names[agent.name] = key
+        for tool in agent.tools:
+            if tool not in tools:
+                problems.append(f"agent '{key}' uses unknown tool '{tool}'")
+        for handoff in agent.handoffs:
+            if handoff.target not in spec.agents:
+                problems.append(f"agent '{key}' hands off to unknown agent '{handoff.target}'")
+            if handoff.guard is not None and handoff.guard not in guards:
+                problems.append(f"agent '{key}' uses unknown guard '{handoff.guard}'")
+
+    if problems:
+        raise AgentGraphError(f"{spec.source}: " + "; ".join(problems))
+
+
+def compile_graph(
+    spec: GraphSpec,
+    tools: Dict[str, Any],
+    guards: Dict[str, Any],
+    resolve_model: Callable[[str], Any],
+    filters: Dict[str, Any] | None = None,
+) -> CompiledGraph:
+    """
+    Validate ``spec`` and build its Agent objects with handoffs wired. ``filters``
+    maps guard names to ``is_enabled`` callables that hide a guarded handoff from
+    the model while its guard would reject it.
+    """
+    from agents import Agent, ModelSettings, handoff
+    from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
+
+    validate_graph_spec(spec, tools, guards)
+    started = time.perf_counter()
+
+    agents = {}
+    for key, agent_spec in spec.agents.items():
+        instructions = agent_spec.instructions
+        if agent_spec.prompt_prefix:
+            instructions = f"{RECOMMENDED_PROMPT_PREFIX}\n{instructions}"
+        agents[key] = Agent(
+            name=agent_spec.name,
+            handoff_description=agent_spec.handoff_description,
+            instructions=instructions,
+            tools=[tools[name] for name in agent_spec.tools],
+            model=resolve_model(agent_spec.model),
+            model_settings=ModelSettings(parallel_tool_calls=agent_spec.parallel_tool_calls),
+        )
+
+    filters = filters or {}
+    for key, agent_spec in spec.agents.items():
+        agents[key].handoffs = [
+            handoff(
+                agent=agents[h.target],
+                on_handoff=guards[h.guard],
+                is_enabled=filters.get(h.guard, True),
+            )
+            if h.guard else agents[h.target]
+            for h in agent_spec.handoffs
+        ]
+
+    return CompiledGraph(
+        spec=spec,
+        agents=agents,
+        compile_seconds=time.perf_counter() - started,
+        by_name={agent.name: agent for agent in agents.values()},
+    )
+
+
+def _stamp(files: Tuple[str, ...]) -> Tuple[Tuple[int, int], ...] | None:
+    """Modification stamps of ``files``; None if one of them is gone"""
+    try:
+        return tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, files))
+    except OSError:
+        return None
+
+
+class GraphCache:
+    """Compiled graphs keyed by file, rebuilt only when the file or a file it extends changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Tuple[Tuple[int, int], ...], CompiledGraph]] = {}
+        self.compilations = 0
+
+    def _fresh(self, path: str) -> CompiledGraph | None:
+        cached = self._entries.get(path)
+        if cached is not None and _stamp(cached[1].spec.files) == cached[0]:
+            return cached[1]
+        return None
+
+    def get(
+        self,
+        path: str,
+        tools: Dict[str, Any],
+        guards: Dict[str, Any],
+        resolve_model: Callable[[str], Any],
+        filters: Dict[str, Any] | None = None,
+    ) -> CompiledGraph:
+        path = os.path.abspath(path)
+        compiled = self._fresh(path)
+        if compiled is not None:
+            return compiled
+
+        with self._lock:
+            compiled = self._fresh(path)
+            if compiled is not None:
+                return compiled
+            spec = load_graph_spec(path)
+            compiled = compile_graph(spec, tools, guards, resolve_model, filters)
+            # Each file was stamped before it was read, so an edit racing the load is picked up by the next get
+            self._entries[path] = (spec.stamps, compiled)
+            self.compilations += 1
+            return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def parse_variants(raw: str) -> List[Tuple[str, str, float]]:
+    """Parse ``name=path:weight,...`` into (name, path, weight) triples"""
+    variants = []
+    for entry in raw.split(","):
+        if "=" not in entry:
+            continue
+        name, _, target = entry.strip().partition("=")
+        path, _, weight = target.partition(":")
+        variants.append((name, path, float(weight or 1)))
+    return variants
+
+
+def choose_variant(session_id: str, variants: List[Tuple[str, str, float]]) -> Tuple[str, str]:
+    """Deterministically assign a session to a weighted variant; returns (name, path)"""
+    total = sum(weight for _, _, weight in variants)
+    bucket = int(hashlib.sha256(session_id.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF * total
+    for name, path, weight in variants:
+        if bucket < weight:
+            return name, path
+        bucket -= weight
+    name, path, _ = variants[-1]
+    return name, path
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Validate a graph file without building agents: python agent_graph.py [path]
+    from main import _TOOL_SPECS, HANDOFF_GUARDS
+
+    spec = load_graph_spec(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_GRAPH_PATH)
+    validate_graph_spec(spec, _TOOL_SPECS, HANDOFF_GUARDS)
+    print(f"✅ {spec.source} (digest {spec.digest}), entry: {spec.entry}")
+    for key, agent in spec.agents.items():
+        targets = ", ".join(
+            f"{h.target}" + (f" [{h.guard}]" if h.guard else "") for h in agent.handoffs)
+        print(f"  {key}: {agent.name} | model={agent.model} | tools={', '.join(agent.tools)} | handoffs={targets}")
@@ -0,0 +1,62 @@
+"""
+Lazy agent registry.
+
+Agents come from a compiled agent graph (see agent_graph.py) and are only
+constructed the first time any of them is requested, so importing the module
+that owns the registry stays cheap. One-time setup steps (SDK import, tool
+wrapping) run before the first build.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, List
+
+
+class AgentRegistry:
+    """Resolves agents by key from a lazily compiled agent graph"""
+
+    def __init__(self):
+        self._setup: List[Callable[[], None]] = []
+        self._loader: Callable[[str | None], Any] | None = None
+        self._setup_done = False
+        self._lock = threading.RLock()
+
+    def before_build(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Register a one-time setup step (SDK import, client configuration)"""
+        self._setup.append(fn)
+        return fn
+
+    def graph_loader(self, fn: Callable[[str | None], Any]) -> Callable[[str | None], Any]:
+        """Register the function returning the compiled graph for a config path"""
+        self._loader = fn
+        return fn
+
+    @property
+    def built(self) -> bool:
+        return self._setup_done
+
+    def graph(self, path: str | None = None) -> Any:
+        """Compiled graph for ``path`` (the default graph when None)"""
+        if not self._setup_done:
+            with self._lock:
+                if not self._setup_done:
+                    for setup in self._setup:
+                        setup()
+                    self._setup_done = True
+        if self._loader is None:
+            raise RuntimeError("No agent graph loader registered")
+        return self._loader(path)
+
+    def build(self, path: str | None = None) -> dict:
+        return self.graph(path).agents
+
+    def get(self, key: str, path: str | None = None) -> Any:
+        agents = self.build(path)
+        if key not in agents:
+            raise KeyError(f"Unknown agent '{key}'. Registered agents: {', '.join(agents)}")
+        return agents[key]
+
+    def entry(self, path: str | None = None) -> Any:
+        """The graph's entry agent"""
+        return self.graph(path).entry
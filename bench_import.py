@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Cold-start / import-time benchmark for the CLI and Streamlit entry points.
+
+Each scenario runs in a fresh interpreter with ``python -X importtime`` and the
+wall-clock time of the process is recorded, together with the slowest imports.
+Pass ``--compare <git ref>`` to benchmark the same scenarios on another
+revision (e.g. the commit before lazy agent construction) side by side.
+
+Usage:
+    python bench_import.py --runs 5 --compare HEAD~1
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+SCENARIOS = {
+    "cli: import main": "import main",
+    "cli: import main + build agents": (
+        "import main; registry = getattr(main, 'agent_registry', None); "
+        "registry and registry.build()"
+    ),
+    "streamlit: import streamlit_app": "import streamlit_app",
+}
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int]]:
+    """Return (module, cumulative microseconds) for each imported module"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append((name.strip(), int(cumulative_us)))
+    return modules
+
+
+def run_scenario(snippet: str, cwd: str) -> Tuple[float, List[Tuple[str, int]]]:
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", snippet],
+        cwd=cwd, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario failed in {cwd}:\n{completed.stderr[-2000:]}")
+    return wall, parse_importtime(completed.stderr)
+
+
+def benchmark(cwd: str, runs: int) -> Dict[str, Dict[str, object]]:
+    results = {}
+    for name, snippet in SCENARIOS.items():
+        walls = []
+        top: List[Tuple[str, int]] = []
+        for _ in range(runs):
+            wall, modules = run_scenario(snippet, cwd)
+            walls.append(wall)
+            top = sorted(modules, key=lambda m: m[1], reverse=True)[:8]
+        results[name] = {"median": statistics.median(walls), "min": min(walls), "top": top}
+    return results
+
+
+def export_revision(ref: str) -> str:
+    """Extract ``ref`` of the current repository into a temporary directory"""
+    archive = subprocess.run(["git", "archive", "--format=tar", ref],
+                             capture_output=True, check=True).stdout
+    target = tempfile.mkdtemp(prefix="yourteacher-bench-")
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(target, filter="data")
+    return target
+
+
+def print_report(label: str, results: Dict[str, Dict[str, object]], show_top: bool) -> None:
+    print(f"\n📦 {label}")
+    print("-" * 70)
+    for name, entry in results.items():
+        print(f"{name:<36} median {entry['median'] * 1000:8.1f} ms   min {entry['min'] * 1000:8.1f} ms")
+        if show_top:
+            for module, cumulative in entry["top"][:5]:
+                print(f"    {cumulative / 1000:8.1f} ms  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark for YourTeacher")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per scenario")
+    parser.add_argument("--compare", metavar="REF", help="Also benchmark this git revision")
+    parser.add_argument("--top", action="store_true", help="Show the slowest imports per scenario")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    current = benchmark(here, args.runs)
+    print_report("Working tree", current, args.top)
+
+    if args.compare:
+        before = benchmark(export_revision(args.compare), args.runs)
+        print_report(f"Revision {args.compare}", before, args.top)
+        print(f"\n⚡ Speed-up vs {args.compare}")
+        print("-" * 70)
+        for name in SCENARIOS:
+            old, new = before[name]["median"], current[name]["median"]
+            print(f"{name:<36} {old * 1000:8.1f} ms -> {new * 1000:8.1f} ms  ({old / new:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
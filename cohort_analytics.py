@@ -0,0 +1,443 @@
+"""
+Cohort analytics over persisted quiz attempts and student profiles.
+
+Quiz results are appended by the tutoring sessions (see ``AttemptLog``) to
+JSON-lines files in ``YOURTEACHER_ANALYTICS_DIR``:
+
+    quizzes.jsonl   one row per finished quiz (topic, score, total, source, quiz_id)
+    attempts.jsonl  one row per answered question (topic, item, correct)
+    profiles.jsonl  profile snapshot of the student at the time of the quiz
+
+For analysis the files are loaded into columns (NumPy arrays; string columns
+dictionary-encoded into integer codes) with pyarrow's multi-threaded JSON
+reader when it is available, and every statistic (per-topic mastery
+distributions, item difficulty, cohort comparisons) is computed with grouped
+NumPy reductions instead of Python loops.
+
+Mastery is kept apart per quiz ``source``: agent quizzes score the percentage
+of correct answers, adaptive quizzes an IRT proficiency estimate on 0-100
+(see adaptive_quiz.py), and the two are not averaged together.
+
+Usage:
+    python cohort_analytics.py report [--dir DIR] [--by cognitive_ability]
+    python cohort_analytics.py bench --rows 5000000
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+PROFILE_FIELDS = ("grade_level", "cognitive_ability", "learning_style", "learning_pace")
+COHORT_DIMENSIONS = PROFILE_FIELDS
+
+QUIZ_STRINGS = ("session_id", "topic", "source", "quiz_id")
+ATTEMPT_STRINGS = ("session_id", "topic", "item_id")
+PROFILE_STRINGS = ("session_id",) + PROFILE_FIELDS
+
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 10
+
+
+def default_analytics_dir() -> str:
+    return os.getenv("YOURTEACHER_ANALYTICS_DIR", os.path.join(".yourteacher", "analytics"))
+
+
+# RECORDING
+
+class AttemptLog:
+    """Append-only JSON-lines log of quiz results, attempts and profile snapshots"""
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory or default_analytics_dir()
+        self._lock = threading.Lock()
+        self._recorded: set = set()  # (session id, quiz id) recorded by this process
+
+    def _append(self, name: str, rows: Iterable[Dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+        if not lines:
+            return
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    def record_quiz(
+        self,
+        session_id: str,
+        context: Any,
+        topic: str,
+        score: float,
+        total: float,
+        responses: List[tuple],
+        source: str,
+        quiz_id: str | None = None,
+    ) -> bool:
+        """
+        Persist a finished quiz. ``responses`` are (item id, correct) pairs;
+        ``context`` is the StudentLearningContext whose profile is snapshotted.
+        A quiz with a ``quiz_id`` is recorded once per session; False if it
+        already was (a replayed turn scoring it again).
+        """
+        key = (session_id, quiz_id)
+        if quiz_id is not None:
+            with self._lock:
+                if key in self._recorded:
+                    return False
+                self._recorded.add(key)
+        try:
+            self._write_quiz(session_id, context, topic, score, total, responses, source, quiz_id)
+        except OSError:
+            self._recorded.discard(key)  # not recorded: let a retry write it
+            raise
+        return True
+
+    def _write_quiz(self, session_id, context, topic, score, total, responses, source, quiz_id) -> None:
+        ts = time.time()
+        topic = (topic or "unknown").lower()
+        self._append("profiles.jsonl", [{
+            "ts": ts, "session_id": session_id,
+            **{name: getattr(context, name, None) or "" for name in PROFILE_FIELDS},
+        }])
+        self._append("attempts.jsonl", (
+            {"ts": ts, "session_id": session_id, "topic": topic, "item_id": item_id, "correct": int(correct)}
+            for item_id, correct in responses
+        ))
+        self._append("quizzes.jsonl", [{
+            "ts": ts, "session_id": session_id, "topic": topic,
+            "score": score, "total": total, "source": source, "quiz_id": quiz_id or "",
+        }])
+
+
+_attempt_log: AttemptLog | None = None
+
+
+def get_attempt_log() -> AttemptLog:
+    global _attempt_log
+    if _attempt_log is None:
+        _attempt_log = AttemptLog()
+    return _attempt_log
+
+
+# LOADING
+
+@dataclass
+class Frame:
+    """Columns of equal length; string columns hold codes into ``labels[name]``"""
+    columns: Dict[str, np.ndarray] = field(default_factory=dict)
+    labels: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def decode(self, name: str, codes: np.ndarray) -> np.ndarray:
+        return self.labels[name][codes]
+
+
+def load_frame(path: str, strings: Iterable[str]) -> Frame:
+    """Read a JSON-lines file into a Frame (empty Frame if the file is missing)"""
+    strings = tuple(strings)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return Frame()
+    try:
+        import pyarrow.json as arrow_json
+    except ImportError:
+        return _load_frame_python(path, strings)
+
+    table = arrow_json.read_json(path)
+    frame = Frame()
+    for name in table.column_names:
+        column = table.column(name)
+        if name in strings:
+            encoded = column.cast("string").fill_null("").dictionary_encode().combine_chunks()
+            frame.columns[name] = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int32)
+            frame.labels[name] = np.asarray(encoded.dictionary.to_pylist(), dtype=object)
+        else:
+            frame.columns[name] = column.to_numpy().astype(np.float64)
+    return frame
+
+
+def _load_frame_python(path: str, strings: tuple) -> Frame:
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    frame = Frame()
+    for name in rows[0]:
+        values = [row.get(name) for row in rows]
+        if name in strings:
+            labels, codes = np.unique(np.asarray([v or "" for v in values], dtype=object), return_inverse=True)
+            frame.columns[name] = codes.astype(np.int32)
+            frame.labels[name] = labels
+        else:
+            frame.columns[name] = np.asarray(values, dtype=np.float64)
+    return frame
+
+
+def load_cohort(directory: str | None = None) -> Dict[str, Frame]:
+    directory = directory or default_analytics_dir()
+    return {
+        "quizzes": load_frame(os.path.join(directory, "quizzes.jsonl"), QUIZ_STRINGS),
+        "attempts": load_frame(os.path.join(directory, "attempts.jsonl"), ATTEMPT_STRINGS),
+        "profiles": load_frame(os.path.join(directory, "profiles.jsonl"), PROFILE_STRINGS),
+    }
+
+
+# GROUPED REDUCTIONS
+
+def group_quantiles(codes: np.ndarray, values: np.ndarray, groups: int, percentiles=PERCENTILES) -> np.ndarray:
+    """groups x len(percentiles) array of per-group percentiles (NaN for empty groups)"""
+    order = np.lexsort((values, codes))
+    counts = np.bincount(codes, minlength=groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sorted_values = values[order]
+    result = np.full((groups, len(percentiles)), np.nan)
+    present = counts > 0
+    for column, pct in enumerate(percentiles):
+        offsets = np.floor((counts[present] - 1) * pct / 100).astype(np.int64)
+        result[present, column] = sorted_values[starts[present] + offsets]
+    return result
+
+
+def group_mean(codes: np.ndarray, values: np.ndarray, groups: int) -> tuple:
+    counts = np.bincount(codes, minlength=groups)
+    sums = np.bincount(codes, weights=values, minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return counts, sums / counts
+
+
+# ANALYTICS
+
+def topic_source_codes(quizzes: Frame) -> tuple:
+    """Per quiz row, the code of its (topic, source) pair, the number of pairs and of sources"""
+    if "source" not in quizzes.columns:
+        return quizzes.columns["topic"].astype(np.int64), len(quizzes.labels["topic"]), 1
+    sources = len(quizzes.labels["source"])
+    codes = quizzes.columns["topic"].astype(np.int64) * sources + quizzes.columns["source"]
+    return codes, len(quizzes.labels["topic"]) * sources, sources
+
+
+def _topic_source(quizzes: Frame, code: int, sources: int) -> Dict[str, str]:
+    source = quizzes.labels["source"][code % sources] if "source" in quizzes.labels else ""
+    return {"topic": quizzes.labels["topic"][code // sources], "source": source or "(unknown)"}
+
+
+def mastery_by_topic(quizzes: Frame) -> List[Dict[str, Any]]:
+    """Per topic and quiz source: quiz count, mean mastery, percentiles and a 10-bin histogram (0-100%)"""
+    if not len(quizzes):
+        return []
+    topics, groups, sources = topic_source_codes(quizzes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mastery = np.where(quizzes.columns["total"] > 0,
+                           quizzes.columns["score"] / quizzes.columns["total"] * 100, np.nan)
+    valid = ~np.isnan(mastery)
+    topics, mastery = topics[valid], mastery[valid]
+
+    counts, means = group_mean(topics, mastery, groups)
+    quantiles = group_quantiles(topics, mastery, groups)
+    bins = np.minimum((mastery // (100 / HISTOGRAM_BINS)).astype(np.int64), HISTOGRAM_BINS - 1)
+    histogram = np.bincount(topics * HISTOGRAM_BINS + bins,
+                            minlength=groups * HISTOGRAM_BINS).reshape(groups, HISTOGRAM_BINS)
+    return [
+        {
+            **_topic_source(quizzes, g, sources),
+            "quizzes": int(counts[g]),
+            "mean": float(means[g]),
+            **{f"p{pct}": float(quantiles[g, i]) for i, pct in enumerate(PERCENTILES)},
+            "histogram": histogram[g].tolist(),
+        }
+        for g in np.flatnonzero(counts)
+    ]
+
+
+def item_difficulty(attempts: Frame, min_attempts: int = 1) -> List[Dict[str, Any]]:
+    """Per item: attempts, proportion correct and classical logit difficulty (hardest first)"""
+    if not len(attempts):
+        return []
+    items = attempts.columns["item_id"]
+    groups = len(attempts.labels["item_id"])
+    counts, p_correct = group_mean(items, attempts.columns["correct"], groups)
+    # The topic of an item is the topic of any of its rows
+    topic_of = np.zeros(groups, dtype=np.int64)
+    topic_of[items] = attempts.columns["topic"]
+    clipped = np.clip(p_correct, 0.01, 0.99)
+    difficulty = np.log((1 - clipped) / clipped)
+
+    selected = np.flatnonzero(counts >= min_attempts)
+    selected = selected[np.argsort(-difficulty[selected], kind="stable")]
+    return [
+        {
+            "item_id": attempts.labels["item_id"][g],
+            "topic": attempts.labels["topic"][topic_of[g]],
+            "attempts": int(counts[g]),
+            "p_correct": float(p_correct[g]),
+            "difficulty": float(difficulty[g]),
+        }
+        for g in selected
+    ]
+
+
+def latest_profile_codes(quizzes: Frame, profiles: Frame, dimension: str) -> tuple:
+    """For each quiz row, the code of ``dimension`` in its session's latest profile (-1 if none)"""
+    if not len(profiles):
+        return np.full(len(quizzes), -1, dtype=np.int64), np.asarray([], dtype=object)
+    profile_sessions = profiles.columns["session_id"]
+    order = np.argsort(profiles.columns["ts"], kind="stable")
+    # Last occurrence per session wins: unique over the reversed time order
+    unique_sessions, first_in_reversed = np.unique(profile_sessions[order][::-1], return_index=True)
+    latest_rows = order[::-1][first_in_reversed]
+    session_labels = profiles.labels["session_id"][unique_sessions].astype(str)
+    value_codes = profiles.columns[dimension][latest_rows]
+
+    # Map quiz session labels onto profile sessions through a sorted lookup
+    sort = np.argsort(session_labels)
+    quiz_session_labels = quizzes.labels["session_id"].astype(str)
+    position = np.searchsorted(session_labels[sort], quiz_session_labels)
+    position = np.minimum(position, len(sort) - 1)
+    found = session_labels[sort][position] == quiz_session_labels
+    per_quiz_label = np.where(found, value_codes[sort][position], -1)
+    return per_quiz_label[quizzes.columns["session_id"]], profiles.labels[dimension]
+
+
+def cohort_comparison(quizzes: Frame, profiles: Frame, dimension: str) -> List[Dict[str, Any]]:
+    """Mean mastery per (topic, source, cohort) and its difference from the topic's mean for that source"""
+    if dimension not in COHORT_DIMENSIONS:
+        raise ValueError(f"Unknown cohort dimension '{dimension}'. Choose from: {', '.join(COHORT_DIMENSIONS)}")
+    if not len(quizzes):
+        return []
+    cohort, cohort_labels = latest_profile_codes(quizzes, profiles, dimension)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mastery = quizzes.columns["score"] / quizzes.columns["total"] * 100
+    valid = np.isfinite(mastery) & (cohort >= 0)
+    topics, topic_groups, sources = topic_source_codes(quizzes)
+    topics, cohort, mastery = topics[valid], cohort[valid], mastery[valid]
+
+    cohort_groups = max(len(cohort_labels), 1)
+    _, topic_means = group_mean(topics, mastery, topic_groups)
+    counts, means = group_mean(topics * cohort_groups + cohort, mastery, topic_groups * cohort_groups)
+    return [
+        {
+            **_topic_source(quizzes, g // cohort_groups, sources),
+            dimension: cohort_labels[g % cohort_groups] or "(unknown)",
+            "quizzes": int(counts[g]),
+            "mean": float(means[g]),
+            "vs_topic": float(means[g] - topic_means[g // cohort_groups]),
+        }
+        for g in np.flatnonzero(counts)
+    ]
+
+
+# CLI
+
+def print_report(cohort: Dict[str, Frame], dimension: str, top_items: int = 10) -> None:
+    quizzes, attempts, profiles = cohort["quizzes"], cohort["attempts"], cohort["profiles"]
+    print(f"📊 {len(quizzes)} quizzes, {len(attempts)} answered questions, {len(profiles)} profile snapshots")
+
+    print("\n🎯 Mastery by topic (% correct; proficiency 0-100 for adaptive quizzes)")
+    print(f"{'topic':<24} {'source':<10} {'quizzes':>8} {'mean':>6} "
+          + " ".join(f"{'p' + str(p):>5}" for p in PERCENTILES))
+    for row in mastery_by_topic(quizzes):
+        print(f"{row['topic'][:24]:<24} {row['source'][:10]:<10} {row['quizzes']:>8} {row['mean']:>6.1f} "
+              + " ".join(f"{row['p' + str(p)]:>5.0f}" for p in PERCENTILES))
+
+    print(f"\n🧩 Hardest items (top {top_items})")
+    print(f"{'item':<28} {'topic':<20} {'attempts':>8} {'correct':>8} {'logit b':>8}")
+    for row in item_difficulty(attempts)[:top_items]:
+        print(f"{row['item_id'][:28]:<28} {row['topic'][:20]:<20} {row['attempts']:>8} "
+              f"{row['p_correct']:>8.2f} {row['difficulty']:>8.2f}")
+
+    print(f"\n👥 Mastery by {dimension}")
+    print(f"{'topic':<24} {'source':<10} {dimension:<18} {'quizzes':>8} {'mean':>6} {'vs topic':>9}")
+    for row in cohort_comparison(quizzes, profiles, dimension):
+        print(f"{row['topic'][:24]:<24} {row['source'][:10]:<10} {str(row[dimension])[:18]:<18} {row['quizzes']:>8} "
+              f"{row['mean']:>6.1f} {row['vs_topic']:>+9.1f}")
+
+
+def write_synthetic(directory: str, attempt_rows: int, seed: int = 0) -> None:
+    """Synthetic cohort: ~10 attempts per quiz, one profile per session"""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    quizzes = attempt_rows // 10
+    sessions = max(quizzes // 3, 1)
+    topics = np.array(["photosynthesis", "fractions", "quadratic equations", "world war ii", "cells", "poetry"])
+    levels = np.array(["High", "Medium", "Low"])
+    styles = np.array(["Visual", "Auditory", "Kinesthetic", "Mixed"])
+    paces = np.array(["Fast", "Medium", "Slow"])
+
+    session_ids = np.char.add("s", np.arange(sessions).astype(str))
+    ability = rng.integers(0, 3, sessions)
+    pd.DataFrame({
+        "ts": np.arange(sessions, dtype=np.float64), "session_id": session_ids,
+        "grade_level": np.char.add("Grade ", rng.integers(5, 13, sessions).astype(str)),
+        "cognitive_ability": levels[ability], "learning_style": styles[rng.integers(0, 4, sessions)],
+        "learning_pace": paces[rng.integers(0, 3, sessions)],
+    }).to_json(os.path.join(directory, "profiles.jsonl"), orient="records", lines=True)
+
+    quiz_session = rng.integers(0, sessions, quizzes)
+    quiz_topic = rng.integers(0, len(topics), quizzes)
+    skill = np.array([0.8, 0.65, 0.45])[ability[quiz_session]]
+    score = rng.binomial(10, skill)
+    pd.DataFrame({
+        "ts": np.arange(quizzes, dtype=np.float64), "session_id": session_ids[quiz_session],
+        "topic": topics[quiz_topic], "score": score, "total": 10, "source": "synthetic",
+    }).to_json(os.path.join(directory, "quizzes.jsonl"), orient="records", lines=True)
+
+    attempt_quiz = np.repeat(np.arange(quizzes), 10)
+    item = rng.integers(0, 40, attempt_quiz.size)
+    item_ids = np.char.add(np.char.add(topics[quiz_topic[attempt_quiz]], "#"), item.astype(str))
+    pd.DataFrame({
+        "ts": attempt_quiz.astype(np.float64), "session_id": session_ids[quiz_session[attempt_quiz]],
+        "topic": topics[quiz_topic[attempt_quiz]], "item_id": item_ids,
+        "correct": (rng.random(attempt_quiz.size) < skill[attempt_quiz] - item / 200).astype(np.int8),
+    }).to_json(os.path.join(directory, "attempts.jsonl"), orient="records", lines=True)
+
+
+def benchmark(attempt_rows: int, directory: str | None = None) -> None:
+    import tempfile
+
+    directory = directory or tempfile.mkdtemp(prefix="yourteacher-cohort-")
+    if not os.path.exists(os.path.join(directory, "attempts.jsonl")):
+        started = time.perf_counter()
+        write_synthetic(directory, attempt_rows)
+        print(f"📝 Wrote {attempt_rows} synthetic attempts to {directory} in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    cohort = load_cohort(directory)
+    loaded = time.perf_counter()
+    mastery_by_topic(cohort["quizzes"])
+    item_difficulty(cohort["attempts"])
+    for dimension in COHORT_DIMENSIONS:
+        cohort_comparison(cohort["quizzes"], cohort["profiles"], dimension)
+    computed = time.perf_counter()
+    print(f"⚡ {len(cohort['attempts'])} attempts, {len(cohort['quizzes'])} quizzes: "
+          f"load {loaded - started:.2f}s, analytics {computed - loaded:.2f}s")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cohort analytics over persisted quiz attempts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Print mastery, item difficulty and cohort comparison")
+    report.add_argument("--dir", default=None, help="Analytics directory (default: YOURTEACHER_ANALYTICS_DIR)")
+    report.add_argument("--by", default="cognitive_ability", choices=COHORT_DIMENSIONS)
+    report.add_argument("--top", type=int, default=10, help="Number of hardest items to show")
+    bench = sub.add_parser("bench", help="Load and analyse a synthetic cohort")
+    bench.add_argument("--rows", type=int, default=2_000_000, help="Attempt rows")
+    bench.add_argument("--dir", default=None, help="Reuse/keep the synthetic data here")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        print_report(load_cohort(args.dir), args.by, args.top)
+    else:
+        benchmark(args.rows, args.dir)
+
+
+if __name__ == "__main__":
+    main()
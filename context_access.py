@@ -0,0 +1,331 @@
+"""
+Versioned access to StudentLearningContext.
+
+Tools, the frontend and session persistence all touch a student's
+StudentLearningContext: tools on the session runtime loop (several at once,
+see parallel_tools.py), the frontend from Streamlit script threads and
+hibernation while it encodes a session. ``context_access`` keeps those
+accesses safe:
+
+* every context has a version, bumped by each update, and the set of
+  fields changed since they were last persisted (dirty fields);
+* updates and consistent reads hold a lock striped by session id, so the
+  writers of one session exclude each other without one lock per session
+  or one global lock;
+* ``update(..., expected_version=v)`` is a compare-and-set: it raises
+  VersionConflict when the context changed after version ``v`` was read,
+  and the caller reads again and retries;
+* tools run on a copy from ``read`` and their changes are applied with
+  ``rebase``, so a tool waiting on I/O never holds the lock;
+* ``restore`` puts a context back to a copy from ``read``, undoing the
+  tool effects of a turn that is replayed (see session_runtime.py).
+
+Processes sharing sessions (supervisor.py) get the same check on the
+session store: a checkpoint is only written over the version the process
+last read or wrote (see session_hibernation.py).
+
+Usage:
+    python context_access.py stress --sessions 50 --calls 20 --threads 4
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, Set, Tuple
+
+LOCK_STRIPES = 64
+
+_MISSING = object()
+
+
+class VersionConflict(RuntimeError):
+    """Raised by a compare-and-set update when the state changed since the expected version"""
+
+    def __init__(self, expected: Any, actual: Any):
+        super().__init__(f"Expected version {expected}, found {actual}")
+        self.expected = expected
+        self.actual = actual
+
+
+@dataclass
+class ContextChange:
+    """Result of applying a tool's changes"""
+    version: int
+    fields: Set[str] = field(default_factory=set)
+    conflicts: int = 0  # fields another update changed since the tool's copy was read
+
+
+class ContextMetrics:
+    """Update, rebase and compare-and-set conflict counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"updates": 0, "rebases": 0, "version_conflicts": 0, "merge_conflicts": 0}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+
+context_metrics = ContextMetrics()
+
+
+def _merge_list(target: list, before: list, after: list) -> bool:
+    """Apply the edits and appends from ``before`` to ``after`` onto ``target``; False if not item-wise"""
+    if len(after) < len(before) or len(target) < len(before):
+        return False
+    for index, item in enumerate(after[:len(before)]):
+        if item != before[index]:
+            target[index] = item
+    target.extend(after[len(before):])
+    return True
+
+
+class ContextAccess:
+    """Locked, versioned reads and updates of StudentLearningContext objects"""
+
+    def __init__(self, stripes: int = LOCK_STRIPES):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def lock(self, context: Any) -> threading.RLock:
+        """Lock stripe of the session ``context`` belongs to"""
+        key = context.session_id or str(id(context))
+        return self._locks[zlib.crc32(key.encode()) % len(self._locks)]
+
+    @contextmanager
+    def locked(self, context: Any) -> Iterator[Any]:
+        """Hold the lock of ``context`` to read several fields consistently (do not await inside)"""
+        with self.lock(context):
+            yield context
+
+    @staticmethod
+    def version(context: Any) -> int:
+        return context._version
+
+    def read(self, context: Any) -> Tuple[Any, int]:
+        """A deep copy of ``context`` and its version"""
+        with self.lock(context):
+            return context.model_copy(deep=True), context._version
+
+    def update(self, context: Any, changes: Dict[str, Any], expected_version: int | None = None) -> int:
+        """Set the fields in ``changes``; with ``expected_version``, only if ``context`` is still at it"""
+        with self.lock(context):
+            if expected_version is not None and context._version != expected_version:
+                context_metrics.incr("version_conflicts")
+                raise VersionConflict(expected_version, context._version)
+            for name, value in changes.items():
+                setattr(context, name, value)
+            context_metrics.incr("updates")
+            return self._changed(context, changes)
+
+    def rebase(self, context: Any, before: Any, after: Any, replace: Iterable[str] = ()) -> ContextChange:
+        """Apply what a tool changed from ``before`` to ``after`` (copies from ``read``) onto ``context``
+
+        Lists the tool grew or edited are merged item by item, so appends made
+        since ``before`` are kept, unless named in ``replace`` (lists the tool
+        builds anew); any other changed value is replaced.
+        """
+        replace = set(replace)
+        with self.lock(context):
+            change = ContextChange(context._version)
+            for name, value in vars(after).items():
+                old = vars(before).get(name, _MISSING)
+                if value == old:
+                    continue
+                change.fields.add(name)
+                current = getattr(context, name, _MISSING)
+                if name in replace:
+                    setattr(context, name, value)
+                    continue
+                if isinstance(value, list) and old is _MISSING:
+                    # A list the tool created (``_quiz_results`` on a first answer) may also be created by a sibling
+                    old = []
+                    if current is _MISSING:
+                        current = []
+                        setattr(context, name, current)
+                if isinstance(value, list) and isinstance(old, list) and isinstance(current, list):
+                    if _merge_list(current, old, value):
+                        continue
+                if current != old:
+                    change.conflicts += 1  # changed since ``before``; the tool's value wins
+                setattr(context, name, value)
+            if change.fields:
+                change.version = self._changed(context, change.fields)
+            context_metrics.incr("rebases")
+            context_metrics.incr("merge_conflicts", change.conflicts)
+            return change
+
+    def restore(self, context: Any, snapshot: Any) -> int:
+        """Put ``context`` back to ``snapshot`` (a copy from ``read``), undoing a turn that is replayed"""
+        with self.lock(context):
+            current, saved = vars(context), vars(snapshot)
+            fields = {name for name in current.keys() | saved.keys()
+                      if current.get(name, _MISSING) != saved.get(name, _MISSING)}
+            for name in fields:
+                if name in saved:
+                    setattr(context, name, copy.deepcopy(saved[name]))
+                else:
+                    delattr(context, name)  # created during the turn (``_quiz_results``)
+            if not fields:
+                return context._version
+            context_metrics.incr("updates")
+            return self._changed(context, fields)
+
+    @staticmethod
+    def _changed(context: Any, fields: Any) -> int:
+        context._version += 1
+        context._dirty.update(fields)
+        return context._version
+
+    def dirty(self, context: Any) -> Set[str]:
+        """Fields changed since they were last taken by ``take_dirty``"""
+        with self.lock(context):
+            return set(context._dirty)
+
+    def take_dirty(self, context: Any) -> Tuple[Set[str], int]:
+        """Dirty fields and the version they are current at, marking them clean (for persistence)"""
+        with self.lock(context):
+            fields, context._dirty = context._dirty, set()
+            return fields, context._version
+
+    def mark_dirty(self, context: Any, fields: Set[str]) -> None:
+        """Mark ``fields`` dirty again, e.g. after persisting them failed"""
+        with self.lock(context):
+            context._dirty.update(fields)
+
+
+context_access = ContextAccess()
+
+
+# STRESS TEST
+
+def stress(sessions: int, calls: int, threads: int, io: float) -> None:
+    """Concurrent tool calls, Streamlit-like threads and async read-modify-writes on shared contexts"""
+    import asyncio
+    import json
+    import os
+    import random
+    import time
+
+    os.environ.setdefault("GEMINI_API_KEY", "stress")
+    from agents.tool_context import ToolContext
+
+    import main
+    from parallel_tools import _slow_tools
+
+    # The tools update through the imported module's access layer, not __main__'s
+    from context_access import VersionConflict, context_access, context_metrics
+
+    _slow_tools(io)
+    tool = main.get_tool("evaluate_quiz_response")
+    contexts = [main.StudentLearningContext(session_id=f"stress-{number}") for number in range(sessions)]
+    thread_updates = 200
+    retries = {"cas": 0}
+    thread_retries = [0] * threads
+
+    def frontend_thread(seed: int) -> None:
+        # Increments quiz_total with compare-and-set, like a page resetting or editing the context
+        rng = random.Random(seed)
+        for _ in range(thread_updates):
+            time.sleep(rng.uniform(0, io))  # spread over the run of the tool calls
+            context = rng.choice(contexts)
+            while True:
+                snapshot, version = context_access.read(context)
+                try:
+                    context_access.update(context, {"quiz_total": (snapshot.quiz_total or 0) + 1}, version)
+                    break
+                except VersionConflict:
+                    thread_retries[seed] += 1
+
+    async def grade(context, number: int) -> None:
+        arguments = json.dumps({"question_number": number, "student_answer": "A", "correct_answer": "A"})
+        await tool.on_invoke_tool(ToolContext(
+            context=context, tool_name=tool.name, tool_call_id=f"call_{number}", tool_arguments=arguments), arguments)
+
+    async def naive_increment(counter: Dict[str, int]) -> None:
+        value = counter["score"]
+        await asyncio.sleep(random.uniform(0, io))
+        counter["score"] = value + 1
+
+    async def versioned_increment(context) -> None:
+        while True:
+            snapshot, version = context_access.read(context)
+            await asyncio.sleep(random.uniform(0, io))
+            try:
+                context_access.update(context, {"quiz_score": (snapshot.quiz_score or 0) + 1}, version)
+                return
+            except VersionConflict:
+                retries["cas"] += 1
+
+    async def run() -> Dict[str, int]:
+        naive = [{"score": 0} for _ in contexts]
+        await asyncio.gather(*(
+            job
+            for context, counter in zip(contexts, naive)
+            for number in range(1, calls + 1)
+            for job in (grade(context, number), naive_increment(counter), versioned_increment(context))))
+        return {"lost": sum(calls - counter["score"] for counter in naive)}
+
+    workers = [threading.Thread(target=frontend_thread, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    naive = asyncio.run(run())
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - started
+
+    problems = []
+    for context in contexts:
+        graded = [row["question"] for row in context._quiz_results]
+        if graded != list(range(1, calls + 1)):
+            problems.append(f"{context.session_id}: quiz results {graded}")
+        if context.quiz_score != calls:
+            problems.append(f"{context.session_id}: quiz_score {context.quiz_score} != {calls}")
+        if context_access.dirty(context) - {"_quiz_results", "quiz_score", "quiz_total"}:
+            problems.append(f"{context.session_id}: dirty {sorted(context_access.dirty(context))}")
+    total = sum(context.quiz_total or 0 for context in contexts)
+    if total != threads * thread_updates:
+        problems.append(f"quiz_total sums to {total}, expected {threads * thread_updates}")
+    versions = sum(context_access.version(context) for context in contexts)
+    expected_versions = sessions * calls * 2 + threads * thread_updates
+    if versions != expected_versions:
+        problems.append(f"{versions} versions for {expected_versions} updates")
+
+    stats = context_metrics.snapshot()
+    print(f"🧵 {sessions} sessions x {calls} concurrent tool calls + {calls} async increments, "
+          f"{threads} threads x {thread_updates} updates in {seconds:.2f}s")
+    print(f"   {stats['updates']} updates, {stats['rebases']} rebases, "
+          f"{stats['version_conflicts']} compare-and-set retries "
+          f"({retries['cas']} async, {sum(thread_retries)} threads)")
+    print(f"   unversioned async read-modify-write lost {naive['lost']}/{sessions * calls} increments")
+    for problem in problems[:10]:
+        print(f"❌ {problem}")
+    if not problems:
+        print("✅ Quiz results in call order, no lost updates, versions and dirty fields consistent")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Versioned access to StudentLearningContext")
+    sub = parser.add_subparsers(dest="command", required=True)
+    stress_test = sub.add_parser("stress", help="Concurrent tool calls and updates on shared contexts")
+    stress_test.add_argument("--sessions", type=int, default=50)
+    stress_test.add_argument("--calls", type=int, default=20, help="Concurrent tool calls per session")
+    stress_test.add_argument("--threads", type=int, default=4, help="Threads updating contexts meanwhile")
+    stress_test.add_argument("--io", type=float, default=0.01, help="Simulated I/O time per tool call")
+    args = parser.parse_args()
+    stress(args.sessions, args.calls, args.threads, args.io)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Local fast path for tool-only turns.
+
+Some student messages map to exactly one tool call whose arguments can be
+read off the message: "set my topic to fractions in Math", "Answer 2: B" on
+a quiz whose answer key is known (question bank questions, which
+``generate_quiz`` in main.py uses when the fast path is on) or "what is my
+score?". Looser phrasings of a topic ("teach me about photosynthesis") only
+match a topic of the question bank or a subject of the student, so "teach me
+something new" still goes to the model. The model handles them
+with one round trip to pick the tool and another to phrase the reply. With
+``YOURTEACHER_FAST_PATH=1`` they are recognized locally and the tool runs
+directly on the StudentLearningContext. Then either
+
+* the reply is templated (quiz answers: feedback plus the next question) and
+  the turn makes no model call at all, or
+* the tool call and its output are added to the conversation and the model
+  is called once, only to phrase the reply (a new topic, the final score).
+
+Messages that no rule matches with high confidence, or whose tool the current
+agent does not have, go to the model as before.
+
+Usage:
+    python fast_path.py bench --latency 0.3
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+# Rules only match short messages; anything longer is left to the model
+MAX_WORDS = 12
+
+_TOPIC = re.compile(
+    r"^(?:please\s+)?(?:(?P<explicit>(?:set|change|switch)\s+(?:my\s+|the\s+)?topic\s+to)"
+    r"|(?:i\s+want\s+to|i'd\s+like\s+to|let's|let\s+me)\s+learn(?:\s+about)?"
+    r"|teach\s+me(?:\s+about)?)"
+    r"\s+(?P<topic>[a-z0-9][a-z0-9' -]{0,40}?)(?:\s+in\s+(?P<subject>[a-z][a-z ]{0,20}?))?\s*[.!]?$",
+    re.IGNORECASE)
+# Words that refer to something else than a topic ("teach me about that")
+_NOT_TOPIC = frozenset(
+    "it that this these those them something anything everything nothing more else new different "
+    "another other same stuff things one again topic subject lesson".split())
+_NUMBERED_ANSWER = re.compile(
+    r"^(?:answer|question|q)?\s*(?P<number>\d{1,2})\s*[:.)-]\s*\(?(?P<choice>[a-h])\)?\s*[.!]?$", re.IGNORECASE)
+_ANSWER = re.compile(
+    r"^(?:(?:my\s+)?answer(?:\s+is)?\s*:?\s*)?\(?(?P<choice>[a-h])\)?\s*[.!]?$", re.IGNORECASE)
+_SCORE = re.compile(
+    r"\b(?:what(?:'s|\s+is)\s+my\s+(?:final\s+)?score|(?:show|tell|give)\s+me\s+my\s+(?:final\s+)?score"
+    r"|calculate\s+my\s+(?:final\s+)?score|how\s+did\s+i\s+do)\b", re.IGNORECASE)
+
+
+def fast_path_enabled() -> bool:
+    return os.getenv("YOURTEACHER_FAST_PATH", "").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class FastPath:
+    """A tool call recognized in a student message"""
+    intent: str
+    tool: str
+    arguments: Dict[str, Any]
+    # Reply from the tool output; None to let the model phrase it
+    template: Callable[[Any, str], str] | None = None
+
+    @property
+    def round_trips_saved(self) -> int:
+        # Picking the tool, plus phrasing the reply when it is templated
+        return 1 if self.template is None else 2
+
+
+# RULES
+
+def _subject(explicit: str | None, context) -> str | None:
+    if explicit:
+        return explicit.strip().title()
+    if context.current_subject:
+        return context.current_subject
+    if len(context.subjects_of_interest) == 1:
+        return context.subjects_of_interest[0]
+    return None
+
+
+def _known_topic(topic: str, context) -> bool:
+    from adaptive_quiz import get_question_bank
+
+    subjects = {subject.lower() for subject in context.subjects_of_interest}
+    return topic in get_question_bank().pools or topic in subjects
+
+
+def _topic(text: str, context) -> FastPath | None:
+    match = _TOPIC.match(text)
+    if match is None:
+        return None
+    subject = _subject(match["subject"], context)
+    if subject is None:
+        return None
+    topic = match["topic"].strip().lower()
+    if _NOT_TOPIC & set(re.findall(r"[a-z']+", topic)):
+        return None
+    if not match["explicit"] and not _known_topic(topic, context):
+        return None
+    return FastPath("topic", "set_learning_topic", {
+        "subject": subject, "topic": topic, "objectives": f"understand {topic}, apply {topic}"})
+
+
+def _next_question(context) -> Dict[str, Any] | None:
+    return next((q for q in getattr(context, "_quiz_questions", []) if not q["answered"]), None)
+
+
+def _answer_reply(question: Dict[str, Any]) -> Callable[[Any, str], str]:
+    def reply(context, output: str) -> str:
+        letter = question["answer"]
+        if output.endswith("Correct"):
+            text = "✅ Correct!"
+        else:
+            text = f"❌ Not quite: the answer is {letter}) {question['options']['ABCDEFGH'.index(letter)]}."
+        if question["explanation"]:
+            text += f" {question['explanation']}"
+        following = _next_question(context)
+        if following is None:
+            return text + "\n\nThat was the last question. Ask for your score whenever you're ready!"
+        from main import format_question
+
+        return text + f"\n\nQuestion {format_question(following)}"
+    return reply
+
+
+def _quiz_answer(text: str, context) -> FastPath | None:
+    questions = getattr(context, "_quiz_questions", None)
+    if not questions:
+        return None
+    if match := _NUMBERED_ANSWER.match(text):
+        number = int(match["number"])
+        question = next((q for q in questions if q["question"] == number), None)
+    elif match := _ANSWER.match(text):
+        question = _next_question(context)
+    else:
+        return None
+    choice = match["choice"].upper()
+    if question is None or "ABCDEFGH".index(choice) >= len(question["options"]):
+        return None
+    return FastPath("quiz_answer", "evaluate_quiz_response", {
+        "question_number": question["question"], "student_answer": choice,
+        "correct_answer": question["answer"]}, template=_answer_reply(question))
+
+
+def _score(text: str, context) -> FastPath | None:
+    if not getattr(context, "_quiz_results", None) or not _SCORE.search(text):
+        return None
+    return FastPath("score", "calculate_quiz_score", {})
+
+
+RULES: List[Callable[[str, Any], FastPath | None]] = [_quiz_answer, _score, _topic]
+
+
+def match_fast_path(text: str, context, agent) -> FastPath | None:
+    """The tool call ``text`` stands for, if a rule recognizes it and ``agent`` has the tool"""
+    text = text.strip()
+    if not text or len(text.split()) > MAX_WORDS:
+        return None
+    offered = {getattr(tool, "name", None) for tool in getattr(agent, "tools", [])}
+    for rule in RULES:
+        fast = rule(text, context)
+        if fast is not None:
+            return fast if fast.tool in offered else None
+    return None
+
+
+# METRICS
+
+class FastPathMetrics:
+    """Turns served by the fast path and the model round trips they saved"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"turns": 0, "round_trips_saved": 0, "tool_errors": 0}
+        self.intents: Dict[str, int] = {}
+
+    def record(self, fast: FastPath) -> None:
+        with self._lock:
+            self.counters["turns"] += 1
+            self.counters["round_trips_saved"] += fast.round_trips_saved
+            self.intents[fast.intent] = self.intents.get(fast.intent, 0) + 1
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, **{f"intent_{name}": count for name, count in self.intents.items()}}
+
+
+fast_path_metrics = FastPathMetrics()
+
+
+# BENCHMARK
+
+QUIZ_SCRIPT = [
+    ("screener", "My name is Ava, I'm 12 and in Grade 7. I learn best visual, at a fast pace, and I like biology."),
+    ("learning", "I want to learn about photosynthesis in Biology."),
+    ("quiz", "Quiz me on photosynthesis with 5 questions."),
+    ("quiz", "Answer 1: B"),
+    ("quiz", "Answer 2: A"),
+    ("quiz", "Answer 3: C"),
+    ("quiz", "Answer 4: A"),
+    ("quiz", "Answer 5: B"),
+    ("quiz", "I'm done, what is my score?"),
+]
+
+
+def benchmark(latency: float) -> None:
+    """Model calls and turn latency of a scripted quiz session with and without the fast path"""
+    import asyncio
+    import json
+    import time
+
+    from load_generator import tutor_responder
+    from stub_model_server import StubModelServer
+
+    # The runtime records into the imported module's metrics, not __main__'s
+    from fast_path import fast_path_metrics
+
+    async def session_run(server, label: str):
+        from session_runtime import CHANNEL_AGENTS, SessionRuntime
+
+        runtime = SessionRuntime()
+        runtime.configure_hibernation(None)
+        session = runtime.session(f"fast-path-{label}")
+        requests, channel, seconds = server.requests, None, []
+        for turn_channel, message in QUIZ_SCRIPT:
+            agent_key = CHANNEL_AGENTS[turn_channel] if turn_channel != channel else None
+            channel = turn_channel
+            started = time.perf_counter()
+            async for _ in session.stream_turn(message, agent_key, channel):
+                pass
+            seconds.append(time.perf_counter() - started)
+        return server.requests - requests, seconds
+
+    async def run():
+        async with StubModelServer(latency=latency, responder=tutor_responder) as server:
+            os.environ["YOURTEACHER_MODEL_ENDPOINTS"] = json.dumps([{"name": "stub", "base_url": server.base_url}])
+            os.environ.setdefault("GEMINI_API_KEY", "bench")
+            results = {}
+            for label, enabled in (("model", ""), ("fast path", "1")):
+                os.environ["YOURTEACHER_FAST_PATH"] = enabled
+                results[label] = await session_run(server, label.replace(" ", "-"))
+            return results
+
+    results = asyncio.run(run())
+    for label, (calls, seconds) in results.items():
+        print(f"{label:>9}: {calls:2d} model calls for {len(seconds)} turns, "
+              f"{sum(seconds):.2f}s total (quiz answers {sum(seconds[3:8]) / 5 * 1000:.0f} ms each)")
+    stats = fast_path_metrics.snapshot()
+    print(f"⚡ fast path: {stats['turns']} turns, {stats['round_trips_saved']} round trips saved "
+          f"({results['model'][0] - results['fast path'][0]} fewer model calls measured)")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local fast path for tool-only turns")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Model calls of a scripted quiz session with and without the fast path")
+    bench.add_argument("--latency", type=float, default=0.3, help="Stub model latency per call")
+    args = parser.parse_args()
+    benchmark(args.latency)
+
+
+if __name__ == "__main__":
+    main()
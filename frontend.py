@@ -3,11 +3,24 @@ AI Learning Companion - Multi-Agent Tutor MVP
 A modern Streamlit application for personalized learning
 """
 
+import os
+import re
 import streamlit as st
-import time
+import uuid
 from datetime import datetime
 import random
 
+from adaptive_quiz import AdaptiveQuiz, get_question_bank
+from cohort_analytics import get_attempt_log
+from context_access import context_access
+from material_ingest import ingest_upload
+from memory_profile import get_memory_profiler, runtime_footprint
+from session_hibernation import valid_session_id
+from session_runtime import CHANNEL_AGENTS, ERROR, HANDOFF, MESSAGE, RETRY, TEXT, TOOL_CALL, runtime
+from study_materials import MaterialsError, open_index
+from supervisor import SESSION_COOKIE
+from warm_pool import OPENING_MESSAGE
+
 # Page configuration
 st.set_page_config(
     page_title="AI Learning Companion",
@@ -149,23 +162,109 @@ def load_css():
 # Initialize session state
 
 
+def browser_tab_session_id():
+    """Session id of this browser tab
+
+    Behind supervisor.py the proxy's (signed) cookie names the browser and the
+    ``tab`` query parameter the tab, so a tab keeps its session across reloads
+    and moves between workers, and tabs of one browser keep separate sessions.
+    """
+    browser = st.context.cookies.get(SESSION_COOKIE)
+    if not os.getenv("YOURTEACHER_WORKER") or not valid_session_id(browser):
+        return uuid.uuid4().hex[:16]
+    tab = st.query_params.get("tab")
+    if not tab or not re.fullmatch(r"[0-9a-f]{8}", tab):
+        tab = st.query_params["tab"] = uuid.uuid4().hex[:8]
+    return f"{browser}_{tab}"
+
+
 def init_session_state():
     if 'page' not in st.session_state:
         st.session_state.page = 'hero'
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = browser_tab_session_id()
+    if 'active_channel' not in st.session_state:
+        st.session_state.active_channel = None
     if 'student_profile' not in st.session_state:
         st.session_state.student_profile = {}
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
     if 'quiz_score' not in st.session_state:
         st.session_state.quiz_score = 0
     if 'learning_topic' not in st.session_state:
         st.session_state.learning_topic = ""
-    if 'screener_step' not in st.session_state:
-        st.session_state.screener_step = 0
-    if 'quiz_questions' not in st.session_state:
-        st.session_state.quiz_questions = []
-    if 'quiz_answers' not in st.session_state:
-        st.session_state.quiz_answers = {}
+    if 'adaptive_quiz' not in st.session_state:
+        st.session_state.adaptive_quiz = None
+    if 'pending_prompt' not in st.session_state:
+        st.session_state.pending_prompt = None
+    if 'indexed_uploads' not in st.session_state:
+        st.session_state.indexed_uploads = set()
+
+# Agent runtime helpers
+
+def tutor_session():
+    return runtime.session(st.session_state.session_id)
+
+
+def sync_profile():
+    """Mirror the agents' view of the student into the page profile"""
+    context = tutor_session().context
+    profile = {}
+    if context.grade_level:
+        profile['grade'] = context.grade_level
+    if context.subjects_of_interest or context.current_subject:
+        profile['interest'] = ", ".join(context.subjects_of_interest) or context.current_subject
+    if context.learning_pace:
+        profile['pace'] = context.learning_pace
+    st.session_state.student_profile = profile
+    if context.quiz_score is not None and context.quiz_total:
+        st.session_state.quiz_score = context.quiz_score / context.quiz_total * 100
+
+
+def render_messages(channel):
+    for msg in tutor_session().messages(channel):
+        if msg["role"] == "event":
+            st.caption(msg["content"])
+        else:
+            with st.chat_message(msg["role"]):
+                st.write(msg["content"])
+
+
+def stream_reply(user_input, channel):
+    """Run one agent turn for this page, streaming the reply as it arrives"""
+    # Switch to the page's agent on the first turn after arriving on a page;
+    # afterwards follow the agents' own handoffs.
+    agent_key = CHANNEL_AGENTS[channel] if st.session_state.active_channel != channel else None
+    st.session_state.active_channel = channel
+
+    if user_input:
+        with st.chat_message("user"):
+            st.write(user_input)
+
+    ok = True
+    with st.chat_message("assistant"):
+        status = st.empty()
+        body = st.empty()
+        text = ""
+        for event in runtime.stream(st.session_state.session_id, user_input, agent_key, channel):
+            if event.kind == TEXT:
+                text += event.text
+                body.markdown(text + "▌")
+            elif event.kind == MESSAGE:
+                body.markdown(event.text)
+                body = st.empty()
+                text = ""
+            elif event.kind == TOOL_CALL:
+                status.caption(f"🔧 {event.agent}: using {event.text}...")
+            elif event.kind == HANDOFF:
+                status.caption(f"🔄 {event.text}")
+            elif event.kind == RETRY:
+                body.empty()
+                text = ""
+                status.caption(f"↩️ {event.text}, continuing with {event.agent}...")
+            elif event.kind == ERROR:
+                status.error(f"❌ An error occurred: {event.text}")
+                ok = False
+    sync_profile()
+    return ok
 
 # Hero Page
 
@@ -230,61 +329,19 @@ def screener_page():
     st.markdown('<p style="color: #a0a0c0;">Help us personalize your learning experience</p>',
                 unsafe_allow_html=True)
 
+    session = tutor_session()
+
     # Chat interface for screener
     chat_container = st.container()
 
     with chat_container:
-        # Display chat history
-        for msg in st.session_state.chat_history:
-            with st.chat_message(msg["role"]):
-                st.write(msg["content"])
+        render_messages("screener")
 
-        # Screener questions
-        questions = [
-            "What grade are you in? (e.g., Grade 10, University Year 2)",
-            "What's your field of interest? (e.g., Science, Mathematics, Literature)",
-            "How would you describe your learning pace? (Slow, Moderate, Fast)"
-        ]
-
-        if st.session_state.screener_step == 0:
-            with st.chat_message("assistant"):
-                st.write(
-                    "Hello! I'm your AI Learning Companion. Let's start by getting to know you better.")
-                st.write(questions[0])
-
-            user_input = st.chat_input("Your answer...")
-            if user_input:
-                st.session_state.chat_history.append(
-                    {"role": "user", "content": user_input})
-                st.session_state.student_profile['grade'] = user_input
-                st.session_state.screener_step = 1
-                st.rerun()
-
-        elif st.session_state.screener_step == 1:
-            with st.chat_message("assistant"):
-                st.write(questions[1])
-
-            user_input = st.chat_input("Your answer...")
-            if user_input:
-                st.session_state.chat_history.append(
-                    {"role": "user", "content": user_input})
-                st.session_state.student_profile['interest'] = user_input
-                st.session_state.screener_step = 2
+        if not session.messages("screener"):
+            if stream_reply(OPENING_MESSAGE, "screener"):
                 st.rerun()
 
-        elif st.session_state.screener_step == 2:
-            with st.chat_message("assistant"):
-                st.write(questions[2])
-
-            user_input = st.chat_input("Your answer...")
-            if user_input:
-                st.session_state.chat_history.append(
-                    {"role": "user", "content": user_input})
-                st.session_state.student_profile['pace'] = user_input
-                st.session_state.screener_step = 3
-                st.rerun()
-
-        elif st.session_state.screener_step == 3:
+        if session.context.screening_complete:
             with st.chat_message("assistant"):
                 st.write(f"Perfect! I've created your personalized profile:")
                 st.write(
@@ -297,7 +354,11 @@ def screener_page():
 
             if st.button("Continue to Learning", use_container_width=True):
                 st.session_state.page = 'learning'
-                st.session_state.chat_history = []
+                st.rerun()
+
+        user_input = st.chat_input("Your answer...")
+        if user_input:
+            if stream_reply(user_input, "screener"):
                 st.rerun()
 
 # Learning Page
@@ -346,6 +407,7 @@ def learning_page():
         if st.button("Start Learning", use_container_width=True):
             if learning_topic:
                 st.session_state.learning_topic = learning_topic
+                st.session_state.pending_prompt = f"I'd like to learn about {learning_topic}."
 
     # File upload section
     st.markdown("### 📁 Upload Study Materials")
@@ -356,7 +418,32 @@ def learning_page():
     )
 
     if uploaded_file is not None:
-        st.success(f"✅ File '{uploaded_file.name}' uploaded successfully!")
+        # Streamlit reruns the page on every interaction; index each upload once
+        if uploaded_file.file_id not in st.session_state.indexed_uploads:
+            progress_bar = st.progress(0.0, text=f"Indexing '{uploaded_file.name}'...")
+
+            def show_progress(state):
+                total = f" of {state.total_pages}" if state.total_pages else ""
+                progress_bar.progress(
+                    state.fraction if state.fraction is not None else min(state.pages / 500, 0.99),
+                    text=f"Indexing '{state.source}': page {state.pages}{total}, {state.chunks} passages")
+
+            try:
+                result = ingest_upload(
+                    open_index(tutor_session().context.materials_dir), uploaded_file.name, uploaded_file,
+                    progress=show_progress)
+                st.session_state.indexed_uploads.add(uploaded_file.file_id)
+                progress_bar.empty()
+                if result.skipped:
+                    st.success(f"✅ File '{uploaded_file.name}' is already in your study materials")
+                else:
+                    st.success(f"✅ File '{uploaded_file.name}' indexed ({result.chunks} passages, "
+                               f"{result.pages} pages in {result.seconds:.1f}s)")
+            except MaterialsError as e:
+                progress_bar.empty()
+                st.error(f"❌ {e}")
+        else:
+            st.success(f"✅ File '{uploaded_file.name}' uploaded successfully!")
 
     # Learning format options
     st.markdown("### 🎨 Choose Learning Format")
@@ -380,36 +467,15 @@ def learning_page():
 
     chat_container = st.container(height=400)
     with chat_container:
-        if st.session_state.learning_topic:
-            with st.chat_message("assistant"):
-                st.write(
-                    f"Great! Let's learn about **{st.session_state.learning_topic}**.")
-                st.write("Here's a comprehensive overview:")
-                st.write(f"""
-                Based on your profile ({st.session_state.student_profile.get('grade', 'N/A')} level, 
-                {st.session_state.student_profile.get('pace', 'moderate')} pace), 
-                I'll explain {st.session_state.learning_topic} in a way that's perfect for you.
-                
-                **Key Concepts:**
-                1. Introduction and basic principles
-                2. Core mechanisms and processes
-                3. Real-world applications
-                4. Common misconceptions
-                
-                Feel free to ask any questions!
-                """)
+        render_messages("learning")
 
     user_question = st.chat_input("Ask a question about the topic...")
-    if user_question:
+    prompt = st.session_state.pending_prompt or user_question
+    st.session_state.pending_prompt = None
+    if prompt:
         with chat_container:
-            with st.chat_message("user"):
-                st.write(user_question)
-            with st.chat_message("assistant"):
-                st.write("That's a great question! Let me explain...")
-                with st.spinner("Thinking..."):
-                    time.sleep(1)
-                st.write(
-                    f"Here's a detailed explanation about your question regarding {st.session_state.learning_topic}...")
+            if stream_reply(prompt, "learning"):
+                st.rerun()
 
     # Navigation to quiz
     st.markdown("<br>", unsafe_allow_html=True)
@@ -429,114 +495,137 @@ def quiz_page():
         st.markdown(
             f'<p style="color: #a0a0c0;">Testing your understanding of: <b>{st.session_state.learning_topic}</b></p>', unsafe_allow_html=True)
 
-    # Sample quiz questions
-    if not st.session_state.quiz_questions:
-        st.session_state.quiz_questions = [
-            {
-                "question": f"Which of the following best describes {st.session_state.learning_topic or 'this concept'}?",
-                "type": "mcq",
-                "options": ["Option A: Basic definition", "Option B: Advanced definition", "Option C: Related concept", "Option D: Incorrect definition"],
-                "correct": 0
-            },
-            {
-                "question": f"True or False: {st.session_state.learning_topic or 'This concept'} is important in modern applications.",
-                "type": "tf",
-                "correct": True
-            },
-            {
-                "question": f"Explain in your own words what {st.session_state.learning_topic or 'this concept'} means.",
-                "type": "short",
-                "sample": "A comprehensive explanation would include key points and examples."
-            }
-        ]
-
-    # Quiz form
-    with st.form("quiz_form"):
-        for i, q in enumerate(st.session_state.quiz_questions):
-            st.markdown(f"### Question {i+1}")
-            st.write(q["question"])
-
-            if q["type"] == "mcq":
-                answer = st.radio(f"q{i}", q["options"], key=f"mcq_{i}")
-                st.session_state.quiz_answers[i] = answer
-
-            elif q["type"] == "tf":
-                answer = st.radio(f"q{i}", ["True", "False"], key=f"tf_{i}")
-                st.session_state.quiz_answers[i] = answer
-
-            elif q["type"] == "short":
-                answer = st.text_area(f"Your answer:", key=f"short_{i}")
-                st.session_state.quiz_answers[i] = answer
+    session = tutor_session()
+    context = session.context
+    topic = st.session_state.learning_topic or context.current_topic or "what I just learned"
+
+    # Topics in the question bank get an adaptive quiz; others are quizzed by the quiz agent
+    pool = get_question_bank().find(topic)
+    if pool is not None:
+        adaptive_quiz_section(pool)
+    else:
+        agent_quiz_section(topic)
+
+    if context.quiz_score is not None and context.quiz_total:
+        # Adaptive quizzes are scored by the ability estimate, not by the share of correct answers
+        adaptive = pool is not None and context.quiz_proficiency is not None
+        score_percentage = context.quiz_proficiency if adaptive else context.quiz_score / context.quiz_total * 100
+
+        # Display results
+        st.markdown("## Quiz Results")
+
+        if score_percentage >= 70:
+            st.success(f"🎉 Excellent! You scored {score_percentage:.0f}%")
+            st.balloons()
+        elif score_percentage >= 50:
+            st.warning(
+                f"📚 Good effort! You scored {score_percentage:.0f}%. Keep practicing!")
+        else:
+            st.error(
+                f"💪 You scored {score_percentage:.0f}%. Let's review the material again.")
+
+        # Progress bar
+        st.progress(score_percentage / 100)
+
+        quiz = st.session_state.adaptive_quiz
+        if pool is not None and quiz is not None:
+            # Feedback for each question
+            st.markdown("### Detailed Feedback")
+            for i, (item, choice, correct) in enumerate(quiz.responses):
+                with st.expander(f"Question {i+1} {'✅' if correct else '❌'}"):
+                    st.write(item.question)
+                    st.write(f"**Your answer:** {item.options[choice]}")
+                    st.write(f"**Correct answer:** {item.options[item.answer]}")
+                    if item.explanation:
+                        st.write(item.explanation)
+
+        # Retry option for low scores
+        if score_percentage < 70:
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("📖 Review Material", use_container_width=True):
+                    st.session_state.page = 'learning'
+                    st.session_state.pending_prompt = f"Can we review {topic} again?"
+                    if pool is not None and quiz is not None:
+                        missed = [item.question for item, _, correct in quiz.responses if not correct]
+                        st.session_state.pending_prompt += (
+                            f" I scored {score_percentage:.0f}% on the quiz and missed: " + " | ".join(missed))
+                    st.rerun()
+            with col2:
+                if st.button("🔄 Retake Quiz", use_container_width=True):
+                    context_access.update(context, {"quiz_score": None, "quiz_total": None, "quiz_proficiency": None})
+                    st.session_state.adaptive_quiz = None
+                    if pool is None:
+                        st.session_state.pending_prompt = f"I'd like to retake the quiz on {topic}."
+                    st.rerun()
+
+
+def adaptive_quiz_section(pool):
+    """One question at a time, chosen for the student's current ability estimate"""
+    quiz = st.session_state.adaptive_quiz
+    if quiz is None or quiz.pool is not pool:
+        quiz = st.session_state.adaptive_quiz = AdaptiveQuiz(pool)
+
+    if quiz.responses and not quiz.done:
+        item, _, correct = quiz.responses[-1]
+        if correct:
+            st.success("✅ Correct!")
+        else:
+            st.error(f"❌ The answer was: {item.options[item.answer]}. {item.explanation}")
+
+    item = quiz.next_item()
+    if item is None:
+        return
+
+    st.caption(f"Adaptive quiz · ability estimate {quiz.theta:+.2f} ± {quiz.se:.2f}")
+    with st.form(f"quiz_{item.id}"):
+        st.markdown(f"### Question {quiz.asked + 1}")
+        st.write(item.question)
+        choice = st.radio("Your answer:", item.options, index=None, key=f"answer_{item.id}")
+        if st.form_submit_button("Submit Answer", use_container_width=True):
+            if choice is None:
+                st.warning("Please choose an answer first.")
+            else:
+                quiz.answer(item, item.options.index(choice))
+                if quiz.done:
+                    context = tutor_session().context
+                    context_access.update(context, {
+                        "quiz_score": quiz.correct, "quiz_total": quiz.asked, "quiz_proficiency": quiz.proficiency})
+                    record_adaptive_quiz(context, quiz)
+                    sync_profile()
+                st.rerun()
 
-            st.markdown("---")
 
-        submitted = st.form_submit_button(
-            "Submit Quiz", use_container_width=True)
-
-        if submitted:
-            # Calculate score (simplified)
-            correct_answers = 0
-            total_questions = len(st.session_state.quiz_questions)
-
-            for i, q in enumerate(st.session_state.quiz_questions):
-                if q["type"] == "mcq":
-                    if st.session_state.quiz_answers.get(i) == q["options"][q["correct"]]:
-                        correct_answers += 1
-                elif q["type"] == "tf":
-                    user_answer = st.session_state.quiz_answers.get(
-                        i) == "True"
-                    if user_answer == q["correct"]:
-                        correct_answers += 1
-                elif q["type"] == "short":
-                    # Simplified: give credit if answer is not empty
-                    if st.session_state.quiz_answers.get(i, "").strip():
-                        correct_answers += 1
-
-            score_percentage = (correct_answers / total_questions) * 100
-            st.session_state.quiz_score = score_percentage
-
-            # Display results
-            st.markdown("## Quiz Results")
-
-            if score_percentage >= 70:
-                st.success(f"🎉 Excellent! You scored {score_percentage:.0f}%")
-                st.balloons()
-            elif score_percentage >= 50:
-                st.warning(
-                    f"📚 Good effort! You scored {score_percentage:.0f}%. Keep practicing!")
-            else:
-                st.error(
-                    f"💪 You scored {score_percentage:.0f}%. Let's review the material again.")
+def record_adaptive_quiz(context, quiz):
+    """Persist a finished adaptive quiz for cohort analytics"""
+    try:
+        get_attempt_log().record_quiz(
+            st.session_state.session_id, context, quiz.pool.topic,
+            score=quiz.proficiency, total=100,
+            responses=[(item.id, correct) for item, _, correct in quiz.responses],
+            source="adaptive",
+        )
+    except OSError as e:
+        st.warning(f"Could not record quiz results: {e}")
 
-            # Progress bar
-            st.progress(score_percentage / 100)
 
-            # Feedback for each question
-            st.markdown("### Detailed Feedback")
-            for i, q in enumerate(st.session_state.quiz_questions):
-                with st.expander(f"Question {i+1}"):
-                    st.write(q["question"])
-                    if q["type"] == "short":
-                        st.write(
-                            f"**Your answer:** {st.session_state.quiz_answers.get(i, 'No answer')}")
-                        st.write(f"**Sample answer:** {q['sample']}")
-                    else:
-                        st.write(
-                            f"**Your answer:** {st.session_state.quiz_answers.get(i, 'No answer')}")
-
-            # Retry option for low scores
-            if score_percentage < 70:
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("📖 Review Material", use_container_width=True):
-                        st.session_state.page = 'learning'
-                        st.session_state.quiz_questions = []
-                        st.session_state.quiz_answers = {}
-                        st.rerun()
-                with col2:
-                    if st.button("🔄 Retake Quiz", use_container_width=True):
-                        st.session_state.quiz_answers = {}
-                        st.rerun()
+def agent_quiz_section(topic):
+    """Quiz conversation with the quiz agent"""
+    chat_container = st.container()
+    with chat_container:
+        render_messages("quiz")
+
+    if not tutor_session().messages("quiz"):
+        if st.button("📝 Start Quiz", use_container_width=True):
+            st.session_state.pending_prompt = f"I'm ready for a quiz on {topic}."
+
+    answer = st.chat_input("Your answer...")
+    prompt = st.session_state.pending_prompt or answer
+    st.session_state.pending_prompt = None
+    if prompt:
+        with chat_container:
+            if stream_reply(prompt, "quiz"):
+                st.rerun()
 
 # Sidebar navigation
 
@@ -582,6 +671,31 @@ def sidebar_navigation():
                         unsafe_allow_html=True)
             st.metric("Last Quiz Score", f"{st.session_state.quiz_score:.0f}%")
 
+        if get_memory_profiler():
+            memory_panel()
+
+
+def memory_panel():
+    """Per-session footprint and top allocators (YOURTEACHER_MEMORY_PROFILE=1)"""
+    profiler = get_memory_profiler()
+    st.markdown("---")
+    with st.expander("🧠 Memory"):
+        current, peak = profiler.traced()
+        st.caption(f"Traced: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB), {len(runtime)} sessions")
+        if runtime.store is not None:
+            stats = runtime.stats()
+            st.caption(f"💤 {stats['hibernated']} hibernated ({stats['hibernated_idle']} idle, "
+                       f"{stats['hibernated_budget']} over budget), {stats['restored']} restored "
+                       f"(p95 {stats['restore_p95_ms']:.1f} ms)")
+        st.dataframe(
+            [{key: value / 1024 if key not in ("session_id", "turns") else value for key, value in row.items()}
+             for row in runtime_footprint(runtime)],
+            column_config={"session_id": "session"}, hide_index=True)
+        if st.button("Top allocators", use_container_width=True):
+            st.dataframe(
+                [{"KB": row["size_diff"] / 1024, "site": row["site"]} for row in profiler.growth(limit=15)],
+                hide_index=True)
+
 # Main app
 
 
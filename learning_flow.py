@@ -0,0 +1,115 @@
+"""
+Learning flow state machine over StudentLearningContext.
+
+Derives the student's stage (screening, teaching, quiz ready, quiz in progress,
+quiz complete) from the context and decides locally which guarded handoffs are
+currently allowed. Handoffs whose guard would fail are hidden from the model
+before each call (via the handoff's ``is_enabled``), so the model never picks a
+transfer that the guard hooks would reject. If a rejection still happens (e.g.
+the context changed mid-turn) the caller can undo the turn's context changes
+and transcript rows and retry it once instead of surfacing a generic error.
+Counters track both cases, once per turn.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+SCREENING = "screening"
+TEACHING = "teaching"
+QUIZ_READY = "quiz_ready"
+QUIZ_IN_PROGRESS = "quiz_in_progress"
+QUIZ_COMPLETE = "quiz_complete"
+
+STAGES = (SCREENING, TEACHING, QUIZ_READY, QUIZ_IN_PROGRESS, QUIZ_COMPLETE)
+
+
+class HandoffRejected(ValueError):
+    """A guarded handoff was attempted before its precondition held"""
+
+    def __init__(self, guard: str, reason: str):
+        super().__init__(reason)
+        self.guard = guard
+        self.reason = reason
+
+
+def stage_of(context: Any) -> str:
+    """Current learning stage derived from the context fields"""
+    if not context.screening_complete:
+        return SCREENING
+    if not context.concept_taught:
+        return TEACHING
+    if context.quiz_score is not None:
+        return QUIZ_COMPLETE
+    if getattr(context, "_quiz_results", None):
+        return QUIZ_IN_PROGRESS
+    return QUIZ_READY
+
+
+# guard name -> (stages in which the handoff is allowed, rejection reason)
+GUARD_CONDITIONS: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "on_teaching_handoff": (
+        (TEACHING, QUIZ_READY, QUIZ_IN_PROGRESS, QUIZ_COMPLETE),
+        "Student screening must be completed before teaching",
+    ),
+    "on_quiz_handoff": (
+        (QUIZ_READY, QUIZ_IN_PROGRESS, QUIZ_COMPLETE),
+        "A concept must be taught before taking a quiz",
+    ),
+}
+
+
+class FlowMetrics:
+    """Counters for handoffs filtered, rejected and recovered"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "handoffs_offered": 0,    # turns in which a guarded handoff was offered
+            "handoffs_filtered": 0,   # turns in which one was hidden from the model: avoided failed turns
+            "handoffs_rejected": 0,   # guard raised after the model chose the handoff
+            "turns_recovered": 0,     # rejected turns retried automatically
+        }
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+    def format_summary(self) -> str:
+        return "  ".join(f"{name}={value}" for name, value in self.snapshot().items())
+
+
+flow_metrics = FlowMetrics()
+
+
+def is_handoff_allowed(guard: str, context: Any) -> bool:
+    stages, _ = GUARD_CONDITIONS[guard]
+    return stage_of(context) in stages
+
+
+def check_handoff(guard: str, context: Any) -> None:
+    """Raise HandoffRejected if ``guard``'s precondition does not hold"""
+    if not is_handoff_allowed(guard, context):
+        flow_metrics.incr("handoffs_rejected")
+        raise HandoffRejected(guard, GUARD_CONDITIONS[guard][1])
+
+
+def handoff_filter(guard: str) -> Callable[[Any, Any], bool]:
+    """``is_enabled`` callable for a handoff protected by ``guard``"""
+    def is_enabled(run_context: Any, agent: Any) -> bool:
+        allowed = is_handoff_allowed(guard, run_context.context)
+        # Evaluated before every model call; counted once per run (turn) and outcome
+        counted = run_context.__dict__.setdefault("_handoffs_counted", set())
+        if (guard, allowed) not in counted:
+            counted.add((guard, allowed))
+            flow_metrics.incr("handoffs_offered" if allowed else "handoffs_filtered")
+        return allowed
+    return is_enabled
+
+
+HANDOFF_FILTERS = {guard: handoff_filter(guard) for guard in GUARD_CONDITIONS}
@@ -0,0 +1,353 @@
+"""
+Load generator: synthetic students against the session runtime.
+
+Virtual students with sampled personas (age, grade, learning style and pace,
+answer accuracy, think-time distribution) go through the same screener →
+learning → quiz flow as the Streamlit frontend, driving
+``session_runtime`` sessions (and so the real agent graph, tools, guards and
+model routing) against a fake tutor model: a stub model server whose
+responder calls the agents' tools the way the real model would.
+
+Worker processes each run many students on one event loop; the fake model
+runs in its own process. Load is applied in stages of increasing concurrency
+(closed loop: a finished student is replaced by a new one) and each stage
+reports sustained sessions/s, turns/s and turn latency, plus the stage where
+throughput stops scaling (the saturation point).
+
+Usage:
+    python load_generator.py --stages 4 16 64 256 --duration 20 --workers 4
+    python load_generator.py --stages 32 --think-scale 1.0 --latency 0.3
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+LEARNING_STYLES = ("Visual", "Auditory", "Kinesthetic", "Mixed")
+PACES = ("Fast", "Medium", "Slow")
+TOPICS = (("Biology", "photosynthesis"), ("Math", "fractions"), ("Math", "quadratic equations"),
+          ("History", "world war ii"), ("Physics", "gravity"))
+NAMES = ("Ava", "Ben", "Chloe", "Dev", "Emma", "Finn", "Grace", "Hugo", "Isla", "Jay", "Kira", "Leo")
+
+# Median think time (seconds) before the next message, by learning pace
+THINK_MEDIAN = {"Fast": 3.0, "Medium": 6.0, "Slow": 12.0}
+THINK_SIGMA = 0.6
+
+SATURATION_GAIN = 1.1  # a stage must beat the previous throughput by 10% to count as scaling
+DEFAULT_SLO_MS = 2000.0  # p95 turn latency beyond which a stage counts as saturated
+
+
+@dataclass
+class Persona:
+    name: str
+    age: int
+    learning_style: str
+    learning_pace: str
+    accuracy: float         # probability of answering a quiz question correctly
+    subject: str
+    topic: str
+    follow_ups: int         # extra questions asked while learning
+    quiz_questions: int
+
+    @property
+    def grade_level(self) -> str:
+        return f"Grade {min(max(self.age - 5, 1), 12)}"
+
+    def think_time(self, rng: random.Random, scale: float) -> float:
+        return rng.lognormvariate(math.log(THINK_MEDIAN[self.learning_pace]), THINK_SIGMA) * scale
+
+
+def sample_persona(rng: random.Random) -> Persona:
+    subject, topic = rng.choice(TOPICS)
+    return Persona(
+        name=rng.choice(NAMES),
+        age=rng.randint(8, 17),
+        learning_style=rng.choice(LEARNING_STYLES),
+        learning_pace=rng.choices(PACES, weights=(0.25, 0.5, 0.25))[0],
+        accuracy=rng.betavariate(4, 2),
+        subject=subject,
+        topic=topic,
+        follow_ups=rng.randint(0, 3),
+        quiz_questions=rng.randint(3, 5),
+    )
+
+
+def student_script(persona: Persona, rng: random.Random) -> List[tuple]:
+    """(channel, message) turns of one student session"""
+    turns = [
+        ("screener", "Hello! I'm ready to start my personalized learning journey."),
+        ("screener", f"My name is {persona.name}, I'm {persona.age} and in {persona.grade_level}. "
+                     f"I learn best {persona.learning_style.lower()}, at a {persona.learning_pace.lower()} "
+                     f"pace, and I like {persona.subject.lower()}."),
+        ("screener", "Answer: if all bloops are razzies and all razzies are lazzies then all bloops "
+                     "are lazzies, because the relation carries over step by step."),
+        ("learning", f"I want to learn about {persona.topic} in {persona.subject}."),
+    ]
+    turns += [("learning", f"Can you explain another part of {persona.topic}?")] * persona.follow_ups
+    turns.append(("quiz", f"Quiz me on {persona.topic} with {persona.quiz_questions} questions."))
+    for number in range(1, persona.quiz_questions + 1):
+        answer = "A" if rng.random() < persona.accuracy else rng.choice("BCD")
+        turns.append(("quiz", f"Answer {number}: {answer}"))
+    turns.append(("quiz", "I'm done, what is my score?"))
+    return turns
+
+
+# FAKE TUTOR MODEL
+
+def _tool_plan(text: str, offered: set) -> List[Dict[str, Any]]:
+    """Tool calls the tutor makes for the student message ``text``"""
+    if match := re.search(r"My name is (\w+), I'm (\d+) and in (Grade \d+)\. I learn best (\w+), "
+                          r"at a (\w+) pace, and I like (\w+)", text):
+        name, age, grade, style, pace, subject = match.groups()
+        plan = [{"name": "save_student_profile", "arguments": {
+            "name": name, "age": int(age), "grade_level": grade, "learning_style": style.capitalize(),
+            "learning_pace": pace.capitalize(), "subjects_of_interest": subject}}]
+    elif text.startswith("Answer:"):
+        plan = [{"name": "cognitive_assessment_tool", "arguments": {
+            "assessment_type": "logical_reasoning", "student_response": text}}]
+    elif match := re.search(r"learn about (.+) in (\w+)\.", text):
+        topic, subject = match.groups()
+        plan = [
+            {"name": "set_learning_topic", "arguments": {
+                "subject": subject, "topic": topic, "objectives": f"understand {topic}, apply {topic}"}},
+            {"name": "generate_personalized_content", "arguments": {"content_type": "explanation"}},
+        ]
+    elif match := re.search(r"Quiz me on .+ with (\d+) questions", text):
+        plan = [{"name": "generate_quiz", "arguments": {
+            "difficulty_level": "medium", "question_count": int(match.group(1))}}]
+    elif match := re.match(r"Answer (\d+): (\w)", text):
+        plan = [{"name": "evaluate_quiz_response", "arguments": {
+            "question_number": int(match.group(1)), "student_answer": match.group(2), "correct_answer": "A"}}]
+    elif "what is my score" in text:
+        plan = [{"name": "calculate_quiz_score", "arguments": {}}]
+    else:
+        plan = []
+    return [call for call in plan if call["name"] in offered]
+
+
+_REPLY = ("Great work! Let's look at this step by step, with an example that fits how you like to learn. "
+          "Take a moment to think about how each idea connects to the next one before we continue.")
+
+
+def tutor_responder(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Stateless fake tutor: the next planned tool call for the turn, then a reply"""
+    messages = request.get("messages", [])
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    text = messages[last_user].get("content") if last_user >= 0 else ""
+    offered = {tool["function"]["name"] for tool in request.get("tools", [])}
+    plan = _tool_plan(text if isinstance(text, str) else "", offered)
+    step = sum(1 for m in messages[last_user + 1:] if m.get("role") == "assistant")
+    if step < len(plan):
+        return {"content": "", "tool_calls": [plan[step]]}
+    return {"content": _REPLY}
+
+
+def _serve_fake_model(port_queue, latency: float, token_delay: float) -> None:
+    from stub_model_server import StubModelServer
+
+    async def serve():
+        server = StubModelServer(latency=latency, token_delay=token_delay, responder=tutor_responder)
+        await server.start()
+        port_queue.put(server.port)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+# WORKERS
+
+def _init_worker(base_url: str, analytics_dir: str) -> None:
+    # Before the model router and endpoint pool are first built in this process
+    os.environ["YOURTEACHER_MODEL_ENDPOINTS"] = json.dumps([{"name": "fake", "base_url": base_url}])
+    os.environ["YOURTEACHER_HEDGE_DELAY"] = "60"
+    os.environ["YOURTEACHER_ANALYTICS_DIR"] = analytics_dir
+    os.environ.setdefault("GEMINI_API_KEY", "load-test")
+    os.environ.pop("YOURTEACHER_EXPORT_DIR", None)
+
+    # Import the SDK and build the agent graph before any stage is timed
+    from main import agent_registry, get_model_router
+
+    get_model_router()
+    agent_registry.entry()
+
+
+def _ping(seconds: float) -> int:
+    time.sleep(seconds)
+    return os.getpid()
+
+
+async def _run_student(number: int, seed: int, think_scale: float, deadline: float, stats: Dict[str, Any]) -> None:
+    from session_runtime import CHANNEL_AGENTS, runtime
+
+    rng = random.Random(seed * 1_000_003 + number)
+    persona = sample_persona(rng)
+    session = runtime.session(f"load-{os.getpid()}-{seed}-{number}")
+    channel = None
+    try:
+        for turn_channel, message in student_script(persona, rng):
+            if time.monotonic() >= deadline:
+                stats["abandoned"] += 1
+                return
+            agent_key = CHANNEL_AGENTS[turn_channel] if turn_channel != channel else None
+            channel = turn_channel
+            started = time.perf_counter()
+            async for _ in session.stream_turn(message, agent_key, channel):
+                pass
+            stats["turn_latency"].append(time.perf_counter() - started)
+            stats["turns"] += 1
+            await asyncio.sleep(persona.think_time(rng, think_scale))
+        stats["sessions"] += 1
+        if session.context.quiz_total:
+            stats["quiz_scores"].append(session.context.quiz_score / session.context.quiz_total)
+    except Exception as e:
+        stats["errors"] += 1
+        stats["last_error"] = f"{type(e).__name__}: {e}"
+    finally:
+        runtime.close_session(session.session_id)
+
+
+async def _run_stage(concurrency: int, duration: float, think_scale: float, seed: int) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"sessions": 0, "turns": 0, "errors": 0, "abandoned": 0,
+                             "turn_latency": [], "quiz_scores": [], "last_error": None}
+    deadline = time.monotonic() + duration
+    counter = iter(range(1_000_000_000))
+
+    async def virtual_student():
+        # Closed loop: as soon as one student finishes, the next one starts
+        while time.monotonic() < deadline:
+            await _run_student(next(counter), seed, think_scale, deadline, stats)
+
+    await asyncio.gather(*(virtual_student() for _ in range(concurrency)))
+    return stats
+
+
+def _stage_worker(concurrency: int, duration: float, think_scale: float, seed: int) -> Dict[str, Any]:
+    return asyncio.run(_run_stage(concurrency, duration, think_scale, seed))
+
+
+# DRIVER
+
+def _mean(values: List[float]) -> float:
+    return sum(values) / len(values) if values else float("nan")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_load(
+    stages: List[int],
+    duration: float,
+    workers: int,
+    think_scale: float,
+    latency: float,
+    token_delay: float,
+) -> List[Dict[str, Any]]:
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    model_process = context.Process(
+        target=_serve_fake_model, args=(port_queue, latency, token_delay), daemon=True)
+    model_process.start()
+    base_url = f"http://127.0.0.1:{port_queue.get(timeout=60)}/v1/"
+    analytics_dir = tempfile.mkdtemp(prefix="yourteacher-load-")
+    print(f"🧪 Fake tutor model at {base_url} (latency {latency}s, token delay {token_delay}s)")
+
+    results = []
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(base_url, analytics_dir)) as pool:
+            # Start every worker (each builds the agent graph in _init_worker)
+            list(pool.map(_ping, [0.5] * workers))
+
+            print(f"{'students':>9} {'sessions':>9} {'sess/s':>8} {'turns/s':>8} {'p50 ms':>8} "
+                  f"{'p95 ms':>8} {'p99 ms':>8} {'quiz %':>7} {'errors':>7}")
+            for stage, concurrency in enumerate(stages):
+                per_worker = [concurrency // workers + (i < concurrency % workers) for i in range(workers)]
+                futures = [pool.submit(_stage_worker, n, duration, think_scale, stage * 1000 + i)
+                           for i, n in enumerate(per_worker) if n]
+                parts = [future.result() for future in futures]
+                latencies = [value for part in parts for value in part["turn_latency"]]
+                result = {
+                    "students": concurrency,
+                    "sessions": sum(part["sessions"] for part in parts),
+                    "turns": sum(part["turns"] for part in parts),
+                    "errors": sum(part["errors"] for part in parts),
+                    "abandoned": sum(part["abandoned"] for part in parts),
+                    "p50_ms": _percentile(latencies, 50) * 1000,
+                    "p95_ms": _percentile(latencies, 95) * 1000,
+                    "p99_ms": _percentile(latencies, 99) * 1000,
+                    "quiz_percent": 100 * _mean([v for part in parts for v in part["quiz_scores"]]),
+                    "last_error": next((part["last_error"] for part in parts if part["last_error"]), None),
+                }
+                result["sessions_per_s"] = result["sessions"] / duration
+                result["turns_per_s"] = result["turns"] / duration
+                results.append(result)
+                print(f"{concurrency:>9} {result['sessions']:>9} {result['sessions_per_s']:>8.2f} "
+                      f"{result['turns_per_s']:>8.1f} {result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f} "
+                      f"{result['p99_ms']:>8.0f} {result['quiz_percent']:>7.0f} {result['errors']:>7}")
+                if result["last_error"]:
+                    print(f"   ⚠️ {result['last_error']}")
+    finally:
+        model_process.terminate()
+    return results
+
+
+def saturation_point(results: List[Dict[str, Any]], slo_ms: float = DEFAULT_SLO_MS) -> Dict[str, Any] | None:
+    """
+    Last healthy stage before throughput stops growing by SATURATION_GAIN or
+    p95 turn latency exceeds ``slo_ms`` (None if the load never saturated)
+    """
+    previous = None
+    for current in results:
+        scaling = previous is None or current["turns_per_s"] >= previous["turns_per_s"] * SATURATION_GAIN
+        if not scaling or current["p95_ms"] > slo_ms:
+            return previous or current
+        previous = current
+    return None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Synthetic student load against the session runtime")
+    parser.add_argument("--stages", type=int, nargs="+", default=[4, 16, 64, 256],
+                        help="Concurrent students per stage")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per stage")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Student processes")
+    parser.add_argument("--think-scale", type=float, default=0.05,
+                        help="Multiplier for student think times (1.0 = real time)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency per call (seconds)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Fake model delay between tokens")
+    parser.add_argument("--slo-ms", type=float, default=DEFAULT_SLO_MS, help="p95 turn latency objective")
+    parser.add_argument("--out", help="Write stage results to this JSON file")
+    args = parser.parse_args()
+
+    results = run_load(args.stages, args.duration, args.workers, args.think_scale, args.latency, args.token_delay)
+    saturated = saturation_point(results, args.slo_ms)
+    if saturated:
+        print(f"\n📈 Saturates beyond ~{saturated['students']} concurrent students "
+              f"({saturated['sessions_per_s']:.2f} sessions/s, {saturated['turns_per_s']:.1f} turns/s, "
+              f"p95 {saturated['p95_ms']:.0f} ms)")
+    else:
+        print("\n📈 Throughput still scaling at the last stage; add larger --stages to find saturation")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
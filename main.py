@@ -1,47 +1,108 @@
 from __future__ import annotations as _annotations
 
 import asyncio
+import functools
 import random
 import uuid
 import json
-from typing import Dict, Any, List
-
-from pydantic import BaseModel
-
-from agents import (
-    Agent,
-    HandoffOutputItem,
-    ItemHelpers,
-    MessageOutputItem,
-    RunContextWrapper,
-    Runner,
-    ToolCallItem,
-    ToolCallOutputItem,
-    TResponseInputItem,
-    function_tool,
-    handoff,
-    trace,
-    set_default_openai_api,
-    set_default_openai_client,
-    set_tracing_disabled,
-    AsyncOpenAI
-)
-from openai.types.responses import ResponseTextDeltaEvent
-from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
+from typing import TYPE_CHECKING, Dict, Any, List, Set, Tuple
+
+from pydantic import BaseModel, PrivateAttr
+
 from dotenv import load_dotenv
 import os
 
-# Load environment variables
-load_dotenv()
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-set_tracing_disabled(True)
-set_default_openai_api("chat_completions")
+from agent_graph import DEFAULT_GRAPH_PATH, GraphCache, choose_variant, parse_variants
+from agent_registry import AgentRegistry
+from learning_flow import HANDOFF_FILTERS, HandoffRejected, check_handoff, flow_metrics
+from telemetry import streaming_metrics
+
+if TYPE_CHECKING:
+    from agents import Agent, RunContextWrapper, TResponseInputItem
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+
+# The Agents SDK, model clients and agents are all created on first use so that
+# importing this module (as streamlit_app.py does) stays cheap.
+agent_registry = AgentRegistry()
+
+# Names re-exported from the Agents SDK for existing callers (resolved lazily)
+_SDK_EXPORTS = {
+    "Agent", "HandoffOutputItem", "ItemHelpers", "MessageOutputItem",
+    "RunContextWrapper", "Runner", "ToolCallItem", "ToolCallOutputItem",
+    "TResponseInputItem", "function_tool", "handoff", "trace",
+}
+
+_LAZY_AGENTS = {
+    "screener_agent": "screener",
+    "teaching_agent": "teaching",
+    "quiz_agent": "quiz",
+}
+
+
+@functools.cache
+def load_settings() -> Dict[str, str | None]:
+    """Load environment variables (once)"""
+    load_dotenv()
+    return {"gemini_api_key": os.getenv("GEMINI_API_KEY")}
+
+
+@functools.cache
+def get_external_client():
+    """Default OpenAI-compatible client for the Gemini endpoint"""
+    from agents import (
+        AsyncOpenAI,
+        set_default_openai_api,
+        set_default_openai_client,
+        set_tracing_disabled,
+    )
+
+    set_tracing_disabled(True)
+    set_default_openai_api("chat_completions")
+    external_client = AsyncOpenAI(
+        api_key=load_settings()["gemini_api_key"],
+        base_url=GEMINI_BASE_URL,
+    )
+    set_default_openai_client(external_client)
+    return external_client
+
+
+@functools.cache
+def get_endpoint_pool():
+    """Hedged, circuit-broken model endpoints (see resilient_client.py for settings)"""
+    from resilient_client import EndpointPool
+
+    return EndpointPool.from_env(default_api_key=load_settings()["gemini_api_key"])
+
+
+@functools.cache
+def get_model_router():
+    """Per-agent, per-turn-type model selection (see model_routing.py for settings)"""
+    from model_routing import ModelRouter
+
+    get_external_client()
+    return ModelRouter.from_env(get_endpoint_pool().get_model)
+
+
+def get_agent(key: str, graph_path: str | None = None) -> "Agent[StudentLearningContext]":
+    """Return the agent ``key`` of the (default) agent graph, building it on first use"""
+    return agent_registry.get(key, graph_path)
 
-external_client = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-)
-set_default_openai_client(external_client)
+
+def __getattr__(name: str) -> Any:
+    # Backwards-compatible module attributes, constructed on first access
+    if name in _LAZY_AGENTS:
+        return get_agent(_LAZY_AGENTS[name])
+    if name == "model_router":
+        return get_model_router()
+    if name == "endpoint_pool":
+        return get_endpoint_pool()
+    if name == "external_client":
+        return get_external_client()
+    if name in _SDK_EXPORTS:
+        import agents
+        return getattr(agents, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # CONTEXT - Student Learning Context
@@ -58,16 +119,85 @@ class StudentLearningContext(BaseModel):
     learning_objectives: List[str] = []
     quiz_score: int | None = None
     quiz_total: int | None = None
+    quiz_proficiency: int | None = None  # 0-100 ability estimate of the last adaptive quiz (adaptive_quiz.py)
+    quiz_id: str | None = None  # set by generate_quiz; a quiz is recorded once under it (cohort_analytics.py)
     student_profile: Dict[str, Any] = {}
     screening_complete: bool = False
     concept_taught: bool = False
+    materials_dir: str | None = None  # index of uploaded study materials (study_materials.py)
+    session_id: str | None = None  # key of persisted quiz analytics (cohort_analytics.py)
+    # Update count and fields changed since last persisted. Code outside the
+    # tools writes through context_access (context_access.py), so that
+    # journaled checkpoints (session_journal.py) see its changes.
+    _version: int = PrivateAttr(default=0)
+    _dirty: Set[str] = PrivateAttr(default_factory=set)
+
+
+# TOOL REGISTRATION
+# Tools are plain coroutines; their FunctionTool wrappers are created when the
+# agents are first built.
+
+_TOOL_SPECS: Dict[str, Any] = {}
+_TOOL_FIELDS: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+_TOOLS: Dict[str, Any] = {}
+
+
+def function_tool_spec(name_override: str, description_override: str, reads: Tuple[str, ...] = (),
+                       writes: Tuple[str, ...] = (), edits: Tuple[str, ...] = ()):
+    """Register a tool coroutine to be wrapped with ``function_tool`` on build
+
+    ``reads``, ``writes`` and ``edits`` name the context fields the tool reads,
+    replaces and edits item by item, so concurrent calls see the changes they
+    depend on (see parallel_tools.py).
+    """
+    def decorator(fn):
+        _TOOL_SPECS[name_override] = (fn, description_override)
+        _TOOL_FIELDS[name_override] = {"reads": reads, "writes": writes, "edits": edits}
+        return fn
+    return decorator
+
+
+def get_tool(name: str):
+    """Return the FunctionTool registered under ``name``"""
+    agent_registry.graph()
+    return _TOOLS[name]
+
+
+async def call_tool(name: str, context: StudentLearningContext, **arguments) -> str:
+    """Run the tool ``name`` on ``context`` directly, without a model call (see fast_path.py)"""
+    from agents import RunContextWrapper
+
+    from context_access import context_access
+
+    fn, _ = _TOOL_SPECS[name]
+    before, _ = context_access.read(context)
+    after = before.model_copy(deep=True)
+    output = await fn(RunContextWrapper(after), **arguments)
+    context_access.rebase(context, before, after)
+    return output
+
+
+@agent_registry.before_build
+def _build_tools() -> None:
+    # function_tool resolves the tools' string annotations against this
+    # module's globals, so the SDK names they use must be bound here.
+    global RunContextWrapper
+    from agents import RunContextWrapper, function_tool
+
+    from parallel_tools import ToolFields, ordered_tool
+
+    for name, (fn, description) in _TOOL_SPECS.items():
+        # Calls from one model response run concurrently; their context changes merge in call order
+        _TOOLS[name] = ordered_tool(function_tool(
+            fn, name_override=name, description_override=description), ToolFields.of(**_TOOL_FIELDS[name]))
 
 
 # TOOLS FOR SCREENING AGENT
 
-@function_tool(
+@function_tool_spec(
     name_override="cognitive_assessment_tool",
-    description_override="Conduct cognitive ability assessment for students"
+    description_override="Conduct cognitive ability assessment for students",
+    writes=("cognitive_ability",)
 )
 async def cognitive_assessment_tool(
     context: RunContextWrapper[StudentLearningContext],
@@ -115,9 +245,12 @@ async def cognitive_assessment_tool(
     return f"Assessment '{assessment_type}' completed. Score: {score}/10. Cognitive ability level: {ability}"
 
 
-@function_tool(
+@function_tool_spec(
     name_override="save_student_profile",
-    description_override="Save the complete student profile after screening"
+    description_override="Save the complete student profile after screening",
+    reads=("cognitive_ability",),
+    writes=("student_name", "age", "grade_level", "learning_style", "learning_pace",
+            "subjects_of_interest", "screening_complete", "student_profile")
 )
 async def save_student_profile(
     context: RunContextWrapper[StudentLearningContext],
@@ -164,9 +297,10 @@ async def save_student_profile(
 
 # TOOLS FOR TEACHING AGENT
 
-@function_tool(
+@function_tool_spec(
     name_override="set_learning_topic",
-    description_override="Set the current learning topic and objectives"
+    description_override="Set the current learning topic and objectives",
+    writes=("current_subject", "current_topic", "learning_objectives")
 )
 async def set_learning_topic(
     context: RunContextWrapper[StudentLearningContext],
@@ -190,9 +324,11 @@ async def set_learning_topic(
     return f"Learning topic set: {subject} - {topic}. Objectives: {objectives}"
 
 
-@function_tool(
+@function_tool_spec(
     name_override="generate_personalized_content",
-    description_override="Generate personalized learning content based on student profile"
+    description_override="Generate personalized learning content based on student profile",
+    reads=("student_profile", "current_topic"),
+    writes=("concept_taught",)
 )
 async def generate_personalized_content(
     context: RunContextWrapper[StudentLearningContext],
@@ -232,11 +368,40 @@ async def generate_personalized_content(
     return f"Generated {content_type} content for {topic} tailored to {learning_style} learner with {cognitive_ability} cognitive ability"
 
 
+@function_tool_spec(
+    name_override="search_study_materials",
+    description_override="Search the student's uploaded study materials for passages about a question or topic",
+    reads=("materials_dir",)
+)
+async def search_study_materials(
+    context: RunContextWrapper[StudentLearningContext],
+    query: str
+) -> str:
+    """
+    Search the student's uploaded study materials.
+
+    Args:
+        query: Keywords or a question to look up in the materials
+    """
+    from study_materials import open_index
+
+    materials_dir = context.context.materials_dir
+    if not materials_dir or not os.path.exists(os.path.join(materials_dir, "manifest.json")):
+        return "The student has not uploaded any study materials."
+
+    hits = open_index(materials_dir).search(query, k=4)
+    if not hits:
+        return f"No passages about '{query}' were found in the uploaded materials."
+    return "\n\n".join(f"[{hit.source}, page {hit.page}] {hit.text}" for hit in hits)
+
+
 # TOOLS FOR QUIZ AGENT
 
-@function_tool(
+@function_tool_spec(
     name_override="generate_quiz",
-    description_override="Generate a quiz based on the taught concept"
+    description_override="Generate a quiz based on the taught concept",
+    reads=("current_topic", "cognitive_ability"),
+    writes=("_quiz_questions", "_quiz_results", "quiz_id")
 )
 async def generate_quiz(
     context: RunContextWrapper[StudentLearningContext],
@@ -259,12 +424,41 @@ async def generate_quiz(
     elif cognitive_ability == "Low" and difficulty_level == "hard":
         difficulty_level = "medium"
 
-    return f"Generated {question_count} {difficulty_level} questions for {topic} quiz tailored to {cognitive_ability} cognitive ability"
-
-
-@function_tool(
+    # A new quiz: answers and questions of the previous one no longer apply
+    context.context._quiz_questions = []
+    context.context._quiz_results = []
+    context.context.quiz_id = uuid.uuid4().hex
+
+    summary = f"Generated {question_count} {difficulty_level} questions for {topic} quiz tailored to {cognitive_ability} cognitive ability"
+    from adaptive_quiz import fixed_quiz, get_question_bank
+    from fast_path import fast_path_enabled
+
+    # With the fast path, topics in the question bank get its calibrated
+    # questions; their answer key stays on the context, out of the model's view
+    pool = get_question_bank().find(topic) if fast_path_enabled() else None
+    if pool is None:
+        return summary
+    questions = [
+        {"question": number, "id": item.id, "text": item.question, "options": list(item.options),
+         "answer": "ABCDEFGH"[item.answer], "explanation": item.explanation, "answered": False}
+        for number, item in enumerate(fixed_quiz(pool, difficulty_level, question_count), 1)
+    ]
+    context.context._quiz_questions = questions
+    lines = [f"{summary}. Ask them one at a time (answers are checked against the question bank):"]
+    lines += [format_question(question) for question in questions]
+    return "\n".join(lines)
+
+
+def format_question(question: Dict[str, Any]) -> str:
+    """A question of ``_quiz_questions`` with lettered options"""
+    options = "  ".join(f"{'ABCDEFGH'[i]}) {option}" for i, option in enumerate(question["options"]))
+    return f"{question['question']}. {question['text']}  {options}"
+
+
+@function_tool_spec(
     name_override="evaluate_quiz_response",
-    description_override="Evaluate student's quiz responses"
+    description_override="Evaluate student's quiz responses",
+    edits=("_quiz_results", "_quiz_questions")
 )
 async def evaluate_quiz_response(
     context: RunContextWrapper[StudentLearningContext],
@@ -278,8 +472,13 @@ async def evaluate_quiz_response(
     Args:
         question_number: Question number
         student_answer: Student's answer
-        correct_answer: The correct answer
+        correct_answer: The correct answer (question bank questions use their own key)
     """
+    question = next((q for q in getattr(context.context, "_quiz_questions", [])
+                     if q["question"] == question_number), None)
+    if question is not None:
+        correct_answer = question["answer"]
+
     # Simple evaluation logic
     is_correct = student_answer.lower().strip() == correct_answer.lower().strip()
 
@@ -292,13 +491,18 @@ async def evaluate_quiz_response(
         "correct_answer": correct_answer,
         "is_correct": is_correct
     })
+    if question is not None:
+        question["answered"] = True
 
     return f"Question {question_number}: {'Correct' if is_correct else 'Incorrect'}"
 
 
-@function_tool(
+@function_tool_spec(
     name_override="calculate_quiz_score",
-    description_override="Calculate final quiz score and provide feedback"
+    description_override="Calculate final quiz score and provide feedback",
+    reads=("_quiz_results", "_quiz_questions", "current_topic", "current_subject", "quiz_score", "quiz_total",
+           "quiz_id"),
+    writes=("quiz_score", "quiz_total", "_quiz_results")
 )
 async def calculate_quiz_score(
     context: RunContextWrapper[StudentLearningContext]
@@ -306,10 +510,13 @@ async def calculate_quiz_score(
     """
     Calculate the final quiz score and determine if concept is understood.
     """
-    if not hasattr(context.context, '_quiz_results'):
+    results = getattr(context.context, '_quiz_results', None)
+    if not results:
+        if context.context.quiz_total:
+            # Already scored; the results were recorded and cleared then
+            return f"Quiz already scored: {context.context.quiz_score}/{context.context.quiz_total}."
         return "No quiz results found"
 
-    results = context.context._quiz_results
     total_questions = len(results)
     correct_answers = sum(1 for result in results if result["is_correct"])
 
@@ -318,6 +525,9 @@ async def calculate_quiz_score(
 
     context.context.quiz_score = correct_answers
     context.context.quiz_total = total_questions
+    record_quiz_results(context.context, results)
+    # Recorded once per quiz: answers after this start the next one
+    context.context._quiz_results = []
 
     # Determine understanding level
     if score_percentage >= 80:
@@ -330,126 +540,111 @@ async def calculate_quiz_score(
     return f"Quiz completed: {correct_answers}/{total_questions} ({score_percentage:.1f}%). {understanding}"
 
 
+def record_quiz_results(context: StudentLearningContext, results: List[Dict[str, Any]]) -> None:
+    """Persist an agent-run quiz for cohort analytics (best effort)
+
+    Only answers to question bank questions are recorded as attempts, under
+    the item's id; questions the model wrote have no identity across quizzes.
+    A turn replayed after a failure (see session_runtime.py) scores the quiz
+    again; it is recorded once per ``quiz_id``.
+    """
+    from adaptive_quiz import get_question_bank
+    from cohort_analytics import get_attempt_log
+
+    topic = (context.current_topic or context.current_subject or "unknown").lower()
+    item_ids = {q["question"]: q["id"] for q in getattr(context, "_quiz_questions", []) if q.get("id")}
+    if item_ids:
+        pool = get_question_bank().find(topic)
+        topic = pool.topic if pool is not None else topic
+    try:
+        get_attempt_log().record_quiz(
+            context.session_id or "anonymous", context, topic,
+            score=context.quiz_score, total=context.quiz_total,
+            responses=[(item_ids[r["question"]], r["is_correct"]) for r in results if r["question"] in item_ids],
+            source="agent", quiz_id=context.quiz_id,
+        )
+    except OSError as e:
+        print(f"⚠️ Could not record quiz results: {e}")
+
+
 # HANDOFF HOOKS
 
+# The same preconditions are used to hide these handoffs from the model until
+# they are allowed (see learning_flow.py); the hooks remain as a final check.
+
 async def on_teaching_handoff(context: RunContextWrapper[StudentLearningContext]) -> None:
     """Hook called when handing off to teaching agent"""
-    if not context.context.screening_complete:
-        raise ValueError("Student screening must be completed before teaching")
+    check_handoff("on_teaching_handoff", context.context)
 
 
 async def on_quiz_handoff(context: RunContextWrapper[StudentLearningContext]) -> None:
     """Hook called when handing off to quiz agent"""
-    if not context.context.concept_taught:
-        raise ValueError("A concept must be taught before taking a quiz")
-
-
-# AGENTS
-
-screener_agent = Agent[StudentLearningContext](
-    name="Student Screener Agent",
-    handoff_description="Agent responsible for comprehensive student assessment and profile creation",
-    instructions=f"""{RECOMMENDED_PROMPT_PREFIX}
-    You are a Student Screener Agent responsible for comprehensive student assessment.
-    
-    Your routine:
-    1. Welcome the student warmly and explain the screening process
-    2. Collect basic information: name, age, grade level
-    3. Assess cognitive abilities through targeted questions:
-       - Logical reasoning: Present a simple logic problem
-       - Memory: Ask them to remember and repeat information
-       - Problem-solving: Give a practical problem to solve
-       - Comprehension: Test understanding of a short passage
-    4. Identify learning preferences (visual, auditory, kinesthetic, mixed)
-    5. Determine preferred learning pace (fast, medium, slow)
-    6. Ask about subjects of interest
-    7. Use tools to assess responses and save the complete profile
-    8. Once screening is complete, hand off to the teaching agent
-    
-    Be encouraging, supportive, and make the assessment feel conversational, not intimidating.
-    Use the cognitive_assessment_tool for each assessment type and save_student_profile when complete.
-    """,
-    tools=[cognitive_assessment_tool, save_student_profile],
-    model="gemini-2.0-flash",
-)
+    check_handoff("on_quiz_handoff", context.context)
 
-teaching_agent = Agent[StudentLearningContext](
-    name="Teaching Agent",
-    handoff_description="Agent that provides personalized teaching based on student profile",
-    instructions=f"""{RECOMMENDED_PROMPT_PREFIX}
-    You are a Teaching Agent that provides personalized education based on student profiles.
-    
-    Your routine:
-    1. Review the student's profile and greet them personally
-    2. Ask what subject and topic they'd like to learn about
-    3. Set the learning topic and objectives using the appropriate tool
-    4. Adapt your teaching style based on their profile:
-       - Cognitive ability (High/Medium/Low): Adjust complexity
-       - Learning style (Visual/Auditory/Kinesthetic/Mixed): Choose appropriate methods
-       - Learning pace (Fast/Medium/Slow): Adjust speed and detail
-    5. Use generate_personalized_content to create tailored explanations
-    6. Provide examples, exercises, and check for understanding
-    7. Once the concept is well explained and student shows understanding, hand off to quiz agent
-    
-    Always be patient, encouraging, and adapt your teaching in real-time based on student responses.
-    """,
-    tools=[set_learning_topic, generate_personalized_content],
-    model="gemini-2.0-flash",
-)
 
-quiz_agent = Agent[StudentLearningContext](
-    name="Quiz Agent",
-    handoff_description="Agent that creates and evaluates quizzes to validate concept understanding",
-    instructions=f"""{RECOMMENDED_PROMPT_PREFIX}
-    You are a Quiz Agent that validates student understanding through assessments.
-    
-    Your routine:
-    1. Review the taught topic and student's cognitive ability
-    2. Generate an appropriate quiz using the generate_quiz tool
-    3. Ask questions one by one, adapted to the student's level
-    4. Evaluate each response using evaluate_quiz_response
-    5. Provide immediate feedback for each answer
-    6. After all questions, calculate the final score
-    7. Based on the score:
-       - 80%+: Congratulate and offer to teach a new topic (hand back to teaching agent)
-       - 60-79%: Provide encouragement and offer review or new topic
-       - <60%: Recommend reviewing the concept (hand back to teaching agent)
-    
-    Make the quiz engaging and provide constructive feedback. Celebrate successes and encourage improvement.
-    """,
-    tools=[generate_quiz, evaluate_quiz_response, calculate_quiz_score],
-    model="gemini-2.0-flash",
-)
+# AGENT GRAPH
+# Agents, prompts, models and handoffs are declared in agent_graph.toml (or the
+# file named by YOURTEACHER_AGENT_GRAPH) and compiled once per file version.
+
+HANDOFF_GUARDS = {
+    "on_teaching_handoff": on_teaching_handoff,
+    "on_quiz_handoff": on_quiz_handoff,
+}
 
-# Set up handoffs
-screener_agent.handoffs = [
-    handoff(agent=teaching_agent, on_handoff=on_teaching_handoff)
-]
+_graph_cache = GraphCache()
 
-teaching_agent.handoffs = [
-    screener_agent,  # Can go back for re-assessment if needed
-    handoff(agent=quiz_agent, on_handoff=on_quiz_handoff)
-]
 
-quiz_agent.handoffs = [
-    teaching_agent,  # Go back to teaching for review or new topics
-    screener_agent   # Go back to screener if profile needs updating
-]
+def resolve_model(reference: str):
+    """Resolve a graph model reference ("route:<key>" or a model name)"""
+    router = get_model_router()
+    if reference.startswith("route:"):
+        return router.model_for(reference[len("route:"):])
+    return router.get_model(reference)
+
+
+def default_graph_path() -> str:
+    load_settings()
+    return os.getenv("YOURTEACHER_AGENT_GRAPH", DEFAULT_GRAPH_PATH)
+
+
+def graph_path_for_session(session_id: str) -> str:
+    """
+    Pick the agent graph for a session. With YOURTEACHER_AGENT_GRAPH_VARIANTS
+    ("name=path:weight,...") sessions are split deterministically across variants.
+    """
+    load_settings()
+    variants = parse_variants(os.getenv("YOURTEACHER_AGENT_GRAPH_VARIANTS", ""))
+    if not variants:
+        return default_graph_path()
+    _, path = choose_variant(session_id, variants)
+    return path
+
+
+@agent_registry.graph_loader
+def load_agent_graph(path: str | None = None):
+    """Compiled agent graph for ``path``, rebuilt only when the file or a file it extends changes"""
+    return _graph_cache.get(
+        path or default_graph_path(), _TOOLS, HANDOFF_GUARDS, resolve_model,
+        HANDOFF_FILTERS)
 
 
 # STREAMING FUNCTIONS
 
-async def process_streaming_response(streaming_result, previous_agent_name=None):
+async def process_streaming_response(streaming_result, previous_agent_name=None, agent=None, models=None):
     """
     Process streaming response with real-time updates
     """
+    from agents import ItemHelpers
+    from openai.types.responses import ResponseTextDeltaEvent
+
     current_message = ""
     current_agent_name = previous_agent_name or ""
 
     print("🔄 Processing agent response...")
 
-    # Process all streaming events
-    async for event in streaming_result.stream_events():
+    # Process all streaming events (timed per turn for latency telemetry)
+    events = streaming_result.stream_events()
+    async for event in streaming_metrics.track(events, agent or streaming_result.current_agent, models=models):
         # Handle raw response events for real-time text streaming
         if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
             if event.data.delta:
@@ -514,13 +709,17 @@ async def main():
     print("4. ⚡ Stream responses in real-time for better experience")
     print("=" * 80)
 
-    # Initialize the system
-    current_agent: Agent[StudentLearningContext] = screener_agent
-    input_items: list[TResponseInputItem] = []
-    context = StudentLearningContext()
+    # Initialize the system (imports the Agents SDK and builds the agents)
+    from agents import Runner, trace
+    from context_access import context_access
+    from session_export import get_session_exporter, rows_from_input_items
 
+    model_router = get_model_router()
+    current_agent: Agent[StudentLearningContext] = agent_registry.entry()
+    input_items: list[TResponseInputItem] = []
     # Generate unique conversation ID for tracing
     conversation_id = uuid.uuid4().hex[:16]
+    context = StudentLearningContext(session_id=conversation_id)
 
     # Start with welcome message
     input_items.append({
@@ -531,18 +730,27 @@ async def main():
     print("\n🤖 Starting your personalized learning journey...")
     print("-" * 50)
 
+    handoff_retried = False
+
     while True:
         try:
             with trace("Educational System Streaming", group_id=conversation_id):
                 # Track previous agent name for handoff detection
                 previous_agent_name = current_agent.name
 
+                # Undone if the turn is replayed: its tools may have run before the rejected handoff
+                before, _ = context_access.read(context)
+
                 # Use streaming runner instead of regular runner
-                streaming_result = Runner.run_streamed(
-                    current_agent, input_items, context=context)
+                with model_router.bind(context) as models:
+                    streaming_result = Runner.run_streamed(
+                        current_agent, input_items, context=context)
+
+                    # Process streaming response (this consumes the stream)
+                    processed_result = await process_streaming_response(
+                        streaming_result, previous_agent_name, current_agent, models)
 
-                # Process streaming response (this consumes the stream)
-                processed_result = await process_streaming_response(streaming_result, previous_agent_name)
+                handoff_retried = False
 
                 # Update for next iteration - access the final result from the streaming object
                 input_items = processed_result.to_input_list()
@@ -566,6 +774,15 @@ async def main():
             print(f"\n\n🎓 Session ended. Thank you for using YourTeacher!")
             break
         except Exception as e:
+            if isinstance(e, HandoffRejected) and not handoff_retried:
+                # The handoff is now filtered out for this stage; replay the
+                # same input once instead of making the student resend it.
+                print(f"\n↩️ Handoff not available yet ({e.reason}), continuing with {current_agent.name}")
+                handoff_retried = True
+                flow_metrics.incr("turns_recovered")
+                context_access.restore(context, before)
+                continue
+
             print(f"\n❌ An error occurred: {e}")
             print("Please try again or type 'quit' to exit.")
 
@@ -575,6 +792,25 @@ async def main():
                 break
             input_items.append({"content": user_input, "role": "user"})
 
+    exporter = get_session_exporter()
+    if exporter:
+        exporter.add(conversation_id, rows_from_input_items(conversation_id, input_items), context)
+        exporter.close()
+        print(f"\n📦 Session exported to {exporter.directory}")
+
+    print("\n⏱️ Streaming latency summary")
+    print("-" * 50)
+    print(streaming_metrics.format_summary())
+    print("\n🧭 Model routing summary")
+    print("-" * 50)
+    print(model_router.metrics.format_summary())
+    print("\n🚦 Learning flow handoffs")
+    print("-" * 50)
+    print(flow_metrics.format_summary())
+    print("\n🩺 Model endpoint health")
+    print("-" * 50)
+    print(get_endpoint_pool().format_health())
+
 
 if __name__ == "__main__":
     asyncio.run(main())
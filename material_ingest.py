@@ -0,0 +1,390 @@
+"""
+Streaming, parallel ingestion of large study material files.
+
+``study_materials.MaterialIndex.add_document`` works on one in-memory stream
+in the calling process. For 200-page PDFs and big slide decks this module
+instead works from a file on disk:
+
+* PDFs are split into page ranges that the workers of a process pool
+  extract, chunk and tokenize;
+* other files (DOCX, PPTX, text) can only be read front to back, so one
+  extraction process reads the file and passes page batches through a
+  bounded queue to the pool, where they are chunked and tokenized;
+* the resulting chunks go to the disk-backed chunk store as soon as each
+  batch finishes, in page order, with a bounded number of batches in flight,
+  and progress is reported after every batch.
+
+The calling process extracts no text, and its peak memory depends on the
+batch size and worker count, not on the size of the file. The pool is started
+on first use and kept for later files, so an upload does not pay for starting
+the workers.
+
+Streamlit's file uploader hands over uploads already in memory;
+``ingest_upload`` spools them to a temporary file so the workers can read it.
+
+Usage:
+    python material_ingest.py ingest INDEX_DIR FILE... [--workers N]
+    python material_ingest.py bench --pages 2000 --workers 0 4
+"""
+
+from __future__ import annotations
+
+import atexit
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterator, List, Tuple
+
+from study_materials import (
+    MaterialIndex,
+    MaterialsError,
+    chunk_pages,
+    content_digest,
+    extract_pages,
+    term_counts,
+)
+
+PAGES_PER_BATCH = 8
+SPOOL_BLOCK = 1 << 20
+
+# (page, chunk text, term_counts(text)) rows produced by a worker
+ChunkRows = List[Tuple[int, str, tuple]]
+
+
+@dataclass
+class IngestProgress:
+    source: str
+    pages: int = 0
+    total_pages: int | None = None
+    chunks: int = 0
+    seconds: float = 0.0
+    done: bool = False
+    skipped: bool = False  # already indexed with the same content
+
+    @property
+    def fraction(self) -> float | None:
+        if self.done:
+            return 1.0
+        if not self.total_pages:
+            return None
+        return min(self.pages / self.total_pages, 1.0)
+
+
+def default_workers() -> int:
+    return int(os.getenv("YOURTEACHER_INGEST_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+# WORKER FUNCTIONS (run in the process pool)
+
+def _process_pages(pages: List[Tuple[int, str]]) -> ChunkRows:
+    return [(page, text, term_counts(text)) for page, text in chunk_pages(pages)]
+
+
+def _process_pdf_range(path: str, start: int, end: int) -> ChunkRows:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return _process_pages(
+        [(number + 1, reader.pages[number].extract_text() or "") for number in range(start, end)])
+
+
+def _extract_batches(name: str, path: str, batch_pages: int, batches) -> None:
+    """Extraction process: put page batches of ``path`` on ``batches``, then None (or the error)"""
+    try:
+        with open(path, "rb") as stream:
+            batch: List[Tuple[int, str]] = []
+            for page in extract_pages(name, stream):
+                batch.append(page)
+                if len(batch) >= batch_pages:
+                    batches.put(batch)
+                    batch = []
+            if batch:
+                batches.put(batch)
+        batches.put(None)
+    except Exception as e:
+        batches.put(e if isinstance(e, MaterialsError) else MaterialsError(f"Could not read '{name}': {e}"))
+
+
+# WORKER POOL
+
+_SPAWN = multiprocessing.get_context("spawn")  # forking a threaded process (e.g. Streamlit) is unsafe
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def worker_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool shared by all ingestions; started with ``workers`` workers on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(workers, mp_context=_SPAWN)
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next ingestion starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# TASK PLANNING
+
+def _pdf_page_count(path: str) -> int:
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise MaterialsError("PDF uploads need the 'pypdf' package (pip install pypdf)") from e
+    return len(PdfReader(path).pages)
+
+
+def _plan_tasks(name: str, path: str, batch_pages: int, in_flight: int,
+                extract: bool) -> Tuple[int | None, Iterator[tuple]]:
+    """(total pages if known, iterator of (function, args, page count) tasks)
+
+    With ``extract``, non-PDF files are read by an extraction process instead
+    of the calling one, holding at most ``in_flight`` batches in its queue.
+    """
+    if name.lower().endswith(".pdf"):
+        total = _pdf_page_count(path)
+
+        def pdf_tasks():
+            for start in range(0, total, batch_pages):
+                end = min(start + batch_pages, total)
+                yield _process_pdf_range, (path, start, end), end - start
+        return total, pdf_tasks()
+
+    def page_batches():
+        # Extraction streams from the file; only one batch of page text is held here
+        with open(path, "rb") as stream:
+            batch: List[Tuple[int, str]] = []
+            for page in extract_pages(name, stream):
+                batch.append(page)
+                if len(batch) >= batch_pages:
+                    yield _process_pages, (batch,), len(batch)
+                    batch = []
+            if batch:
+                yield _process_pages, (batch,), len(batch)
+
+    def extracted_batches():
+        batches = _SPAWN.Queue(maxsize=in_flight)
+        extractor = _SPAWN.Process(target=_extract_batches, args=(name, path, batch_pages, batches), daemon=True)
+        extractor.start()
+        try:
+            while True:
+                try:
+                    batch = batches.get(timeout=1.0)
+                except queue.Empty:
+                    if not extractor.is_alive():
+                        raise MaterialsError(f"Could not read '{name}': extraction stopped")
+                    continue
+                if batch is None:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield _process_pages, (batch,), len(batch)
+        finally:
+            extractor.kill()
+            extractor.join()
+    return None, extracted_batches() if extract else page_batches()
+
+
+# INGESTION
+
+def spool_upload(stream: BinaryIO, suffix: str = "") -> str:
+    """Copy an upload to a temporary file in fixed-size blocks; returns its path"""
+    if hasattr(stream, "seek"):
+        stream.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="yourteacher-upload-", suffix=suffix, delete=False) as f:
+        shutil.copyfileobj(stream, f, SPOOL_BLOCK)
+        return f.name
+
+
+def ingest_file(
+    index: MaterialIndex,
+    path: str,
+    name: str | None = None,
+    workers: int | None = None,
+    progress: Callable[[IngestProgress], None] | None = None,
+    batch_pages: int = PAGES_PER_BATCH,
+) -> IngestProgress:
+    """
+    Extract, chunk and index the file at ``path`` under the source ``name``.
+    ``workers=0`` processes batches in the calling process. A file already
+    indexed under ``name`` with the same content is skipped.
+    """
+    name = name or os.path.basename(path)
+    workers = default_workers() if workers is None else workers
+    with open(path, "rb") as f:
+        digest = content_digest(f)
+    if index.indexed(name, digest):
+        return IngestProgress(source=name, done=True, skipped=True)
+    started = time.perf_counter()
+    total, tasks = _plan_tasks(name, path, batch_pages, workers * 2, extract=workers > 0)
+    state = IngestProgress(source=name, total_pages=total)
+
+    def store(rows: ChunkRows, page_count: int) -> None:
+        for page, text, counts in rows:
+            writer.write(page, text, counts)
+        state.pages += page_count
+        state.chunks = writer.added
+        state.seconds = time.perf_counter() - started
+        if progress:
+            progress(state)
+
+    with index.writer(name, digest) as writer:
+        if workers <= 0:
+            for fn, args, page_count in tasks:
+                store(fn(*args), page_count)
+        else:
+            pool = worker_pool(workers)
+            pending: deque[Tuple[Future, int]] = deque()
+            try:
+                for fn, args, page_count in tasks:
+                    pending.append((pool.submit(fn, *args), page_count))
+                    if len(pending) >= workers * 2:
+                        future, count = pending.popleft()
+                        store(future.result(), count)
+                while pending:
+                    future, count = pending.popleft()
+                    store(future.result(), count)
+            except BrokenProcessPool:
+                _discard_pool(pool)
+                raise
+            finally:
+                for future, _ in pending:
+                    future.cancel()
+
+    index.commit()
+    state.seconds = time.perf_counter() - started
+    state.done = True
+    if progress:
+        progress(state)
+    return state
+
+
+def ingest_upload(
+    index: MaterialIndex,
+    name: str,
+    stream: BinaryIO,
+    workers: int | None = None,
+    progress: Callable[[IngestProgress], None] | None = None,
+) -> IngestProgress:
+    """Spool an uploaded stream to disk and ingest it with ``ingest_file``
+
+    Streamlit uploads are already in memory, so this is one copy to disk that
+    gives the workers a path to read; peak memory is the upload plus a batch.
+    """
+    path = spool_upload(stream, suffix=os.path.splitext(name)[1])
+    try:
+        return ingest_file(index, path, name=name, workers=workers, progress=progress)
+    finally:
+        os.unlink(path)
+
+
+# BENCHMARK
+
+_DOCX_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def write_synthetic_docx(path: str, pages: int, words_per_page: int = 500, seed: int = 0) -> None:
+    """Write a DOCX of ``pages`` x 40 paragraphs without building it in memory"""
+    import random
+    import zipfile
+
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(20_000)]
+    per_paragraph = max(1, words_per_page // 40)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("word/document.xml", "w") as xml:
+            xml.write(f'<w:document xmlns:w="{_DOCX_NS}"><w:body>'.encode())
+            for _ in range(pages * 40):
+                words = " ".join(rng.choices(vocabulary, k=per_paragraph))
+                xml.write(f"<w:p><w:r><w:t>{words}</w:t></w:r></w:p>".encode())
+            xml.write(b"</w:body></w:document>")
+
+
+def _bench_run(path: str, workers: int) -> None:
+    # Runs in a fresh interpreter so ru_maxrss is this run's peak only
+    import json
+    import resource
+
+    index = MaterialIndex(tempfile.mkdtemp(prefix="yourteacher-ingest-"))
+    result = ingest_file(index, path, workers=workers)
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(json.dumps({
+        "workers": workers, "pages": result.pages, "chunks": result.chunks,
+        "seconds": result.seconds, "peak_rss_mb": own / 1024, "worker_peak_rss_mb": children / 1024,
+    }))
+
+
+def benchmark(pages_list: List[int], workers_list: List[int]) -> None:
+    import json
+    import subprocess
+    import sys
+
+    print(f"{'pages':>6} {'file MB':>8} {'workers':>8} {'chunks':>8} {'seconds':>8} "
+          f"{'pages/s':>8} {'peak MB':>8} {'worker MB':>10}")
+    for pages in pages_list:
+        path = os.path.join(tempfile.mkdtemp(prefix="yourteacher-bench-"), "synthetic.docx")
+        write_synthetic_docx(path, pages)
+        size_mb = os.path.getsize(path) / 1e6
+        for workers in workers_list:
+            completed = subprocess.run(
+                [sys.executable, __file__, "_run", path, str(workers)],
+                capture_output=True, text=True, check=True)
+            run = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{pages:>6} {size_mb:>8.1f} {workers:>8} {run['chunks']:>8} {run['seconds']:>8.2f} "
+                  f"{run['pages'] / run['seconds']:>8.0f} {run['peak_rss_mb']:>8.0f} "
+                  f"{run['worker_peak_rss_mb']:>10.0f}")
+
+
+def main():
+    import argparse
+    import sys
+
+    if len(sys.argv) == 4 and sys.argv[1] == "_run":
+        _bench_run(sys.argv[2], int(sys.argv[3]))
+        return
+
+    parser = argparse.ArgumentParser(description="Streaming study material ingestion")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="Ingest files into an index directory")
+    ingest.add_argument("index")
+    ingest.add_argument("files", nargs="+")
+    ingest.add_argument("--workers", type=int, default=None)
+    bench = sub.add_parser("bench", help="Throughput and peak RSS on synthetic DOCX files")
+    bench.add_argument("--pages", type=int, nargs="+", default=[200, 2000])
+    bench.add_argument("--workers", type=int, nargs="+", default=[0, default_workers()])
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(args.pages, args.workers)
+        return
+
+    index = MaterialIndex(args.index)
+    for file_path in args.files:
+        def report(state: IngestProgress) -> None:
+            total = f"/{state.total_pages}" if state.total_pages else ""
+            print(f"\r📥 {state.source}: {state.pages}{total} pages, {state.chunks} chunks", end="")
+        result = ingest_file(index, file_path, workers=args.workers, progress=report)
+        if result.skipped:
+            print(f"⏭️ {file_path}: already indexed")
+        else:
+            print(f"\n✅ {file_path}: {result.chunks} chunks in {result.seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Per-session memory profiling (opt-in).
+
+* ``deep_size`` / ``session_footprint``: retained size of a session broken down
+  into its parts (StudentLearningContext, SDK input items, transcript or
+  Streamlit ``conversation_history``, quiz state). Agent objects are shared
+  by all sessions and are not counted.
+* ``MemoryProfiler``: tracemalloc snapshots, top allocating lines and the
+  growth between two snapshots. Tracing costs CPU and memory, so it only runs
+  when ``YOURTEACHER_MEMORY_PROFILE=1`` (or when the CLI starts it).
+
+Both frontends show them in a sidebar panel when profiling is enabled:
+frontend.py for every runtime session, streamlit_app.py for the browser
+session's own state.
+
+Usage:
+    python memory_profile.py session --turns 100
+    python memory_profile.py bench --turns 100 --ceiling-kb 640
+"""
+
+from __future__ import annotations
+
+import gc
+import os
+import sys
+import tracemalloc
+from typing import Any, Dict, Iterable, List, Tuple
+
+TRACE_FRAMES = 1  # deeper tracebacks slow every allocation down considerably
+DEFAULT_CEILING_KB = 640  # footprint allowed for one 100-turn session (~430 KB measured)
+# After close, a session may leave at most this share of its traced growth
+# behind (bounded process-wide buffers such as telemetry samples still fill up)
+RELEASED_SHARE = 0.5
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("YOURTEACHER_MEMORY_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+# OBJECT SIZES
+
+_SHARED_TYPES: Tuple[type, ...] = (type,)
+
+
+def _shared_types() -> Tuple[type, ...]:
+    """Types whose instances are shared between sessions (agents, tools, models)"""
+    global _SHARED_TYPES
+    if len(_SHARED_TYPES) == 1:
+        from agents import Agent, Handoff, Model, Tool
+        _SHARED_TYPES = (type, Agent, Handoff, Model) + tuple(t for t in Tool.__args__ if isinstance(t, type))
+    return _SHARED_TYPES
+
+
+def deep_size(obj: Any, seen: set | None = None) -> int:
+    """Bytes reachable from ``obj`` (containers, instance dicts, pydantic fields), each object counted once"""
+    seen = set() if seen is None else seen
+    shared = _shared_types()
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, shared):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif isinstance(current, (str, bytes, int, float, bool)) or current is None:
+            continue
+        else:
+            if hasattr(current, "__dict__"):
+                stack.append(current.__dict__)
+            private = getattr(current, "__pydantic_private__", None)
+            if private:
+                stack.append(private)
+            for slot in getattr(type(current), "__slots__", ()):
+                if hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+    return size
+
+
+def footprint(parts: Dict[str, Any]) -> Dict[str, int]:
+    """Deep size per part plus the total; objects shared by parts count once (in the first)"""
+    seen: set = set()
+    sizes = {name: deep_size(value, seen) for name, value in parts.items()}
+    sizes["total"] = sum(sizes.values())
+    return sizes
+
+
+def session_footprint(session) -> Dict[str, int]:
+    """Breakdown of a ``session_runtime.TutorSession``"""
+    context = session.context
+    return footprint({
+        "context": context,
+        "quiz_results": getattr(context, "_quiz_results", []),
+        "input_items": session.input_items,
+        "transcript": session.transcript,
+    })
+
+
+def streamlit_footprint(state) -> Dict[str, int]:
+    """Breakdown of streamlit_app.py session state"""
+    context = state.get("context")
+    return footprint({
+        "context": context,
+        "quiz_results": getattr(context, "_quiz_results", []),
+        "input_items": state.get("input_items", []),
+        "conversation_history": state.get("conversation_history", []),
+    })
+
+
+def runtime_footprint(runtime) -> List[Dict[str, Any]]:
+    """Per-session breakdown of every session in a SessionRuntime, largest first"""
+    with runtime._lock:
+        sessions = list(runtime._sessions.values())
+    rows = [{"session_id": session.session_id, "turns": session.turns, **session_footprint(session)}
+            for session in sessions]
+    return sorted(rows, key=lambda row: -row["total"])
+
+
+# TRACEMALLOC
+
+class MemoryProfiler:
+    """tracemalloc snapshots and top allocators"""
+
+    def __init__(self, frames: int = TRACE_FRAMES):
+        self.frames = frames
+        self.baseline: tracemalloc.Snapshot | None = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.baseline = self.snapshot()
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.baseline = None
+
+    @staticmethod
+    def snapshot() -> tracemalloc.Snapshot:
+        gc.collect()
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    @staticmethod
+    def traced() -> Tuple[int, int]:
+        """(current, peak) traced bytes"""
+        return tracemalloc.get_traced_memory()
+
+    def retained(self) -> int:
+        """Traced bytes alive now minus those alive at ``start()``"""
+        if self.baseline is None:
+            raise RuntimeError("MemoryProfiler.start() was not called")
+        return sum(stat.size_diff for stat in self.snapshot().compare_to(self.baseline, "filename"))
+
+    def top(self, limit: int = 10, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        """Largest allocation sites currently alive"""
+        stats = self.snapshot().statistics(group_by)
+        return [{"site": str(stat.traceback), "size": stat.size, "count": stat.count} for stat in stats[:limit]]
+
+    def growth(self, limit: int = 10, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        """Allocation sites that grew most since ``start()``"""
+        if self.baseline is None:
+            raise RuntimeError("MemoryProfiler.start() was not called")
+        stats = self.snapshot().compare_to(self.baseline, group_by)
+        return [{"site": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in stats[:limit]]
+
+
+_profiler: MemoryProfiler | None = None
+
+
+def get_memory_profiler() -> MemoryProfiler | None:
+    """Process-wide profiler, started on first use when profiling is enabled"""
+    global _profiler
+    if _profiler is None and profiling_enabled():
+        _profiler = MemoryProfiler()
+        _profiler.start()
+    return _profiler
+
+
+def format_sizes(rows: Iterable[Dict[str, Any]], key: str = "size") -> str:
+    return "\n".join(f"{row[key] / 1024:>10.1f} KB  {row['site']}" for row in rows)
+
+
+# SCRIPTED SESSION / BENCHMARK
+
+async def play_scripted_turns(session, turns: int, seed: int = 0) -> None:
+    """Play ``turns`` synthetic student turns (see load_generator.py) in ``session``"""
+    import random
+
+    from load_generator import sample_persona, student_script
+    from session_runtime import CHANNEL_AGENTS
+
+    rng = random.Random(seed)
+    channel = None
+    played = 0
+    while played < turns:
+        # Repeat whole student scripts until ``turns`` turns have been played
+        for turn_channel, message in student_script(sample_persona(rng), rng):
+            if played >= turns:
+                break
+            agent_key = CHANNEL_AGENTS[turn_channel] if turn_channel != channel else None
+            channel = turn_channel
+            async for _ in session.stream_turn(message, agent_key, channel):
+                pass
+            played += 1
+
+
+async def measure_session(turns: int, frames: int = TRACE_FRAMES) -> Dict[str, Any]:
+    """Footprint of one scripted session and the memory it still holds after it is closed"""
+    import json
+    import tempfile
+
+    from load_generator import tutor_responder
+    from stub_model_server import StubModelServer
+
+    os.environ["YOURTEACHER_ANALYTICS_DIR"] = tempfile.mkdtemp(prefix="yourteacher-memory-")
+    os.environ.pop("YOURTEACHER_EXPORT_DIR", None)
+    async with StubModelServer(responder=tutor_responder) as server:
+        os.environ["YOURTEACHER_MODEL_ENDPOINTS"] = json.dumps([{"name": "fake", "base_url": server.base_url}])
+        os.environ.setdefault("GEMINI_API_KEY", "memory-bench")
+        from session_runtime import runtime
+
+        # Warm-up session of the same length: imports, the agent graph, HTTP
+        # clients and bounded process-wide buffers (telemetry samples, SDK
+        # caches) fill up here and are not counted as per-session memory
+        warm = runtime.session("memory-warmup")
+        await play_scripted_turns(warm, turns, seed=1)
+        runtime.close_session(warm.session_id)
+        del warm
+
+        profiler = MemoryProfiler(frames)
+        profiler.start()
+        session = runtime.session("memory-bench")
+        await play_scripted_turns(session, turns)
+        breakdown = session_footprint(session)
+        traced_open = profiler.retained()
+        growth = profiler.growth(limit=10)
+        runtime.close_session(session.session_id)
+        del session
+        traced_closed = profiler.retained()
+        retained_sites = profiler.growth(limit=10)
+        profiler.stop()
+    return {
+        "turns": turns,
+        "breakdown": breakdown,
+        "traced_growth": traced_open,
+        "retained_after_close": traced_closed,
+        "growth": growth,
+        "retained_sites": retained_sites,
+    }
+
+
+def print_measurement(result: Dict[str, Any]) -> None:
+    print(f"🧠 Session footprint after {result['turns']} turns")
+    for name, size in result["breakdown"].items():
+        print(f"   {name:<16} {size / 1024:>10.1f} KB")
+    print(f"   per turn         {result['breakdown']['total'] / result['turns'] / 1024:>10.1f} KB")
+    print(f"\n📈 Traced growth while open: {result['traced_growth'] / 1024:.1f} KB, "
+          f"after close: {result['retained_after_close'] / 1024:.1f} KB")
+    print("\n🔝 Top growing allocation sites while open")
+    print(format_sizes(result["growth"], "size_diff"))
+    print("\n🧷 Still allocated after close")
+    print(format_sizes(result["retained_sites"], "size_diff"))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-session memory profiling")
+    sub = parser.add_subparsers(dest="command", required=True)
+    session = sub.add_parser("session", help="Profile one scripted session")
+    session.add_argument("--turns", type=int, default=100)
+    session.add_argument("--frames", type=int, default=TRACE_FRAMES, help="Traceback depth per allocation")
+    bench = sub.add_parser("bench", help="Fail if a scripted session exceeds the memory ceiling")
+    bench.add_argument("--turns", type=int, default=100)
+    bench.add_argument("--ceiling-kb", type=float, default=DEFAULT_CEILING_KB)
+    args = parser.parse_args()
+
+    import asyncio
+
+    result = asyncio.run(measure_session(args.turns, getattr(args, "frames", TRACE_FRAMES)))
+    print_measurement(result)
+    if args.command == "bench":
+        total_kb = result["breakdown"]["total"] / 1024
+        leaked_kb = result["retained_after_close"] / 1024
+        leak_limit_kb = result["traced_growth"] / 1024 * RELEASED_SHARE
+        ok = total_kb <= args.ceiling_kb and leaked_kb <= leak_limit_kb
+        print(f"\n{'✅' if ok else '❌'} {total_kb:.1f} KB per session (ceiling {args.ceiling_kb:.0f} KB), "
+              f"{leaked_kb:.1f} KB left after close (limit {leak_limit_kb:.0f} KB)")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
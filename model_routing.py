@@ -0,0 +1,443 @@
+"""
+Model routing for YourTeacher agents.
+
+Each agent gets a ``RoutedModel`` instead of a hard-coded model name. On every
+model call the router classifies the turn (chit-chat, grading, explanation)
+from the agent, the bound ``StudentLearningContext`` and the latest input, then
+picks a model tier for that (agent, turn type) route. A primary call that
+times out is retried once on the route's fallback model. Latency, token usage
+(including input tokens served from the provider's prompt cache, see
+prompt_cache.py) and estimated cost are aggregated per route.
+
+Configuration (environment / .env):
+    YOURTEACHER_MODEL_FAST      model used by the "fast" tier
+    YOURTEACHER_MODEL_STRONG    model used by the "strong" tier
+    YOURTEACHER_MODEL_ROUTES    overrides, e.g. "quiz.grading=strong,teaching.*=gemini-2.5-pro"
+    YOURTEACHER_MODEL_TIMEOUT   seconds before falling back (default 20)
+    YOURTEACHER_MODEL_PRICES    JSON {"model": [usd_per_1m_input, usd_per_1m_output]}
+    YOURTEACHER_PROMPT_CACHE_KEY  1 to send a per-prefix prompt_cache_key (see prompt_cache.py)
+    YOURTEACHER_SESSION_HEADER  1 to name the session in an X-YourTeacher-Session request header
+                                (set by session_replay.py for its stub server)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import dataclasses
+import inspect
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Tuple
+
+from agents import Model
+
+from prompt_cache import cache_key_enabled, cached_tokens, prefix_of, prefix_registry, with_cache_key
+from telemetry import PERCENTILES, percentile
+
+# Turn types
+CHIT_CHAT = "chit_chat"
+GRADING = "grading"
+EXPLANATION = "explanation"
+
+FAST = "fast"
+STRONG = "strong"
+
+DEFAULT_MODELS = {
+    FAST: "gemini-2.0-flash-lite",
+    STRONG: "gemini-2.0-flash",
+}
+
+# (agent key, turn type) -> tier or model name. "*" matches any turn type.
+DEFAULT_ROUTES: Dict[Tuple[str, str], str] = {
+    ("screener", "*"): FAST,
+    ("teaching", CHIT_CHAT): FAST,
+    ("teaching", EXPLANATION): STRONG,
+    ("quiz", GRADING): FAST,
+    ("quiz", EXPLANATION): STRONG,
+    ("*", "*"): STRONG,
+}
+
+# USD per 1M tokens (input, output)
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+# Share of the input price billed for tokens served from the prompt cache
+CACHED_INPUT_SHARE = 0.25
+
+ACKNOWLEDGEMENTS = {
+    "ok", "okay", "yes", "no", "sure", "thanks", "thank you", "cool", "got it",
+    "great", "nice", "yep", "nope", "hi", "hello", "bye",
+}
+
+SESSION_HEADER = "X-YourTeacher-Session"
+
+
+def session_header_enabled() -> bool:
+    return os.getenv("YOURTEACHER_SESSION_HEADER", "").lower() in ("1", "true", "yes")
+
+
+# The StudentLearningContext of the session whose run is in progress
+_bound_context: contextvars.ContextVar[Any] = contextvars.ContextVar(
+    "yourteacher_bound_context", default=None)
+# Models the run's calls went to, in call order (the list ``bind`` yields)
+_bound_models: contextvars.ContextVar[List[str] | None] = contextvars.ContextVar(
+    "yourteacher_bound_models", default=None)
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    model: str
+    fallback_model: str | None
+    timeout: float
+
+
+def _last_user_text(input: str | List[Any]) -> str:
+    if isinstance(input, str):
+        return input
+    for item in reversed(input):
+        if isinstance(item, dict) and item.get("role") == "user":
+            content = item.get("content")
+            if isinstance(content, str):
+                return content
+            if isinstance(content, list):
+                return " ".join(
+                    part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _last_item_is_tool_output(input: str | List[Any]) -> bool:
+    if isinstance(input, str) or not input:
+        return False
+    last = input[-1]
+    return isinstance(last, dict) and last.get("type") == "function_call_output"
+
+
+def classify_turn(agent_key: str, context: Any, input: str | List[Any]) -> str:
+    """Classify the upcoming model call into a turn type"""
+    text = _last_user_text(input).strip().lower().rstrip("!.")
+
+    if agent_key == "screener":
+        return CHIT_CHAT
+
+    if agent_key == "quiz":
+        quiz_started = bool(getattr(context, "_quiz_results", None))
+        if quiz_started or _last_item_is_tool_output(input):
+            return GRADING
+        return EXPLANATION
+
+    if text in ACKNOWLEDGEMENTS or (len(text.split()) <= 3 and "?" not in text):
+        return CHIT_CHAT
+    return EXPLANATION
+
+
+class RouteMetrics:
+    """Per-route latency, fallback and cost accounting"""
+
+    def __init__(self, max_samples: int = 2000):
+        self._lock = threading.Lock()
+        self._latency: Dict[str, deque] = defaultdict(lambda: deque(maxlen=max_samples))
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def record(self, route: str, model: str, latency: float, usage: Any = None,
+               prices: Dict[str, Tuple[float, float]] | None = None,
+               timed_out: bool = False, fallback: bool = False, error: bool = False) -> None:
+        input_tokens = getattr(usage, "input_tokens", 0) or 0
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+        cached = cached_tokens(usage)
+        price_in, price_out = (prices or DEFAULT_PRICES).get(model, (0.0, 0.0))
+        cost = ((input_tokens - cached + cached * CACHED_INPUT_SHARE) * price_in
+                + output_tokens * price_out) / 1_000_000
+
+        key = f"{route} -> {model}"
+        with self._lock:
+            counters = self._counters[key]
+            counters["calls"] += 1
+            counters["input_tokens"] += input_tokens
+            counters["cached_tokens"] += cached
+            counters["output_tokens"] += output_tokens
+            counters["cost_usd"] += cost
+            counters["timeouts"] += timed_out
+            counters["fallbacks"] += fallback
+            counters["errors"] += error
+            if not (timed_out or error):
+                self._latency[key].append(latency)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            counters = {key: dict(values) for key, values in self._counters.items()}
+            latency = {key: sorted(values) for key, values in self._latency.items()}
+
+        result = {}
+        for key, values in counters.items():
+            samples = latency.get(key, [])
+            result[key] = {
+                **values,
+                **{f"p{p}": percentile(samples, p) for p in PERCENTILES},
+            }
+        return result
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        if not summary:
+            return "No routed model calls recorded yet."
+        lines = []
+        for key, entry in sorted(summary.items()):
+            lines.append(
+                f"{key}: calls={entry['calls']:.0f} fallbacks={entry['fallbacks']:.0f} "
+                f"timeouts={entry['timeouts']:.0f} errors={entry['errors']:.0f} "
+                f"p50={entry['p50'] * 1000:.0f}ms p90={entry['p90'] * 1000:.0f}ms "
+                f"tokens={entry['input_tokens']:.0f}/{entry['output_tokens']:.0f} "
+                f"cached={entry['cached_tokens']:.0f} "
+                f"cost=${entry['cost_usd']:.5f}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latency.clear()
+            self._counters.clear()
+
+
+class ModelRouter:
+    """Selects a model per agent and turn type"""
+
+    def __init__(
+        self,
+        model_factory: Callable[[str], Model],
+        models: Dict[str, str] | None = None,
+        routes: Dict[Tuple[str, str], str] | None = None,
+        timeout: float = 20.0,
+        prices: Dict[str, Tuple[float, float]] | None = None,
+    ):
+        self._model_factory = model_factory
+        self.models = {**DEFAULT_MODELS, **(models or {})}
+        self.routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.timeout = timeout
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+        self.metrics = RouteMetrics()
+        self._model_cache: Dict[str, Model] = {}
+
+    @classmethod
+    def from_env(cls, model_factory: Callable[[str], Model]) -> "ModelRouter":
+        models = {}
+        if os.getenv("YOURTEACHER_MODEL_FAST"):
+            models[FAST] = os.environ["YOURTEACHER_MODEL_FAST"]
+        if os.getenv("YOURTEACHER_MODEL_STRONG"):
+            models[STRONG] = os.environ["YOURTEACHER_MODEL_STRONG"]
+
+        routes = {}
+        for entry in os.getenv("YOURTEACHER_MODEL_ROUTES", "").split(","):
+            if "=" not in entry:
+                continue
+            key, target = entry.split("=", 1)
+            agent_key, _, turn_type = key.strip().partition(".")
+            routes[(agent_key, turn_type or "*")] = target.strip()
+
+        prices = {
+            model: tuple(values)
+            for model, values in json.loads(os.getenv("YOURTEACHER_MODEL_PRICES", "{}")).items()
+        }
+        timeout = float(os.getenv("YOURTEACHER_MODEL_TIMEOUT", "20"))
+        return cls(model_factory, models=models, routes=routes, timeout=timeout, prices=prices)
+
+    def _resolve(self, target: str) -> str:
+        return self.models.get(target, target)
+
+    def select(self, agent_key: str, turn_type: str) -> Route:
+        for key in ((agent_key, turn_type), (agent_key, "*"), ("*", turn_type), ("*", "*")):
+            if key in self.routes:
+                target = self.routes[key]
+                break
+        model = self._resolve(target)
+
+        if target == FAST:
+            fallback = self.models[STRONG]
+        elif target == STRONG:
+            fallback = self.models[FAST]
+        else:
+            fallback = self.models[STRONG]
+        return Route(
+            name=f"{agent_key}.{turn_type}",
+            model=model,
+            fallback_model=fallback if fallback != model else None,
+            timeout=self.timeout,
+        )
+
+    def get_model(self, model_name: str) -> Model:
+        if model_name not in self._model_cache:
+            self._model_cache[model_name] = self._model_factory(model_name)
+        return self._model_cache[model_name]
+
+    def model_for(self, agent_key: str) -> "RoutedModel":
+        return RoutedModel(self, agent_key)
+
+    @contextmanager
+    def bind(self, context: Any) -> Iterator[List[str]]:
+        """Bind a session context so routed models can classify its turns
+
+        Yields the list of models the calls of runs started inside go to
+        (the fallback model for a call that fell back), for turn telemetry;
+        the SDK's run task sees the binding it was started with.
+        """
+        models: List[str] = []
+        token = _bound_context.set(context)
+        models_token = _bound_models.set(models)
+        try:
+            yield models
+        finally:
+            _bound_models.reset(models_token)
+            _bound_context.reset(token)
+
+
+def _called(model: str) -> None:
+    """Note that a call of the bound run goes to ``model``"""
+    models = _bound_models.get()
+    if models is not None:
+        models.append(model)
+
+
+_GET_RESPONSE = inspect.signature(Model.get_response)
+_STREAM_RESPONSE = inspect.signature(Model.stream_response)
+
+
+class RoutedModel(Model):
+    """A Model that delegates each call to the route chosen for its agent"""
+
+    def __init__(self, router: ModelRouter, agent_key: str):
+        self.router = router
+        self.agent_key = agent_key
+
+    @property
+    def model(self) -> str:
+        """Model name of the agent's default route
+
+        One RoutedModel serves every session, so the route of a call is
+        chosen per call; turn telemetry gets it from ``ModelRouter.bind``.
+        """
+        return self.router.select(self.agent_key, "*").model
+
+    def _route(self, input: str | List[Any]) -> Route:
+        route = self.router.select(self.agent_key, classify_turn(self.agent_key, _bound_context.get(), input))
+        _called(route.model)
+        return route
+
+    def _prefix(self, signature: inspect.Signature, system_instructions, input, args, kwargs):
+        """(prefix hash, estimated tokens, args, kwargs) of a call, with the provider cache key set"""
+        call = signature.bind(self, system_instructions, input, *args, **kwargs)
+        key, tokens = prefix_of(system_instructions, call.arguments.get("tools"), call.arguments.get("handoffs"))
+        if cache_key_enabled() and call.arguments.get("model_settings") is not None:
+            call.arguments["model_settings"] = with_cache_key(call.arguments["model_settings"], key)
+        context = _bound_context.get()
+        if session_header_enabled() and call.arguments.get("model_settings") is not None \
+                and getattr(context, "session_id", None):
+            settings = call.arguments["model_settings"]
+            call.arguments["model_settings"] = dataclasses.replace(
+                settings, extra_headers={**(settings.extra_headers or {}), SESSION_HEADER: context.session_id})
+        return key, tokens, call.args[3:], call.kwargs
+
+    async def get_response(self, system_instructions, input, *args, **kwargs):
+        route = self._route(input)
+        key, tokens, args, kwargs = self._prefix(_GET_RESPONSE, system_instructions, input, args, kwargs)
+        prefix_registry.observe(key, self.agent_key, route.model, tokens)
+        metrics = self.router.metrics
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self.router.get_model(route.model).get_response(
+                    system_instructions, input, *args, **kwargs),
+                timeout=route.timeout)
+        except asyncio.TimeoutError:
+            metrics.record(route.name, route.model, time.perf_counter() - started,
+                           prices=self.router.prices, timed_out=True)
+            if route.fallback_model is None:
+                raise
+        except Exception:
+            metrics.record(route.name, route.model, time.perf_counter() - started,
+                           prices=self.router.prices, error=True)
+            raise
+        else:
+            metrics.record(route.name, route.model, time.perf_counter() - started,
+                           usage=response.usage, prices=self.router.prices)
+            prefix_registry.record_usage(key, route.model, response.usage)
+            return response
+
+        prefix_registry.observe(key, self.agent_key, route.fallback_model, tokens)
+        _called(route.fallback_model)
+        started = time.perf_counter()
+        response = await self.router.get_model(route.fallback_model).get_response(
+            system_instructions, input, *args, **kwargs)
+        metrics.record(route.name, route.fallback_model, time.perf_counter() - started,
+                       usage=response.usage, prices=self.router.prices, fallback=True)
+        prefix_registry.record_usage(key, route.fallback_model, response.usage)
+        return response
+
+    async def stream_response(self, system_instructions, input, *args, **kwargs) -> AsyncIterator[Any]:
+        """
+        Stream from the primary model, switching to the fallback model only if
+        the primary produces no event within the route timeout.
+        """
+        route = self._route(input)
+        key, tokens, args, kwargs = self._prefix(_STREAM_RESPONSE, system_instructions, input, args, kwargs)
+        metrics = self.router.metrics
+        started = time.perf_counter()
+        model_name = route.model
+        fallback = False
+        prefix_registry.observe(key, self.agent_key, model_name, tokens)
+        stream = self.router.get_model(model_name).stream_response(
+            system_instructions, input, *args, **kwargs)
+
+        first: List[Any] = []  # the primary's first event, once it arrived in time
+        try:
+            first.append(await asyncio.wait_for(stream.__anext__(), timeout=route.timeout))
+        except asyncio.TimeoutError:
+            await stream.aclose()
+            metrics.record(route.name, model_name, time.perf_counter() - started,
+                           prices=self.router.prices, timed_out=True)
+            if route.fallback_model is None:
+                raise
+            model_name = route.fallback_model
+            fallback = True
+            _called(model_name)
+            prefix_registry.observe(key, self.agent_key, model_name, tokens)
+            started = time.perf_counter()
+            stream = self.router.get_model(model_name).stream_response(
+                system_instructions, input, *args, **kwargs)
+        except StopAsyncIteration:
+            # An empty stream is still a call of the route
+            metrics.record(route.name, model_name, time.perf_counter() - started, prices=self.router.prices)
+            return
+        except Exception:
+            metrics.record(route.name, model_name, time.perf_counter() - started,
+                           prices=self.router.prices, error=True)
+            raise
+
+        usage = None
+        try:
+            while True:
+                if first:
+                    event = first.pop()
+                else:
+                    # The fallback's first event too: an empty stream ends here, errors are recorded below
+                    try:
+                        event = await stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                if getattr(event, "type", None) == "response.completed":
+                    usage = getattr(event.response, "usage", None)
+                yield event
+        except Exception:
+            metrics.record(route.name, model_name, time.perf_counter() - started,
+                           prices=self.router.prices, fallback=fallback, error=True)
+            raise
+        metrics.record(route.name, model_name, time.perf_counter() - started,
+                       usage=usage, prices=self.router.prices, fallback=fallback)
+        prefix_registry.record_usage(key, model_name, usage)
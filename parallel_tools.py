@@ -0,0 +1,311 @@
+"""
+Concurrent tool calls with ordered context merging.
+
+When one model response asks for several tool calls (the screener running
+``cognitive_assessment_tool`` for each assessment type, the quiz agent
+grading several answers with ``evaluate_quiz_response``), the SDK starts
+them together, in call order. Tools change the StudentLearningContext
+directly, so tools that wait on I/O would interleave their changes, and
+appends (``_quiz_results``) would land in completion order.
+
+Every FunctionTool is therefore wrapped by ``ordered_tool``: each call runs
+on its own copy of the context, and when it finishes it waits for the calls
+before it and merges what it changed into the real context (with
+``context_access.rebase``, see context_access.py):
+
+* lists a call edits item-wise (appends to ``_quiz_results``, marking a
+  question of ``_quiz_questions`` answered) are merged item by item, so the
+  edits of sibling calls are all kept, in call order;
+* any other changed value is replaced, the last call in call order winning.
+
+A copy taken when the call starts does not see what earlier siblings write,
+so tools declare the context fields they read, write (replace) and edit
+(``ToolFields``, from ``function_tool_spec`` in main.py). A call that reads
+a field an earlier sibling writes or edits, or edits a list an earlier
+sibling replaces, waits for that sibling to be merged before it takes its
+copy (``calculate_quiz_score`` after ``evaluate_quiz_response``,
+``generate_personalized_content`` after ``set_learning_topic``). With that,
+the result is the same as running the calls one after another in call
+order; tools that declare nothing wait for every earlier sibling.
+
+With ``YOURTEACHER_PARALLEL_TOOLS=0`` the calls of one context run one at a
+time instead. An agent can also ask the model for parallel calls with
+``parallel_tool_calls = true`` in the agent graph.
+
+Usage:
+    python parallel_tools.py bench --io 0.2 --latency 0.3
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable
+
+from context_access import context_access
+
+
+def parallel_tools_enabled() -> bool:
+    return os.getenv("YOURTEACHER_PARALLEL_TOOLS", "1").lower() not in ("0", "false", "no")
+
+
+@dataclass(frozen=True)
+class ToolFields:
+    """Context fields a tool reads, writes (replaces) and edits item by item (lists)"""
+    reads: FrozenSet[str] = frozenset()
+    writes: FrozenSet[str] = frozenset()
+    edits: FrozenSet[str] = frozenset()
+    declared: bool = True
+
+    @classmethod
+    def of(cls, reads: Iterable[str] = (), writes: Iterable[str] = (), edits: Iterable[str] = ()) -> ToolFields:
+        return cls(frozenset(reads), frozenset(writes), frozenset(edits))
+
+    def depends_on(self, earlier: ToolFields) -> bool:
+        """Whether a call must see the changes of an ``earlier`` sibling before it starts"""
+        if not (self.declared and earlier.declared):
+            return True
+        return bool(self.reads & (earlier.writes | earlier.edits) or self.edits & earlier.writes)
+
+
+UNDECLARED = ToolFields(declared=False)
+
+
+class ToolMetrics:
+    """Tool calls, how many overlapped a sibling call, waited for one and merge conflicts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "calls": 0, "overlapped": 0, "dependent": 0, "conflicts": 0, "max_concurrency": 0}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def running(self, count: int) -> None:
+        with self._lock:
+            self.counters["max_concurrency"] = max(self.counters["max_concurrency"], count)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+
+tool_metrics = ToolMetrics()
+
+
+class _CallOrder:
+    """Tickets of the tool calls running on one context, released in call order"""
+
+    def __init__(self):
+        self.issued = 0
+        self.next = 0  # earliest ticket still running
+        self.running = 0
+        self._finished: set[int] = set()
+        self._turns: Dict[int, asyncio.Event] = {}
+        self._calls: Dict[int, ToolFields] = {}  # calls not merged yet
+        self._merged: Dict[int, asyncio.Event] = {}
+
+    def ticket(self, fields: ToolFields = UNDECLARED) -> int:
+        self.issued += 1
+        self.running += 1
+        self._calls[self.issued - 1] = fields
+        self._merged[self.issued - 1] = asyncio.Event()
+        return self.issued - 1
+
+    def dependencies(self, ticket: int) -> list[int]:
+        """Earlier calls, not merged yet, whose changes call ``ticket`` must see"""
+        fields = self._calls[ticket]
+        return [earlier for earlier, other in self._calls.items() if earlier < ticket and fields.depends_on(other)]
+
+    async def wait_for(self, tickets: Iterable[int]) -> None:
+        for merged in [self._merged[ticket] for ticket in tickets]:
+            await merged.wait()
+
+    async def wait_turn(self, ticket: int) -> None:
+        """Wait until every earlier call has finished"""
+        if ticket != self.next:
+            await self._turns.setdefault(ticket, asyncio.Event()).wait()
+
+    def finish(self, ticket: int) -> None:
+        self.running -= 1
+        self._calls.pop(ticket, None)
+        self._merged.pop(ticket).set()
+        self._finished.add(ticket)
+        while self.next in self._finished:
+            self._finished.discard(self.next)
+            self._turns.pop(self.next, None)
+            self.next += 1
+        if self.next in self._turns:
+            self._turns[self.next].set()
+
+    @property
+    def idle(self) -> bool:
+        return self.next == self.issued
+
+
+# Per context object; an entry lives only while calls on that context run
+_orders: Dict[int, _CallOrder] = {}
+
+
+def ordered_tool(tool: Any, fields: ToolFields = UNDECLARED) -> Any:
+    """Run ``tool`` on a copy of the context and merge its changes in call order"""
+    invoke = tool.on_invoke_tool
+
+    async def on_invoke_tool(tool_context: Any, arguments: str) -> Any:
+        context = tool_context.context
+        order = _orders.setdefault(id(context), _CallOrder())
+        ticket = order.ticket(fields)
+        tool_metrics.incr("calls")
+        try:
+            if not parallel_tools_enabled():
+                await order.wait_turn(ticket)
+            else:
+                dependencies = order.dependencies(ticket)
+                if dependencies:
+                    tool_metrics.incr("dependent")
+                    await order.wait_for(dependencies)
+                if order.running > 1:
+                    tool_metrics.incr("overlapped")
+                    tool_metrics.running(order.running)
+            before, _ = context_access.read(context)
+            after = before.model_copy(deep=True)
+            view = copy.copy(tool_context)
+            view.context = after
+            result = await invoke(view, arguments)
+            await order.wait_turn(ticket)
+            change = context_access.rebase(context, before, after, replace=fields.writes)
+            tool_metrics.incr("conflicts", change.conflicts)
+            return result
+        finally:
+            order.finish(ticket)
+            if order.idle:
+                _orders.pop(id(context), None)
+
+    tool.on_invoke_tool = on_invoke_tool
+    return tool
+
+
+# BENCHMARK
+
+SCREENING_MESSAGE = "Here are my answers to the four assessment questions."
+ASSESSMENT_TYPES = ["logical_reasoning", "memory", "problem_solving", "comprehension"]
+QUIZ_ANSWERS = ["B", "A", "C", "A", "B"]
+QUIZ_MESSAGE = "My answers: " + ", ".join(f"{n}: {a}" for n, a in enumerate(QUIZ_ANSWERS, 1))
+
+
+def batch_responder(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Fake tutor that asks for all tool calls of a turn in one response"""
+    messages = request.get("messages", [])
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    text = messages[last_user].get("content") if last_user >= 0 else ""
+    if any(m.get("role") == "tool" for m in messages[last_user + 1:]):
+        return {"content": "Thanks, here is how you did."}
+    if text == SCREENING_MESSAGE:
+        return {"content": "", "tool_calls": [
+            {"name": "cognitive_assessment_tool", "arguments": {
+                "assessment_type": kind, "student_response": "First I would check each step, then the next."}}
+            for kind in ASSESSMENT_TYPES]}
+    if text == QUIZ_MESSAGE:
+        return {"content": "", "tool_calls": [
+            {"name": "evaluate_quiz_response", "arguments": {
+                "question_number": number, "student_answer": answer, "correct_answer": "A"}}
+            for number, answer in enumerate(QUIZ_ANSWERS, 1)]}
+    return {"content": "Hello!"}
+
+
+def _slow_tools(io: float) -> None:
+    """Make every tool wait ``io`` seconds (±50%) first, like a database or API call"""
+    import functools
+    import random
+
+    import main
+
+    def slow(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            await asyncio.sleep(io * random.uniform(0.5, 1.5))
+            return await fn(*args, **kwargs)
+        return wrapper
+
+    for name, (fn, description) in list(main._TOOL_SPECS.items()):
+        main._TOOL_SPECS[name] = (slow(fn), description)
+
+
+def benchmark(io: float, latency: float, repeats: int) -> None:
+    """Screening and quiz grading turn latency with serialized and with concurrent tool calls"""
+    import json
+    import time
+
+    from stub_model_server import StubModelServer
+    from telemetry import percentile
+
+    # The wrapped tools record into the imported module's metrics, not __main__'s
+    from parallel_tools import tool_metrics
+
+    _slow_tools(io)
+
+    async def run():
+        from main import call_tool
+        from session_runtime import CHANNEL_AGENTS, SessionRuntime
+
+        runtime = SessionRuntime()
+        runtime.configure_hibernation(None)
+        results: Dict[str, Dict[str, list]] = {}
+        for label, enabled in (("serialized", "0"), ("parallel", "1")):
+            os.environ["YOURTEACHER_PARALLEL_TOOLS"] = enabled
+            seconds = results[label] = {"screening": [], "quiz": []}
+            for number in range(repeats):
+                session = runtime.session(f"parallel-{label}-{number}")
+                session.context.current_topic = "photosynthesis"
+                await call_tool("generate_quiz", session.context, difficulty_level="medium",
+                                question_count=len(QUIZ_ANSWERS))
+                for kind, channel, message in (("screening", "screener", SCREENING_MESSAGE),
+                                               ("quiz", "quiz", QUIZ_MESSAGE)):
+                    started = time.perf_counter()
+                    async for _ in session.stream_turn(message, CHANNEL_AGENTS[channel], channel):
+                        pass
+                    seconds[kind].append(time.perf_counter() - started)
+                graded = [row["question"] for row in session.context._quiz_results]
+                answered = all(q["answered"] for q in session.context._quiz_questions)
+                if graded != list(range(1, len(QUIZ_ANSWERS) + 1)) or not answered:
+                    raise AssertionError(f"{label}: quiz results merged out of order: {graded}, answered={answered}")
+        return results
+
+    async def serve():
+        async with StubModelServer(latency=latency, responder=batch_responder) as server:
+            os.environ["YOURTEACHER_MODEL_ENDPOINTS"] = json.dumps([{"name": "stub", "base_url": server.base_url}])
+            os.environ.setdefault("GEMINI_API_KEY", "bench")
+            return await run()
+
+    results = asyncio.run(serve())
+    for label, seconds in results.items():
+        print(f"{label:>10}: " + "   ".join(
+            f"{kind} p50 {percentile(sorted(values), 50) * 1000:6.0f} ms" for kind, values in seconds.items()))
+    for kind in ("screening", "quiz"):
+        speedup = percentile(sorted(results["serialized"][kind]), 50) / percentile(sorted(results["parallel"][kind]), 50)
+        print(f"⚡ {kind}: {speedup:.1f}x faster with concurrent tool calls")
+    stats = tool_metrics.snapshot()
+    print(f"✅ Quiz results merged in call order; {stats['calls']} tool calls, {stats['overlapped']} overlapped, "
+          f"{stats['dependent']} waited for a sibling, {stats['conflicts']} conflicting writes resolved in call order")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Concurrent tool calls with ordered context merging")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Turn latency with serialized and concurrent I/O-bound tool calls")
+    bench.add_argument("--io", type=float, default=0.2, help="Simulated I/O time per tool call")
+    bench.add_argument("--latency", type=float, default=0.3, help="Stub model latency per call")
+    bench.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.io, args.latency, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
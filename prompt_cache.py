@@ -0,0 +1,203 @@
+"""
+Prompt prefix caching.
+
+Every model call of an agent starts with the same static prefix: the system
+instructions (``RECOMMENDED_PROMPT_PREFIX`` plus the agent's instructions
+from the agent graph) and the tool and handoff schemas. Only the
+conversation after it differs between students and turns. Providers cache
+such prefixes (OpenAI and compatible providers above 1024 tokens, Gemini 2.5
+implicitly), which cuts time to first token and input cost, as long as the
+prefix stays byte-identical from call to call.
+
+The model router hashes the prefix of every call into ``prefix_registry``,
+so prefixes that churn (a guarded handoff shown or hidden, an edited agent
+graph) show up as several prefixes for one agent, and records the cached
+input tokens the provider reports next to the uncached ones, per prefix,
+per route (model_routing.py) and per turn (the ``turn`` rows of a session
+transcript). With ``YOURTEACHER_PROMPT_CACHE_KEY=1`` the prefix hash is also
+sent as ``prompt_cache_key``, so every student's calls with one prefix share
+a provider cache instead of getting one cache per run.
+
+Usage:
+    python prompt_cache.py bench --students 20
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+PROMPT_CACHE_KEY_FIELD = "prompt_cache_key"
+MAX_PREFIXES = 256  # least recently used prefixes beyond this are forgotten
+CHARS_PER_TOKEN = 4  # rough size of a token in English text, for prefix estimates
+
+
+def cache_key_enabled() -> bool:
+    return os.getenv("YOURTEACHER_PROMPT_CACHE_KEY", "").lower() in ("1", "true", "yes")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def _tool_schemas(tools: List[Any] | None, handoffs: List[Any] | None) -> List[Any]:
+    schemas = [
+        [getattr(tool, "name", type(tool).__name__), getattr(tool, "description", ""),
+         getattr(tool, "params_json_schema", None)]
+        for tool in tools or []
+    ]
+    schemas += [
+        [handoff.tool_name, handoff.tool_description, handoff.input_json_schema]
+        for handoff in handoffs or []
+    ]
+    return schemas
+
+
+def prefix_of(system_instructions: str | None, tools: List[Any] | None, handoffs: List[Any] | None) -> Tuple[str, int]:
+    """(hash, estimated tokens) of the static prefix of a model call"""
+    text = json.dumps([system_instructions or "", _tool_schemas(tools, handoffs)],
+                      sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16], estimate_tokens(text)
+
+
+def with_cache_key(model_settings: Any, key: str) -> Any:
+    """``model_settings`` with ``key`` as the provider prompt cache key (unless one is set)"""
+    extra_args = dict(model_settings.extra_args or {})
+    if PROMPT_CACHE_KEY_FIELD in extra_args or PROMPT_CACHE_KEY_FIELD in (model_settings.extra_body or {}):
+        return model_settings
+    extra_args[PROMPT_CACHE_KEY_FIELD] = f"yourteacher-{key}"
+    return dataclasses.replace(model_settings, extra_args=extra_args)
+
+
+def cached_tokens(usage: Any) -> int:
+    """Input tokens the provider served from its prompt cache (0 if it does not say)"""
+    details = getattr(usage, "input_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+class PrefixRegistry:
+    """Static prefixes seen per (agent, model), with provider cache hits"""
+
+    def __init__(self, max_prefixes: int = MAX_PREFIXES):
+        self._lock = threading.Lock()
+        self._max_prefixes = max_prefixes
+        self._prefixes: OrderedDict[Tuple[str, str], Dict[str, Any]] = OrderedDict()
+
+    def observe(self, key: str, agent: str, model: str, tokens: int) -> bool:
+        """Record a call with prefix ``key``; True if the prefix was sent to ``model`` before"""
+        with self._lock:
+            entry = self._prefixes.get((key, model))
+            if entry is None:
+                entry = self._prefixes[(key, model)] = {
+                    "agent": agent, "model": model, "prefix_tokens": tokens, "calls": 0,
+                    "input_tokens": 0, "cached_tokens": 0, "first_seen": time.time()}
+                while len(self._prefixes) > self._max_prefixes:
+                    self._prefixes.popitem(last=False)
+            self._prefixes.move_to_end((key, model))
+            entry["calls"] += 1
+            return entry["calls"] > 1
+
+    def record_usage(self, key: str, model: str, usage: Any) -> None:
+        if usage is None:
+            return
+        with self._lock:
+            entry = self._prefixes.get((key, model))
+            if entry is not None:
+                entry["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+                entry["cached_tokens"] += cached_tokens(usage)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per prefix: agent, model, estimated size, calls and cached share of input tokens"""
+        with self._lock:
+            entries = {f"{key} {model}": dict(entry) for (key, model), entry in self._prefixes.items()}
+        for entry in entries.values():
+            entry["cached_share"] = entry["cached_tokens"] / entry["input_tokens"] if entry["input_tokens"] else 0.0
+        return entries
+
+    def prefixes_per_agent(self) -> Dict[str, int]:
+        """Distinct prefixes sent per agent; more than one per model means the prefix churns"""
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for (_, model), entry in self._prefixes.items():
+                name = f"{entry['agent']} | {model}"
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        if not summary:
+            return "No model calls recorded yet."
+        return "\n".join(
+            f"{entry['agent']} | {entry['model']} [{name.split()[0]}]: ~{entry['prefix_tokens']} prefix tokens, "
+            f"calls={entry['calls']} cached={entry['cached_tokens']}/{entry['input_tokens']} "
+            f"({entry['cached_share']:.0%})"
+            for name, entry in sorted(summary.items(), key=lambda item: item[1]["agent"]))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._prefixes.clear()
+
+
+prefix_registry = PrefixRegistry()
+
+
+# BENCHMARK
+
+def benchmark(students: int, latency: float) -> None:
+    """Run screener → teaching turns for ``students`` against a stub model that caches prefixes"""
+    import asyncio
+
+    from stub_model_server import StubModelServer
+
+    # The router records into the imported module's registry, not __main__'s
+    from prompt_cache import prefix_registry
+
+    async def run():
+        async with StubModelServer(latency=latency, prefix_cache=True) as server:
+            os.environ["YOURTEACHER_MODEL_ENDPOINTS"] = json.dumps(
+                [{"name": "stub", "base_url": server.base_url}])
+            os.environ.setdefault("GEMINI_API_KEY", "bench")
+            from session_runtime import SessionRuntime
+
+            runtime = SessionRuntime()
+            runtime.configure_hibernation(None)
+            turns = []
+            for number in range(students):
+                session = runtime.session(f"prefix-bench-{number}")
+                for message, agent_key in (("Hello! I'm ready to start.", "screener"),
+                                           ("Can you explain fractions?", "teaching")):
+                    async for _ in session.stream_turn(message, agent_key):
+                        pass
+                    turns.append(session.transcript[-1])
+            return turns
+
+    turns = asyncio.run(run())
+    input_tokens = sum(row["input_tokens"] for row in turns)
+    cached = sum(row["cached_tokens"] for row in turns)
+    print(prefix_registry.format_summary())
+    print(f"📦 {len(turns)} turns: {cached}/{input_tokens} input tokens served from the prefix cache "
+          f"({cached / max(input_tokens, 1):.0%}), {input_tokens - cached} uncached")
+    churn = {agent: count for agent, count in prefix_registry.prefixes_per_agent().items() if count > 1}
+    print(f"{'⚠️ Churning prefixes: ' + str(churn) if churn else '✅ One stable prefix per agent and model'}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prompt prefix caching")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Cached vs uncached prefix tokens against a caching stub model")
+    bench.add_argument("--students", type=int, default=20)
+    bench.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    benchmark(args.students, args.latency)
+
+
+if __name__ == "__main__":
+    main()
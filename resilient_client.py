@@ -0,0 +1,419 @@
+"""
+Resilient model client for YourTeacher.
+
+An ``EndpointPool`` holds several OpenAI-compatible endpoints (e.g. Gemini plus
+a proxy or secondary region). ``ResilientModel`` sends each model call to the
+healthiest endpoint, starts a hedged duplicate on the next endpoint when the
+first has not answered within the hedge delay, fails over on errors and keeps
+a circuit breaker per endpoint. The health table is exposed for the CLI and
+Streamlit sidebar.
+
+Configuration (environment / .env):
+    YOURTEACHER_MODEL_ENDPOINTS  JSON list of {"name", "base_url", "api_key_env"}
+                                 (defaults to the Gemini endpoint with GEMINI_API_KEY)
+    YOURTEACHER_HEDGE_DELAY      seconds before a hedged request is sent (default 3)
+    YOURTEACHER_BREAKER_FAILURES consecutive failures that open a breaker (default 3)
+    YOURTEACHER_BREAKER_RESET    seconds before an open breaker is probed again (default 30)
+
+Run ``python resilient_client.py`` to exercise hedging and failover against
+local stub servers (see stub_model_server.py).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from agents import AsyncOpenAI, Model, OpenAIChatCompletionsModel
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class AllEndpointsFailedError(RuntimeError):
+    """Raised when every configured model endpoint failed or is unavailable"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self._probe_started: float | None = None
+
+    def _admits(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return now - self.opened_at >= self.reset_timeout
+        # A probe that never reported back is retried after another reset period
+        return self._probe_started is None or now - self._probe_started >= self.reset_timeout
+
+    def available(self) -> bool:
+        """Whether a request would be admitted now; unlike ``allow``, claims nothing"""
+        with self._lock:
+            return self._admits(self._clock())
+
+    @property
+    def probe_due(self) -> bool:
+        """Open, and the next request admitted would be the half-open probe"""
+        return self.state != CLOSED and self.available()
+
+    def allow(self) -> bool:
+        """Admit a request about to be sent; the half-open probe is admitted once"""
+        with self._lock:
+            now = self._clock()
+            if not self._admits(now):
+                return False
+            if self.state != CLOSED:
+                self.state = HALF_OPEN
+                self._probe_started = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = self._clock()
+            self._probe_started = None
+
+
+@dataclass
+class EndpointConfig:
+    name: str
+    base_url: str
+    api_key: str | None = None
+
+
+class Endpoint:
+    """One OpenAI-compatible endpoint with its breaker and health statistics"""
+
+    def __init__(self, config: EndpointConfig, breaker: CircuitBreaker):
+        self.config = config
+        self.breaker = breaker
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.hedges_won = 0
+        self.latency_ewma: float | None = None
+        self.last_error: str | None = None
+        self._client: AsyncOpenAI | None = None
+        self._models: Dict[str, Model] = {}
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # Retries are handled by the pool, not the OpenAI client
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self.config.api_key or "unused",
+                base_url=self.config.base_url,
+                max_retries=0,
+            )
+        return self._client
+
+    def model(self, model_name: str) -> Model:
+        if model_name not in self._models:
+            self._models[model_name] = OpenAIChatCompletionsModel(
+                model=model_name, openai_client=self.client)
+        return self._models[model_name]
+
+    def record_success(self, latency: float) -> None:
+        self.successes += 1
+        self.latency_ewma = latency if self.latency_ewma is None else (
+            0.8 * self.latency_ewma + 0.2 * latency)
+        self.breaker.record_success()
+
+    def record_abandoned(self, elapsed: float) -> None:
+        """A hedge loser was cancelled; its latency was at least ``elapsed``"""
+        if self.latency_ewma is None or elapsed > self.latency_ewma:
+            self.latency_ewma = elapsed if self.latency_ewma is None else (
+                0.8 * self.latency_ewma + 0.2 * elapsed)
+
+    def record_failure(self, error: BaseException) -> None:
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"[:200]
+        self.breaker.record_failure()
+
+
+class EndpointPool:
+    """Ordered set of endpoints shared by every ResilientModel"""
+
+    def __init__(self, endpoints: List[EndpointConfig], hedge_delay: float = 3.0,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0):
+        if not endpoints:
+            raise ValueError("At least one model endpoint must be configured")
+        self.hedge_delay = hedge_delay
+        self.endpoints = [
+            Endpoint(config, CircuitBreaker(failure_threshold, reset_timeout))
+            for config in endpoints
+        ]
+        self.hedged_requests = 0
+        self._models: Dict[str, ResilientModel] = {}
+
+    @classmethod
+    def from_env(cls, default_api_key: str | None = None) -> "EndpointPool":
+        raw = os.getenv("YOURTEACHER_MODEL_ENDPOINTS")
+        if raw:
+            endpoints = [
+                EndpointConfig(
+                    name=entry.get("name", entry["base_url"]),
+                    base_url=entry["base_url"],
+                    api_key=os.getenv(entry["api_key_env"]) if entry.get("api_key_env") else entry.get("api_key"),
+                )
+                for entry in json.loads(raw)
+            ]
+        else:
+            endpoints = [EndpointConfig("gemini", GEMINI_BASE_URL, default_api_key)]
+        return cls(
+            endpoints,
+            hedge_delay=float(os.getenv("YOURTEACHER_HEDGE_DELAY", "3")),
+            failure_threshold=int(os.getenv("YOURTEACHER_BREAKER_FAILURES", "3")),
+            reset_timeout=float(os.getenv("YOURTEACHER_BREAKER_RESET", "30")),
+        )
+
+    def candidates(self) -> List[Endpoint]:
+        """Endpoints whose breaker would admit a request: one due for its probe first, then fastest (by EWMA)
+
+        Nothing is claimed here; the caller claims an endpoint with
+        ``breaker.allow()`` when it actually sends to it. The probe goes first
+        so a recovered endpoint is noticed; hedging and failover cover a slow
+        or failing probe.
+        """
+        available = [endpoint for endpoint in self.endpoints if endpoint.breaker.available()]
+        return sorted(available, key=lambda e: (
+            not e.breaker.probe_due,
+            e.latency_ewma if e.latency_ewma is not None else 0.0,
+        ))
+
+    def get_model(self, model_name: str) -> "ResilientModel":
+        if model_name not in self._models:
+            self._models[model_name] = ResilientModel(self, model_name)
+        return self._models[model_name]
+
+    def health_table(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "endpoint": endpoint.name,
+                "state": endpoint.breaker.state,
+                "requests": endpoint.requests,
+                "successes": endpoint.successes,
+                "failures": endpoint.failures,
+                "consecutive_failures": endpoint.breaker.consecutive_failures,
+                "hedges_won": endpoint.hedges_won,
+                "latency_ewma_ms": round(endpoint.latency_ewma * 1000, 1) if endpoint.latency_ewma is not None else None,
+                "last_error": endpoint.last_error,
+            }
+            for endpoint in self.endpoints
+        ]
+
+    def format_health(self) -> str:
+        lines = [f"Hedged requests: {self.hedged_requests}"]
+        for row in self.health_table():
+            latency = f"{row['latency_ewma_ms']}ms" if row["latency_ewma_ms"] is not None else "n/a"
+            lines.append(
+                f"{row['endpoint']}: {row['state']} requests={row['requests']} "
+                f"ok={row['successes']} failed={row['failures']} "
+                f"hedges_won={row['hedges_won']} latency={latency}"
+                + (f" last_error={row['last_error']}" if row["last_error"] else ""))
+        return "\n".join(lines)
+
+
+UNAVAILABLE = ("All model endpoints are temporarily unavailable (circuit breakers open). "
+               "Please try again in a moment.")
+
+
+class ResilientModel(Model):
+    """Model that hedges and fails over across the endpoints of a pool"""
+
+    def __init__(self, pool: EndpointPool, model_name: str):
+        self.pool = pool
+        self.model = model_name
+
+    def _candidates(self) -> List[Endpoint]:
+        candidates = self.pool.candidates()
+        if not candidates:
+            raise AllEndpointsFailedError(UNAVAILABLE)
+        return candidates
+
+    async def _race(self, start: Callable[[Endpoint], Any],
+                    discard: Callable[[Any], None] | None = None) -> tuple[Endpoint, Any]:
+        """
+        Start ``start(endpoint)`` on the best endpoint, hedging onto the next one
+        after ``hedge_delay`` and failing over on errors. Returns the first success;
+        ``discard`` releases any other success that finished at the same time.
+        """
+        candidates = self._candidates()
+        pending: Dict[asyncio.Task, Endpoint] = {}
+        hedges: List[Endpoint] = []
+        errors: List[str] = []
+        next_index = 0
+
+        def launch(hedge: bool = False) -> bool:
+            nonlocal next_index
+            while next_index < len(candidates):
+                endpoint = candidates[next_index]
+                next_index += 1
+                if not endpoint.breaker.allow():
+                    continue  # another call claimed its half-open probe meanwhile
+                endpoint.requests += 1
+                if hedge:
+                    hedges.append(endpoint)
+                pending[asyncio.ensure_future(start(endpoint))] = endpoint
+                return True
+            return False
+
+        if not launch():
+            raise AllEndpointsFailedError(UNAVAILABLE)
+        try:
+            while pending:
+                can_hedge = next_index < len(candidates)
+                done, _ = await asyncio.wait(
+                    pending, timeout=self.pool.hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch(hedge=True):
+                        self.pool.hedged_requests += 1
+                    continue
+
+                for task in done:
+                    endpoint = pending.pop(task)
+                    if task.exception() is None:
+                        if endpoint in hedges:
+                            endpoint.hedges_won += 1
+                        return endpoint, task.result()
+                    errors.append(f"{endpoint.name}: {task.exception()}")
+
+                if not pending and next_index < len(candidates):
+                    launch()
+        finally:
+            for task in pending:
+                if discard is not None and task.done() and not task.cancelled() and task.exception() is None:
+                    discard(task.result())
+                task.cancel()
+            # Let losers unwind before their streams are closed
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        raise AllEndpointsFailedError("All model endpoints failed: " + "; ".join(errors))
+
+    async def get_response(self, *args, **kwargs):
+        async def call(endpoint: Endpoint):
+            started = time.perf_counter()
+            try:
+                response = await endpoint.model(self.model).get_response(*args, **kwargs)
+            except asyncio.CancelledError:
+                endpoint.record_abandoned(time.perf_counter() - started)
+                raise
+            except Exception as e:
+                endpoint.record_failure(e)
+                raise
+            endpoint.record_success(time.perf_counter() - started)
+            return response
+
+        _, response = await self._race(call)
+        return response
+
+    async def stream_response(self, *args, **kwargs) -> AsyncIterator[Any]:
+        """Hedge on the first streamed event; after that the winning stream is kept"""
+        done = object()
+
+        async def pump(endpoint: Endpoint, queue: asyncio.Queue) -> None:
+            # Each stream is iterated by a single task so its tracing context stays valid
+            try:
+                async for event in endpoint.model(self.model).stream_response(*args, **kwargs):
+                    await queue.put(event)
+            except Exception as e:
+                await queue.put(e)
+            else:
+                await queue.put(done)
+
+        async def first_event(endpoint: Endpoint):
+            queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+            task = asyncio.ensure_future(pump(endpoint, queue))
+            started = time.perf_counter()
+            try:
+                event = await queue.get()
+            except asyncio.CancelledError:
+                task.cancel()
+                endpoint.record_abandoned(time.perf_counter() - started)
+                raise
+            if isinstance(event, Exception):
+                endpoint.record_failure(event)
+                raise event
+            return task, queue, event, started
+
+        def discard(result) -> None:
+            result[0].cancel()  # the pump of a stream that answered as fast as the winner
+
+        endpoint, (task, queue, event, started) = await self._race(first_event, discard)
+        try:
+            while event is not done:
+                if isinstance(event, Exception):
+                    endpoint.record_failure(event)
+                    raise event
+                yield event
+                event = await queue.get()
+        finally:
+            task.cancel()
+        endpoint.record_success(time.perf_counter() - started)
+
+
+async def _demo() -> None:
+    """Exercise hedging and failover against three local stub servers"""
+    from agents import ModelSettings, ModelTracing
+    from stub_model_server import StubModelServer
+
+    async with StubModelServer(latency=2.0) as slow, \
+            StubModelServer(error_rate=1.0) as failing, \
+            StubModelServer(latency=0.05) as healthy:
+        pool = EndpointPool(
+            [
+                EndpointConfig("slow", slow.base_url),
+                EndpointConfig("failing", failing.base_url),
+                EndpointConfig("healthy", healthy.base_url),
+            ],
+            hedge_delay=0.25,
+            failure_threshold=2,
+            reset_timeout=60,
+        )
+        model = pool.get_model("stub-model")
+        for i in range(6):
+            started = time.perf_counter()
+            kwargs = dict(previous_response_id=None, conversation_id=None, prompt=None)
+            response = await model.get_response(
+                "You are a tutor.", f"Question {i}", ModelSettings(), [], None, [],
+                ModelTracing.DISABLED, **kwargs)
+            text = response.output[0].content[0].text
+            print(f"Call {i}: {time.perf_counter() - started:.2f}s -> {text}")
+        print()
+        print(pool.format_health())
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
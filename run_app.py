@@ -1,49 +1,327 @@
 #!/usr/bin/env python3
 """
 Script to run the YourTeacher Streamlit application
+
+The launcher manages one app process. The app process warms up (SDK import,
+agent graph, model clients) before Streamlit starts serving, and answers
+health checks on ``--health-port``:
+
+* ``GET /livez``: the process and the Streamlit server respond
+* ``GET /readyz``: warm-up finished, Streamlit is serving and no drain has
+  started (503 otherwise); the body reports startup timings
+* ``POST /drain``: refuse new agent turns and wait for running ones
+
+The launcher restarts the app when it exits or stops answering ``/livez``,
+except when it exits with EXIT_CONFIG (e.g. GEMINI_API_KEY is not set),
+which no restart can fix. On SIGTERM or Ctrl+C it drains in-flight agent
+turns (up to ``--drain-timeout`` seconds) before stopping the app.
+
+Usage:
+    python run_app.py
+    python run_app.py --app frontend.py --port 8501 --health-port 8502
 """
 
+import json
+import os
+import signal
 import subprocess
 import sys
-import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_STARTED = time.perf_counter()
+
+LIVENESS_INTERVAL = 5.0  # seconds between liveness checks by the launcher
+LIVENESS_FAILURES = 3  # consecutive failed checks before the app is restarted
+RESTART_BACKOFF = (1.0, 30.0)  # first and longest delay between restarts
+EXIT_CONFIG = 78  # sysexits EX_CONFIG: the app is misconfigured, restarting will not help
+
+
+def _local_host(address):
+    """Host to reach a server bound to ``address`` from this machine"""
+    return "127.0.0.1" if address in ("", "0.0.0.0", "::") else address
+
+
+def _json(data):
+    try:
+        return json.loads(data or b"{}")
+    except ValueError:
+        return {}  # Streamlit's own health endpoint answers plain "ok"
+
+
+def _get(url, timeout=2.0, method="GET"):
+    """(status, JSON body) of a local health endpoint; status 0 if unreachable"""
+    request = urllib.request.Request(url, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, _json(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, _json(e.read())
+    except OSError:
+        return 0, {}
+
+
+# APP PROCESS
+
+class AppState:
+    """Startup phases and health of the app process"""
+
+    def __init__(self, address, port):
+        self.address = address
+        self.port = port
+        self.phases = {}
+        self.warm = False
+        self.serving = False
+        self.draining = False
+        self.last_phase = _STARTED
+
+    def phase(self, name):
+        now = time.perf_counter()
+        self.phases[name] = round(now - self.last_phase, 3)
+        self.last_phase = now
+
+    def streamlit_healthy(self):
+        status, _ = _get(f"http://{_local_host(self.address)}:{self.port}/_stcore/health")
+        return status == 200
+
+    def live(self):
+        if not self.warm:
+            return True  # still starting
+        from session_runtime import runtime
+
+        if runtime._loop is not None:
+            import asyncio
+
+            # A blocked runtime loop would hang every turn
+            try:
+                asyncio.run_coroutine_threadsafe(asyncio.sleep(0), runtime._loop).result(2.0)
+            except TimeoutError:
+                return False
+        return not self.serving or self.streamlit_healthy()
+
+    def ready(self):
+        return self.warm and self.serving and not self.draining
+
+
+def warm_up(state):
+    """Import the SDK and build the agent graph and model clients before serving"""
+    import main
+
+    state.phase("imports")
+    if not main.load_settings()["gemini_api_key"]:
+        # The model router needs the default client, which needs the key
+        print("❌ GEMINI_API_KEY is not set. Add it to .env (see .env.example) and start again.", flush=True)
+        sys.exit(EXIT_CONFIG)
+    main.get_model_router()
+    main.agent_registry.entry()
+    state.phase("agents")
+    main.get_external_client()
+    from session_runtime import runtime
+
+    runtime.loop  # starts the event loop thread turns run on
+    state.phase("clients")
+    state.warm = True
+
+
+def health_server(state, address, port):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/livez":
+                live = state.live()
+                self._reply(200 if live else 503, {"live": live})
+            elif self.path == "/readyz":
+                ready = state.ready()
+                self._reply(200 if ready else 503, {
+                    "ready": ready, "warm": state.warm, "serving": state.serving,
+                    "draining": state.draining, "startup_seconds": state.phases})
+            else:
+                self._reply(404, {})
+
+        def do_POST(self):
+            if not self.path.startswith("/drain"):
+                self._reply(404, {})
+                return
+            from urllib.parse import parse_qs, urlparse
+
+            from session_runtime import turn_gate
+
+            timeout = float(parse_qs(urlparse(self.path).query).get("timeout", ["30"])[0])
+            state.draining = True
+            started = time.perf_counter()
+            remaining = turn_gate.drain(timeout)
+            self._reply(200, {"drained": remaining == 0, "inflight": remaining,
+                              "seconds": round(time.perf_counter() - started, 3)})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    threading.Thread(target=server.serve_forever, name="health", daemon=True).start()
+    return server
+
+
+def run_app_process(app_path, port, address, health_port):
+    """Warm up, then run Streamlit in this process (the launcher's child)"""
+    from streamlit.web import bootstrap
+
+    state = AppState(address, port)
+    health_server(state, address, health_port)
+    warm_up(state)
+
+    def wait_until_serving():
+        while not state.streamlit_healthy():
+            time.sleep(0.1)
+        state.phase("server")
+        state.serving = True
+        total = sum(state.phases.values())
+        steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in state.phases.items())
+        print(f"✅ Ready in {total:.2f}s ({steps})", flush=True)
+
+    flags = {
+        "server_port": port,
+        "server_address": address,
+        "server_headless": True,
+        "browser_gatherUsageStats": False,
+    }
+    bootstrap.load_config_options(flag_options=flags)  # as `streamlit run` does before bootstrap.run
+    threading.Thread(target=wait_until_serving, name="startup", daemon=True).start()
+    bootstrap.run(app_path, False, [], flags)
+
+
+# LAUNCHER
+
+class Launcher:
+    """Runs the app process, restarts it when it dies or hangs, drains it on shutdown"""
+
+    def __init__(self, args):
+        self.args = args
+        self.health_url = f"http://{_local_host(args.address)}:{args.health_port}"
+        self.process = None
+        self.stopping = threading.Event()
+        self.config_error = False
+
+    def spawn(self):
+        self.process = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "--app-process",
+            "--app", self.args.app, "--port", str(self.args.port), "--address", self.args.address,
+            "--health-port", str(self.args.health_port),
+        ], start_new_session=True)  # Ctrl+C reaches only the launcher, which drains first
+        self.spawned = time.perf_counter()
+
+    def wait_ready(self):
+        while not self.stopping.is_set() and self.process.poll() is None:
+            status, body = _get(f"{self.health_url}/readyz")
+            if status == 200:
+                print(f"🌐 Serving http://{self.args.address}:{self.args.port} "
+                      f"({time.perf_counter() - self.spawned:.2f}s after launch, "
+                      f"health on port {self.args.health_port})")
+                return True
+            time.sleep(0.2)
+        return False
+
+    def supervise(self):
+        delay = RESTART_BACKOFF[0]
+        while not self.stopping.is_set():
+            self.spawn()
+            if self.wait_ready():
+                delay = RESTART_BACKOFF[0]
+            failures = 0
+            while not self.stopping.wait(LIVENESS_INTERVAL) and self.process.poll() is None:
+                status, _ = _get(f"{self.health_url}/livez")
+                failures = 0 if status == 200 else failures + 1
+                if failures >= LIVENESS_FAILURES:
+                    print("⚠️ App not responding to liveness checks, restarting")
+                    self.process.kill()
+                    break
+            if self.stopping.is_set():
+                return
+            self.process.wait()
+            if self.process.returncode == EXIT_CONFIG:
+                print("❌ App configuration error, not restarting")
+                self.config_error = True
+                self.stopping.set()
+                return
+            print(f"⚠️ App exited with {self.process.returncode}, restarting in {delay:.0f}s")
+            if self.stopping.wait(delay):
+                return
+            delay = min(delay * 2, RESTART_BACKOFF[1])
+
+    def shutdown(self):
+        """Drain in-flight agent turns, then stop the app"""
+        self.stopping.set()
+        if self.process is None or self.process.poll() is not None:
+            return
+        timeout = self.args.drain_timeout
+        print(f"\n⏳ Draining in-flight agent turns (up to {timeout:.0f}s)...")
+        status, body = _get(f"{self.health_url}/drain?timeout={timeout}", timeout=timeout + 5, method="POST")
+        if status == 200 and body.get("drained"):
+            print(f"✅ Drained in {body['seconds']:.1f}s")
+        elif status == 200:
+            print(f"⚠️ {body['inflight']} turns still running after {timeout:.0f}s")
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        print("🛑 Server stopped")
 
 
 def main():
     """Run the Streamlit application"""
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Run the YourTeacher Streamlit application")
+    parser.add_argument("--app", default=os.path.join(script_dir, "streamlit_app.py"))
+    parser.add_argument("--port", type=int, default=8501)
+    parser.add_argument("--address", default="localhost")
+    parser.add_argument("--health-port", type=int, default=8502)
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="Seconds to wait for in-flight agent turns on shutdown")
+    parser.add_argument("--app-process", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.app_process:
+        run_app_process(args.app, args.port, args.address, args.health_port)
+        return
+
     print("🎓 Starting YourTeacher - AI Learning System")
     print("=" * 50)
 
-    # Check if streamlit is installed
     try:
-        import streamlit
+        import streamlit  # noqa: F401
         print("✅ Streamlit is available")
     except ImportError:
-        print("❌ Streamlit not found. Installing...")
-        subprocess.check_call(
-            [sys.executable, "-m", "pip", "install", "streamlit"])
-        print("✅ Streamlit installed successfully")
-
-    # Get the directory of this script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    app_path = os.path.join(script_dir, "streamlit_app.py")
+        print("❌ Streamlit not found. Install the dependencies first: pip install -e .")
+        sys.exit(1)
 
-    print(f"📂 Running app from: {app_path}")
-    print("🌐 Opening browser...")
+    print(f"📂 Running app from: {args.app}")
     print("💡 Use Ctrl+C to stop the server")
     print("=" * 50)
 
-    # Run streamlit
+    launcher = Launcher(args)
+    signal.signal(signal.SIGTERM, lambda *_: launcher.stopping.set())
+    supervisor = threading.Thread(target=launcher.supervise, name="launcher", daemon=True)
+    supervisor.start()
     try:
-        subprocess.run([
-            sys.executable, "-m", "streamlit", "run", app_path,
-            "--server.port", "8501",
-            "--server.address", "localhost",
-            "--browser.gatherUsageStats", "false"
-        ])
+        while not launcher.stopping.wait(0.5):
+            pass
     except KeyboardInterrupt:
-        print("\n🛑 Server stopped by user")
-    except Exception as e:
-        print(f"❌ Error running Streamlit: {e}")
+        pass
+    launcher.shutdown()
+    if launcher.config_error:
+        sys.exit(EXIT_CONFIG)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,446 @@
+"""
+Columnar export of tutoring sessions for offline evaluation.
+
+Sessions are flattened into two datasets, partitioned by day:
+
+    events/date=YYYY-MM-DD/part-*.parquet    one row per message, tool call,
+                                             tool result, handoff and turn
+    sessions/date=YYYY-MM-DD/part-*.parquet  one profile snapshot per session
+                                             and export
+
+Rows are buffered up to ``batch_rows`` and then written as new, complete part
+files, so memory stays bounded and a running app can export as it goes.
+Exports are incremental: the number of rows already exported per session is
+kept in ``export_state.json`` and only newer rows are written next time
+(``seq`` identifies a row within its session, so consumers can drop the rare
+duplicate written just before a crash or by two workers that both had the
+session). Workers sharing an export directory (supervisor.py) merge their
+counts into the file under a lock, keeping the highest per session.
+
+Formats: Parquet (default) or Arrow IPC with pyarrow; without pyarrow, JSON
+lines compressed with zstandard if installed, otherwise gzip.
+
+Usage:
+    python session_export.py inspect EXPORT_DIR
+    python session_export.py bench --sessions 2000 --format parquet arrow jsonl
+"""
+
+from __future__ import annotations
+
+import atexit
+import gzip
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List
+
+EXPORT_BATCH_ROWS = 50_000
+FORMATS = ("parquet", "arrow", "jsonl")
+STATE_FILE = "export_state.json"
+
+EVENT_FIELDS = (
+    "session_id", "seq", "turn", "ts", "channel", "role", "kind",
+    "agent", "name", "content", "elapsed_ms", "first_token_ms", "input_tokens", "output_tokens",
+    "cached_tokens", "fast_path",
+)
+PROFILE_FIELDS = (
+    "student_name", "age", "grade_level", "cognitive_ability", "learning_style", "learning_pace",
+    "subjects_of_interest", "current_subject", "current_topic", "learning_objectives",
+    "quiz_score", "quiz_total", "quiz_proficiency", "screening_complete", "concept_taught",
+)
+SESSION_FIELDS = ("session_id", "exported_at", "events", "turns") + PROFILE_FIELDS
+
+
+def _arrow_schemas():
+    import pyarrow as pa
+
+    text = pa.string()
+    events = pa.schema([
+        ("session_id", text), ("seq", pa.int64()), ("turn", pa.int32()), ("ts", pa.timestamp("ms")),
+        ("channel", text), ("role", text), ("kind", text), ("agent", text), ("name", text),
+        ("content", text), ("elapsed_ms", pa.float64()), ("first_token_ms", pa.float64()),
+        ("input_tokens", pa.int64()), ("output_tokens", pa.int64()),
+        ("cached_tokens", pa.int64()), ("fast_path", text),
+    ])
+    sessions = pa.schema([
+        ("session_id", text), ("exported_at", pa.timestamp("ms")), ("events", pa.int64()), ("turns", pa.int32()),
+        ("student_name", text), ("age", pa.int32()), ("grade_level", text), ("cognitive_ability", text),
+        ("learning_style", text), ("learning_pace", text), ("subjects_of_interest", pa.list_(text)),
+        ("current_subject", text), ("current_topic", text), ("learning_objectives", pa.list_(text)),
+        ("quiz_score", pa.int32()), ("quiz_total", pa.int32()), ("quiz_proficiency", pa.int32()),
+        ("screening_complete", pa.bool_()), ("concept_taught", pa.bool_()),
+    ])
+    return {"events": events, "sessions": sessions}
+
+
+def default_format() -> str:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "jsonl"
+    return "parquet"
+
+
+# ROW ADAPTERS
+
+def _row(session_id: str, seq: int, ts: datetime | None, **values) -> Dict[str, Any]:
+    row = dict.fromkeys(EVENT_FIELDS)
+    row.update(session_id=session_id, seq=seq, ts=ts, **values)
+    return row
+
+
+def rows_from_transcript(session_id: str, transcript: List[Dict[str, Any]], start: int = 0) -> Iterator[Dict[str, Any]]:
+    """Rows of a ``session_runtime.TutorSession`` transcript from index ``start``"""
+    for seq in range(start, len(transcript)):
+        entry = transcript[seq]
+        yield _row(
+            session_id, seq, entry["timestamp"],
+            turn=entry.get("turn"), channel=entry.get("channel", ""), role=entry["role"],
+            kind=entry.get("kind", entry["role"]), agent=entry.get("agent", ""),
+            name=entry.get("tool") or entry.get("target"), content=entry["content"],
+            elapsed_ms=entry.get("elapsed_ms"), first_token_ms=entry.get("first_token_ms"),
+            input_tokens=entry.get("input_tokens"), output_tokens=entry.get("output_tokens"),
+            cached_tokens=entry.get("cached_tokens"), fast_path=entry.get("fast_path"),
+        )
+
+
+_HISTORY_ROLES = {"user": "user", "agent": "assistant", "handoff": "event",
+                  "tool_call": "tool", "tool_result": "tool"}
+
+
+def rows_from_history(session_id: str, history: List[Dict[str, Any]], start: int = 0) -> Iterator[Dict[str, Any]]:
+    """Rows of streamlit_app.py's ``conversation_history`` from index ``start``"""
+    for seq in range(start, len(history)):
+        entry = history[seq]
+        kind = entry["type"]
+        yield _row(
+            session_id, seq, entry.get("timestamp"),
+            role=_HISTORY_ROLES.get(kind, "meta"), kind=kind,
+            agent=entry.get("agent_name") or entry.get("source") or "",
+            name=entry.get("target"), content=str(entry.get("content", "")),
+        )
+
+
+def rows_from_input_items(session_id: str, items: List[Dict[str, Any]], start: int = 0) -> Iterator[Dict[str, Any]]:
+    """Rows of an Agents SDK input list (``result.to_input_list()``); no timings"""
+    for seq in range(start, len(items)):
+        item = items[seq]
+        kind = item.get("type", "message")
+        if kind == "function_call":
+            values = dict(role="tool", kind="tool_call", name=item.get("name"), content=item.get("arguments", ""))
+        elif kind == "function_call_output":
+            values = dict(role="tool", kind="tool_result", content=str(item.get("output", "")))
+        else:
+            content = item.get("content", "")
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+            values = dict(role=item.get("role", kind), kind=kind, content=content)
+        yield _row(session_id, seq, None, **values)
+
+
+def profile_snapshot(context: Any) -> Dict[str, Any]:
+    """Profile fields of a StudentLearningContext"""
+    return {name: getattr(context, name, None) for name in PROFILE_FIELDS}
+
+
+# PART WRITERS
+
+class _PartWriter:
+    """Writes one complete part file from a list of row dicts"""
+
+    def __init__(self, fmt: str):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+        self.format = fmt
+        # Imports pyarrow up front rather than on the first flush
+        self._schemas = _arrow_schemas() if fmt != "jsonl" else None
+        if fmt == "jsonl":
+            try:
+                import zstandard
+                self._zstd = zstandard.ZstdCompressor(level=6)
+                self.suffix = ".jsonl.zst"
+            except ImportError:
+                self._zstd = None
+                self.suffix = ".jsonl.gz"
+        else:
+            self.suffix = ".parquet" if fmt == "parquet" else ".arrow"
+
+    def write(self, path: str, dataset: str, rows: List[Dict[str, Any]]) -> None:
+        tmp = path + ".tmp"
+        if self.format == "jsonl":
+            data = "".join(json.dumps(row, default=_json_default, separators=(",", ":")) + "\n" for row in rows)
+            with open(tmp, "wb") as f:
+                f.write(self._zstd.compress(data.encode()) if self._zstd else gzip.compress(data.encode(), compresslevel=6))
+        else:
+            import pyarrow as pa
+
+            table = pa.Table.from_pylist(rows, schema=self._schemas[dataset])
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                pq.write_table(table, tmp, compression="zstd")
+            else:
+                options = pa.ipc.IpcWriteOptions(compression="zstd")
+                with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+        # Readers listing the directory never see a half-written part
+        os.replace(tmp, path)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+# EXPORTER
+
+class SessionExporter:
+    """Incremental, partitioned exporter of session events and profile snapshots"""
+
+    def __init__(self, directory: str, fmt: str | None = None, batch_rows: int = EXPORT_BATCH_ROWS):
+        self.directory = directory
+        self.batch_rows = batch_rows
+        self._writer = _PartWriter(fmt or default_format())
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {"events": [], "sessions": []}
+        self._parts = itertools.count()
+        self._run = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self.rows_written = 0
+        self.files_written = 0
+        self._state_path = os.path.join(directory, STATE_FILE)
+        self._exported: Dict[str, int] = self._read_state()
+        self._pending: Dict[str, int] = {}
+
+    @property
+    def format(self) -> str:
+        return self._writer.format
+
+    def exported(self, session_id: str) -> int:
+        """Number of rows of ``session_id`` already exported or buffered"""
+        return self._pending.get(session_id, self._exported.get(session_id, 0))
+
+    def add(self, session_id: str, rows: Iterable[Dict[str, Any]], context: Any = None) -> int:
+        """
+        Buffer ``rows`` (an adapter over the full session, e.g.
+        ``rows_from_transcript(id, transcript, exporter.exported(id))``) and
+        a profile snapshot of ``context``; returns the number of new rows.
+        """
+        added = turns = 0
+        with self._lock:
+            for row in rows:
+                self._buffers["events"].append(row)
+                self._pending[session_id] = row["seq"] + 1
+                added += 1
+                turns = max(turns, row["turn"] or 0)
+                if len(self._buffers["events"]) >= self.batch_rows:
+                    self._flush_locked()
+            if added and context is not None:
+                self._buffers["sessions"].append({
+                    "session_id": session_id, "exported_at": datetime.now(),
+                    "events": self.exported(session_id), "turns": turns or None,
+                    **profile_snapshot(context),
+                })
+        return added
+
+    def add_session(self, session) -> int:
+        """Export the new transcript rows of a ``session_runtime.TutorSession``"""
+        return self.add(session.session_id,
+                        rows_from_transcript(session.session_id, session.transcript, self.exported(session.session_id)),
+                        session.context)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        for dataset, rows in self._buffers.items():
+            if not rows:
+                continue
+            now = datetime.now()
+            partitions: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+            for row in rows:
+                ts = row["ts"] if dataset == "events" else row["exported_at"]
+                partitions[(ts or now).date()].append(row)
+            for day, part_rows in partitions.items():
+                directory = os.path.join(self.directory, dataset, f"date={day.isoformat()}")
+                os.makedirs(directory, exist_ok=True)
+                name = f"part-{self._run}-{next(self._parts):05d}{self._writer.suffix}"
+                self._writer.write(os.path.join(directory, name), dataset, part_rows)
+                self.files_written += 1
+            if dataset == "events":
+                self.rows_written += len(rows)
+            rows.clear()
+        if self._pending:
+            self._save_state()
+
+    def _read_state(self) -> Dict[str, int]:
+        if not os.path.exists(self._state_path):
+            return {}
+        with open(self._state_path) as f:
+            return json.load(f)
+
+    def _save_state(self) -> None:
+        """Merge this exporter's counts into the state file, which other workers may also write"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._exclusive():
+            merged = self._read_state()
+            for session_id, count in self._pending.items():
+                merged[session_id] = max(merged.get(session_id, 0), count)
+            with open(self._state_path + ".tmp", "w") as f:
+                json.dump(merged, f)
+            os.replace(self._state_path + ".tmp", self._state_path)
+        # Also picks up the sessions other workers exported meanwhile
+        self._exported = merged
+        self._pending.clear()
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Hold the state file's lock against other processes"""
+        try:
+            import fcntl
+        except ImportError:  # Windows: merged without a lock
+            fcntl = None
+        with open(self._state_path + ".lock", "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    close = flush
+
+
+_exporter: SessionExporter | None = None
+_exporter_checked = False
+
+
+def get_session_exporter() -> SessionExporter | None:
+    """Exporter configured by ``YOURTEACHER_EXPORT_DIR`` (None if unset); flushed at exit"""
+    global _exporter, _exporter_checked
+    if not _exporter_checked:
+        _exporter_checked = True
+        directory = os.getenv("YOURTEACHER_EXPORT_DIR")
+        if directory:
+            _exporter = SessionExporter(directory, os.getenv("YOURTEACHER_EXPORT_FORMAT") or None)
+            atexit.register(_exporter.close)
+    return _exporter
+
+
+# INSPECT / BENCHMARK
+
+def read_dataset(directory: str, dataset: str = "events") -> Iterator[Dict[str, Any]]:
+    """Rows of an exported dataset, one part file at a time"""
+    root = os.path.join(directory, dataset)
+    for day in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        for name in sorted(os.listdir(os.path.join(root, day))):
+            path = os.path.join(root, day, name)
+            if name.endswith(".parquet"):
+                import pyarrow.parquet as pq
+                yield from pq.read_table(path).to_pylist()
+            elif name.endswith(".arrow"):
+                import pyarrow as pa
+                with pa.memory_map(path) as source:
+                    yield from pa.ipc.open_file(source).read_all().to_pylist()
+            elif name.endswith(".jsonl.gz"):
+                with gzip.open(path, "rt") as f:
+                    yield from map(json.loads, f)
+            elif name.endswith(".jsonl.zst"):
+                import zstandard
+                with open(path, "rb") as f:
+                    text = zstandard.ZstdDecompressor().stream_reader(f).read().decode()
+                yield from map(json.loads, text.splitlines())
+
+
+def _dir_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(directory) for name in names)
+
+
+def synthetic_transcript(turns: int, seed: int) -> List[Dict[str, Any]]:
+    import random
+
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(2000)]
+    transcript, now = [], datetime.now()
+    for turn in range(1, turns + 1):
+        entries = [("user", "user", "")]
+        if rng.random() < 0.4:
+            entries += [("tool", "tool_call", "evaluate_quiz_response"), ("tool", "tool_result", "")]
+        if rng.random() < 0.1:
+            entries.append(("event", "handoff", ""))
+        entries += [("assistant", "assistant", ""), ("meta", "turn", "")]
+        for elapsed, (role, kind, tool) in enumerate(entries):
+            transcript.append({
+                "role": role, "kind": kind, "agent": "Teaching Agent", "channel": "learning",
+                "content": " ".join(rng.choices(words, k=rng.randint(5, 120))) if role != "meta" else "",
+                "timestamp": now, "turn": turn, "elapsed_ms": elapsed * 250.0,
+                "first_token_ms": 180.0 if kind == "turn" else None, "tool": tool or None,
+            })
+    return transcript
+
+
+def benchmark(sessions: int, turns: int, formats: List[str]) -> None:
+    import resource
+    import tempfile
+
+    from main import StudentLearningContext
+
+    context = StudentLearningContext(grade_level="Grade 8", cognitive_ability="Medium", learning_style="Visual")
+    print(f"{'format':>8} {'rows':>9} {'files':>6} {'seconds':>8} {'rows/s':>9} {'MB':>7} {'re-export':>10}")
+    for fmt in formats:
+        directory = tempfile.mkdtemp(prefix=f"yourteacher-export-{fmt}-")
+        exporter = SessionExporter(directory, fmt)
+        seconds = 0.0
+        for number in range(sessions):
+            # Each session is generated, exported and dropped: memory stays at one batch
+            session_id = f"s{number}"
+            transcript = synthetic_transcript(turns, number)
+            started = time.perf_counter()
+            exporter.add(session_id, rows_from_transcript(session_id, transcript), context)
+            seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        exporter.close()
+        seconds += time.perf_counter() - started
+
+        # A second export of the same sessions writes nothing new
+        again = SessionExporter(directory, fmt)
+        added = sum(again.add(f"s{n}", rows_from_transcript(f"s{n}", synthetic_transcript(turns, n),
+                                                            again.exported(f"s{n}"))) for n in range(sessions))
+        print(f"{fmt:>8} {exporter.rows_written:>9} {exporter.files_written:>6} {seconds:>8.2f} "
+              f"{exporter.rows_written / seconds:>9.0f} {_dir_size(directory) / 1e6:>7.1f} {added:>10}")
+    print(f"📈 peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Columnar export of tutoring sessions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    inspect = sub.add_parser("inspect", help="Summarize an export directory")
+    inspect.add_argument("directory")
+    bench = sub.add_parser("bench", help="Export synthetic sessions in each format")
+    bench.add_argument("--sessions", type=int, default=2000)
+    bench.add_argument("--turns", type=int, default=20)
+    bench.add_argument("--format", nargs="+", default=list(FORMATS), choices=FORMATS)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(args.sessions, args.turns, args.format)
+        return
+
+    kinds: Dict[str, int] = defaultdict(int)
+    sessions = set()
+    for row in read_dataset(args.directory, "events"):
+        kinds[row["kind"]] += 1
+        sessions.add(row["session_id"])
+    snapshots = sum(1 for _ in read_dataset(args.directory, "sessions"))
+    print(f"📦 {args.directory}: {len(sessions)} sessions, {sum(kinds.values())} events, {snapshots} profile snapshots")
+    for kind, count in sorted(kinds.items(), key=lambda item: -item[1]):
+        print(f"   {kind:<14} {count:>9}")
+
+
+if __name__ == "__main__":
+    main()
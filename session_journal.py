@@ -0,0 +1,213 @@
+"""
+Incremental session checkpoints.
+
+Shared sessions (``YOURTEACHER_SESSION_SHARED``, see session_hibernation.py)
+are checkpointed after every turn. Writing the whole session each time
+rewrites the full transcript and conversation for one new exchange, so
+checkpoint I/O grows with the length of the session. Instead the store keeps
+a snapshot of each session plus an append-only log, and a checkpoint appends
+one record with what changed since the previous one:
+
+* the context fields marked dirty by ``context_access`` (context_access.py);
+* the input items and transcript rows added (both only grow; a rewritten
+  conversation history is logged whole);
+* the current agent and the turn count.
+
+A restore replays the log over the snapshot. Once the log holds
+``COMPACT_RECORDS`` records or outgrows the snapshot, the next checkpoint
+writes a fresh snapshot and drops the log (compaction), which keeps restores
+fast and the log bounded.
+
+Usage:
+    python session_journal.py bench --turns 200
+"""
+
+from __future__ import annotations
+
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Set
+
+from context_access import context_access
+from session_hibernation import COMPRESS_LEVEL
+from state_codec import decode_state, encode_state
+
+COMPACT_RECORDS = 64
+COMPACT_RATIO = 1.0  # log size, relative to the snapshot, that triggers compaction
+
+_LENGTH = struct.Struct("<I")
+
+
+@dataclass
+class JournalCursor:
+    """How much of a session the store already has"""
+    items: int  # input items
+    last_item: Any  # the last of them, to notice a rewritten history
+    rows: int  # transcript rows
+    agent: str | None
+    turns: int
+    snapshot_bytes: int
+    log_bytes: int = 0
+    records: int = 0
+
+    def due_compaction(self) -> bool:
+        return self.records >= COMPACT_RECORDS or self.log_bytes > COMPACT_RATIO * self.snapshot_bytes
+
+    def advanced(self, session, record_bytes: int) -> JournalCursor:
+        """This cursor after ``session`` was appended as a record of ``record_bytes``"""
+        return cursor_for(session, self.snapshot_bytes, self.log_bytes + record_bytes, self.records + 1)
+
+
+def _agent_name(session) -> str | None:
+    return session.current_agent.name if session.current_agent is not None else None
+
+
+def cursor_for(session, snapshot_bytes: int, log_bytes: int = 0, records: int = 0) -> JournalCursor:
+    """Cursor of a store holding ``session`` as it is now"""
+    items = session.input_items
+    return JournalCursor(
+        items=len(items), last_item=items[-1] if items else None, rows=len(session.transcript),
+        agent=_agent_name(session), turns=session.turns,
+        snapshot_bytes=snapshot_bytes, log_bytes=log_bytes, records=records)
+
+
+def encode_delta(session, cursor: JournalCursor, dirty: Set[str]) -> bytes | None:
+    """Log record of what changed in ``session`` since ``cursor`` (None if nothing did)"""
+    sections: Dict[str, Any] = {}
+    context = session.context
+    with context_access.locked(context):
+        fields = {name: getattr(context, name) for name in sorted(dirty) if hasattr(context, name)}
+        if fields:
+            sections["context"] = fields
+        items = session.input_items
+        grown = len(items) >= cursor.items and (not cursor.items or items[cursor.items - 1] == cursor.last_item)
+        start = cursor.items if grown else 0
+        if len(items) > start or not grown:
+            sections["items_from"] = start
+            sections["input_items"] = items[start:]
+        if len(session.transcript) > cursor.rows:
+            sections["transcript"] = session.transcript[cursor.rows:]
+        if _agent_name(session) != cursor.agent or session.turns != cursor.turns:
+            sections["session"] = {"agent": _agent_name(session), "turns": session.turns}
+        return encode_state(sections) if sections else None
+
+
+def frame(record: bytes) -> bytes:
+    """``record`` compressed and length-prefixed, ready to append to a log"""
+    data = zlib.compress(record, COMPRESS_LEVEL)
+    return _LENGTH.pack(len(data)) + data
+
+
+def records(log: bytes) -> Iterator[memoryview]:
+    """Records of a log; a record cut short by a crash while appending ends it"""
+    view, pos = memoryview(log), 0
+    while pos + _LENGTH.size <= len(view):
+        (length,) = _LENGTH.unpack_from(view, pos)
+        pos += _LENGTH.size
+        if pos + length > len(view):
+            return
+        yield view[pos:pos + length]
+        pos += length
+
+
+def replay(state: Dict[str, Any], log: bytes) -> int:
+    """Apply the records of ``log`` to session state from ``decode_session``; returns their count"""
+    count = 0
+    for record in records(log):
+        sections = decode_state(zlib.decompress(record))
+        for name, value in sections.get("context", {}).items():
+            if name.startswith("_"):
+                state[name[1:]] = value  # _quiz_results and _quiz_questions, kept beside the context
+            else:
+                state["context"][name] = value
+        if "items_from" in sections:
+            state["input_items"] = state["input_items"][:sections["items_from"]] + sections["input_items"]
+        state["transcript"] = state["transcript"] + sections.get("transcript", [])
+        state.update(sections.get("session", {}))
+        count += 1
+    return count
+
+
+# BENCHMARK
+
+def benchmark(turns: int) -> None:
+    """Checkpoint bytes of one ``turns`` long shared session, whole sessions vs journal"""
+    import asyncio
+    import tempfile
+    import time
+
+    from session_export import synthetic_transcript
+    from session_runtime import SessionRuntime
+    from state_codec import synthetic_input_items
+    from telemetry import percentile
+
+    # The runtime records into the imported module's metrics, not __main__'s
+    from session_hibernation import HibernationStore, hibernation_metrics
+
+    transcript = synthetic_transcript(turns, 7)
+    items = synthetic_input_items(turns, 7)
+    starts = [index for index, item in enumerate(items) if item.get("role") == "user"] + [len(items)]
+
+    def session_run(journal: bool):
+        runtime = SessionRuntime()
+        store = HibernationStore(tempfile.mkdtemp(prefix="yourteacher-journal-"))
+        runtime.configure_hibernation(store, shared=True, journal=journal)
+        session = runtime.session("journal-bench")
+        written, seconds = [], []
+        for turn in range(1, turns + 1):
+            session.turns = turn
+            session.transcript.extend(row for row in transcript if row["turn"] == turn)
+            session.input_items = items[:starts[turn]]  # a new list every turn, like RunResult.to_input_list()
+            if turn % 10 == 0:
+                context_access.update(session.context, {"current_topic": f"topic {turn // 10}"})
+            if turn % 25 == 0:
+                context_access.update(session.context, {"_quiz_results": [
+                    {"question": number, "student_answer": "A", "correct_answer": "A", "is_correct": True}
+                    for number in range(1, 6)]})
+            before = hibernation_metrics.snapshot()["bytes_written"]
+            started = time.perf_counter()
+            asyncio.run(runtime._checkpoint(session))
+            seconds.append(time.perf_counter() - started)
+            written.append(hibernation_metrics.snapshot()["bytes_written"] - before)
+        # A turn that only changed the topic
+        context_access.update(session.context, {"current_topic": "fractions"})
+        before = hibernation_metrics.snapshot()["bytes_written"]
+        asyncio.run(runtime._checkpoint(session))
+        topic_only = hibernation_metrics.snapshot()["bytes_written"] - before
+
+        reader = SessionRuntime()
+        reader.configure_hibernation(store, shared=True)
+        restored = reader.session("journal-bench")
+        same = (restored.transcript == session.transcript and restored.input_items == session.input_items
+                and restored.context.model_dump() == session.context.model_dump()
+                and restored.context._quiz_results == session.context._quiz_results)
+        return written, seconds, topic_only, store.size("journal-bench"), same
+
+    results = {}
+    for label, journal in (("whole session", False), ("journal", True)):
+        compactions = hibernation_metrics.snapshot()["compactions"]
+        written, seconds, topic_only, final, same = session_run(journal)
+        results[label] = sum(written)
+        compactions = hibernation_metrics.snapshot()["compactions"] - compactions
+        print(f"{label:>13}: {sum(written) / 1e6:7.2f} MB written over {turns} turns, "
+              f"p50 {percentile(sorted(written), 50) / 1e3:6.1f} KB / turn, last {written[-1] / 1e3:6.1f} KB, "
+              f"topic change only {topic_only:6d} B, checkpoint p50 {percentile(sorted(seconds), 50) * 1000:5.2f} ms, "
+              f"write amplification {sum(written) / final:5.1f}x the final state "
+              f"({compactions} compactions) {'✅' if same else '❌ restored state differs'}")
+    print(f"💾 {results['whole session'] / max(results['journal'], 1):.0f}x fewer checkpoint bytes with the journal")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incremental session checkpoints")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Write amplification of per-turn checkpoints of a long session")
+    bench.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+    benchmark(args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Offline replay of recorded tutoring sessions.
+
+Re-drives the student turns of exported sessions (see session_export.py)
+through an agent graph, many sessions in parallel, and compares each replay
+with its recording: latency, first-token time, tokens and outcomes (final
+agent, tools used, handoffs, screening/teaching/quiz state).
+
+Model modes:
+
+    recorded  a local stub server answers with the recorded model output of
+              each turn (tool calls, handoffs, messages), so only the graph,
+              tools and guards differ from the recording
+    stub      a local stub server echoes the student (pipeline latency only)
+    live      the configured model endpoints (e.g. to evaluate new prompts
+              or models; see resilient_client.py)
+
+Scripted sessions without a recording can be replayed from a JSON-lines file
+with one ``{"session_id": ..., "turns": [{"input": ..., "channel": ...}]}``
+object per line.
+
+Usage:
+    python session_replay.py EXPORT_DIR --graph experiment.toml --model recorded
+    python session_replay.py --script turns.jsonl --model stub --concurrency 16
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+MODEL_MODES = ("recorded", "stub", "live")
+
+
+@dataclass
+class ReplayTurn:
+    user_input: str | None
+    channel: str = ""
+    # Recorded model output, in order: {"tool_calls": [...]} or {"content": ...}
+    steps: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class Recording:
+    session_id: str
+    turns: List[ReplayTurn] = field(default_factory=list)
+    rows: List[Dict[str, Any]] = field(default_factory=list)  # recorded event rows (empty for scripts)
+    profile: Dict[str, Any] = field(default_factory=dict)    # latest recorded profile snapshot
+
+
+def handoff_tool_name(agent_name: str) -> str:
+    """Tool name the Agents SDK gives the handoff to ``agent_name``"""
+    return "transfer_to_" + re.sub(r"[^a-zA-Z0-9_]", "_", re.sub(r"\s", "_", agent_name)).lower()
+
+
+# LOADING
+
+def _turns_from_rows(rows: List[Dict[str, Any]]) -> List[ReplayTurn]:
+    turns: List[ReplayTurn] = []
+    if any(row["turn"] is not None for row in rows):
+        # Session runtime recordings: one turn row closes every turn
+        by_turn: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            by_turn[row["turn"]].append(row)
+        groups = [by_turn[number] for number in sorted(n for n in by_turn if n is not None)]
+    else:
+        # Recordings without turn numbers: every user message starts a turn
+        groups = []
+        for row in rows:
+            if row["role"] == "user" or not groups:
+                groups.append([])
+            groups[-1].append(row)
+
+    for group in groups:
+        user = next((row["content"] for row in group if row["role"] == "user"), None)
+        channel = next((row["channel"] for row in group if row["channel"]), "")
+        turn = ReplayTurn(user, channel or "")
+        for row in group:
+            if row["kind"] == "tool_call" and row["name"]:
+                try:
+                    arguments = json.loads(row["content"] or "{}")
+                except json.JSONDecodeError:
+                    arguments = {}
+                turn.steps.append({"tool_calls": [{"name": row["name"], "arguments": arguments}]})
+            elif row["kind"] == "handoff" and row["name"]:
+                turn.steps.append({"tool_calls": [{"name": handoff_tool_name(row["name"]), "arguments": {}}]})
+            elif row["role"] == "assistant":
+                turn.steps.append({"content": row["content"]})
+        turns.append(turn)
+    return turns
+
+
+def load_recordings(directory: str, limit: int | None = None) -> List[Recording]:
+    """Sessions of an export directory, rows in recorded order"""
+    from session_export import read_dataset
+
+    rows_by_session: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for row in read_dataset(directory, "events"):
+        rows_by_session[row["session_id"]].append(row)
+    profiles: Dict[str, Dict[str, Any]] = {}
+    for snapshot in read_dataset(directory, "sessions"):
+        profiles[snapshot["session_id"]] = snapshot  # later exports win
+
+    recordings = []
+    for session_id in sorted(rows_by_session)[:limit]:
+        rows = sorted(rows_by_session[session_id], key=lambda row: row["seq"])
+        recordings.append(Recording(session_id, _turns_from_rows(rows), rows, profiles.get(session_id, {})))
+    return recordings
+
+
+def load_script(path: str, limit: int | None = None) -> List[Recording]:
+    recordings = []
+    with open(path) as f:
+        for number, line in enumerate(f):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            recordings.append(Recording(
+                entry.get("session_id", f"script-{number}"),
+                [ReplayTurn(turn.get("input"), turn.get("channel", "")) for turn in entry["turns"]],
+            ))
+    return recordings[:limit]
+
+
+# RECORDED MODEL RESPONSES
+
+class RecordedResponder:
+    """
+    Stub server responder answering with recorded model output.
+
+    A request is matched to a recorded turn by its session (the session
+    header, see model_routing.py) and the student messages it contains (the
+    conversation so far), and to a step within the turn by the number of
+    assistant messages after the last student message. Sessions whose
+    students typed the same messages thus still get their own responses.
+    """
+
+    def __init__(self, recordings: List[Recording]):
+        self._turns: Dict[Tuple[str, Tuple[str, ...]], List[Dict[str, Any]]] = {}
+        for recording in recordings:
+            history: Tuple[str, ...] = ()
+            for turn in recording.turns:
+                if turn.user_input:
+                    history += (turn.user_input,)
+                self._turns.setdefault((replay_session_id(recording), history), turn.steps)
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        from stub_model_server import echo_responder
+
+        messages = request.get("messages", [])
+        history = tuple(
+            m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content"))
+            for m in messages if m.get("role") == "user")
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+        step = sum(1 for m in messages[last_user + 1:] if m.get("role") == "assistant")
+        # Recorded calls of tools the replayed agent does not offer are skipped
+        offered = {tool["function"]["name"] for tool in request.get("tools", [])}
+        steps = [
+            s for s in self._turns.get((request.get("_session_id"), history), [])
+            if all(call["name"] in offered for call in s.get("tool_calls", []))
+        ]
+        if not steps:
+            self.misses += 1
+            return echo_responder(request)
+        self.hits += 1
+        return steps[min(step, len(steps) - 1)]
+
+
+# REPLAY
+
+def summarize(rows: List[Dict[str, Any]], profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Latency, token and outcome summary of a session's event rows"""
+    turn_rows = [row for row in rows if row["kind"] == "turn"]
+    first_tokens = [row["first_token_ms"] for row in turn_rows if row["first_token_ms"] is not None]
+    quiz = None
+    if profile.get("quiz_total"):
+        quiz = round(100 * profile["quiz_score"] / profile["quiz_total"])
+    return {
+        "turns": len(turn_rows) or sum(1 for row in rows if row["role"] == "user"),
+        "latency_ms": sum(row["elapsed_ms"] or 0 for row in turn_rows),
+        "first_token_ms": sum(first_tokens) / len(first_tokens) if first_tokens else None,
+        "input_tokens": sum(row.get("input_tokens") or 0 for row in turn_rows),
+        "output_tokens": sum(row.get("output_tokens") or 0 for row in turn_rows),
+        "final_agent": turn_rows[-1]["agent"] if turn_rows else None,
+        "tools": [row["name"] for row in rows if row["kind"] == "tool_call"],
+        "handoffs": [row["name"] for row in rows if row["kind"] == "handoff"],
+        "screening_complete": profile.get("screening_complete"),
+        "concept_taught": profile.get("concept_taught"),
+        "quiz_percent": quiz,
+    }
+
+
+OUTCOME_KEYS = ("final_agent", "tools", "handoffs", "screening_complete", "concept_taught", "quiz_percent")
+
+
+def diff_outcomes(recorded: Dict[str, Any], replayed: Dict[str, Any]) -> List[str]:
+    changes = []
+    for key in OUTCOME_KEYS:
+        if recorded.get(key) != replayed.get(key):
+            changes.append(f"{key}: {recorded.get(key)} → {replayed.get(key)}")
+    return changes
+
+
+def replay_session_id(recording: Recording) -> str:
+    return f"replay-{recording.session_id}"
+
+
+async def replay_session(recording: Recording, graph_path: str | None) -> Dict[str, Any]:
+    """Replay one recording in a fresh TutorSession (not exported)"""
+    from main import StudentLearningContext, graph_path_for_session
+    from session_export import profile_snapshot, rows_from_transcript
+    from session_runtime import CHANNEL_AGENTS, TutorSession
+
+    session_id = replay_session_id(recording)
+    session = TutorSession(
+        session_id=session_id,
+        graph_path=graph_path or graph_path_for_session(recording.session_id),
+        context=StudentLearningContext(session_id=session_id),
+        _export=False,
+    )
+    error = None
+    channel = None
+    for turn in recording.turns:
+        agent_key = CHANNEL_AGENTS.get(turn.channel) if turn.channel != channel else None
+        channel = turn.channel
+        try:
+            async for _ in session.stream_turn(turn.user_input, agent_key, turn.channel):
+                pass
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            break
+
+    replayed = summarize(list(rows_from_transcript(session.session_id, session.transcript)),
+                         profile_snapshot(session.context))
+    result = {"session_id": recording.session_id, "replay": replayed, "error": error}
+    if recording.rows and error is None:
+        recorded = summarize(recording.rows, recording.profile)
+        result["recorded"] = recorded
+        result["outcome_changes"] = diff_outcomes(recorded, replayed)
+    return result
+
+
+async def replay_all(recordings: List[Recording], graph_path: str | None, concurrency: int) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(recording: Recording) -> Dict[str, Any]:
+        async with semaphore:
+            return await replay_session(recording, graph_path)
+
+    return await asyncio.gather(*(bounded(recording) for recording in recordings))
+
+
+async def run_replay(
+    recordings: List[Recording],
+    model: str = "recorded",
+    graph_path: str | None = None,
+    concurrency: int = 8,
+    latency: float = 0.0,
+    token_delay: float = 0.0,
+) -> List[Dict[str, Any]]:
+    """Replay ``recordings`` against the model mode ``model`` (see module docstring)"""
+    if model not in MODEL_MODES:
+        raise ValueError(f"Unknown model mode '{model}'. Choose from: {', '.join(MODEL_MODES)}")
+    # Replays must not add to the session exports or quiz analytics they are compared with
+    os.environ.pop("YOURTEACHER_EXPORT_DIR", None)
+    os.environ["YOURTEACHER_ANALYTICS_DIR"] = tempfile.mkdtemp(prefix="yourteacher-replay-analytics-")
+    if model == "live":
+        return await replay_all(recordings, graph_path, concurrency)
+
+    from stub_model_server import StubModelServer, echo_responder
+
+    responder = RecordedResponder(recordings) if model == "recorded" else echo_responder
+    async with StubModelServer(latency=latency, token_delay=token_delay, responder=responder) as server:
+        # Must be set before the model router and endpoint pool are first built
+        os.environ["YOURTEACHER_MODEL_ENDPOINTS"] = json.dumps([{"name": "replay", "base_url": server.base_url}])
+        os.environ.setdefault("GEMINI_API_KEY", "replay")
+        os.environ["YOURTEACHER_SESSION_HEADER"] = "1"
+        results = await replay_all(recordings, graph_path, concurrency)
+    if model == "recorded":
+        print(f"🎞️ Recorded responses: {responder.hits} matched, {responder.misses} answered by the echo stub")
+    return results
+
+
+# REPORT
+
+def _delta(recorded: float | None, replayed: float | None, unit: str = "") -> str:
+    if replayed is None:
+        return "-"
+    if recorded is None:
+        return f"{replayed:.0f}{unit}"
+    return f"{replayed:.0f}{unit} ({replayed - recorded:+.0f})"
+
+
+def print_report(results: List[Dict[str, Any]], seconds: float) -> None:
+    print(f"{'session':<18} {'turns':>5} {'latency ms':>18} {'first token ms':>16} "
+          f"{'out tokens':>14} {'outcome'}")
+    changed = failed = 0
+    for result in results:
+        replay, recorded = result["replay"], result.get("recorded", {})
+        outcome = "❌ " + result["error"] if result["error"] else (
+            "; ".join(result.get("outcome_changes", [])) or ("same" if recorded else ""))
+        changed += bool(result.get("outcome_changes"))
+        failed += bool(result["error"])
+        print(f"{result['session_id'][:18]:<18} {replay['turns']:>5} "
+              f"{_delta(recorded.get('latency_ms'), replay['latency_ms']):>18} "
+              f"{_delta(recorded.get('first_token_ms'), replay['first_token_ms']):>16} "
+              f"{_delta(recorded.get('output_tokens'), replay['output_tokens']):>14} {outcome}")
+
+    turns = sum(result["replay"]["turns"] for result in results)
+    print(f"\n🔁 Replayed {len(results)} sessions ({turns} turns) in {seconds:.1f}s: "
+          f"{changed} with changed outcomes, {failed} failed")
+    with_recording = [result for result in results if "recorded" in result and not result["error"]]
+    if with_recording:
+        for key, label in (("latency_ms", "latency"), ("input_tokens", "input tokens"),
+                           ("output_tokens", "output tokens")):
+            before = sum(result["recorded"][key] for result in with_recording)
+            after = sum(result["replay"][key] for result in with_recording)
+            change = f" ({(after - before) / before:+.0%})" if before else ""
+            print(f"   {label:<14} {before:>12.0f} → {after:<12.0f}{change}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay recorded tutoring sessions")
+    parser.add_argument("recordings", nargs="?", help="Export directory (see session_export.py)")
+    parser.add_argument("--script", help="JSON-lines file of scripted sessions instead of recordings")
+    parser.add_argument("--graph", default=None, help="Agent graph to replay with (default: the session's variant)")
+    parser.add_argument("--model", default="recorded", choices=MODEL_MODES)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many sessions")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub latency per model call (seconds)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Stub delay between streamed tokens")
+    parser.add_argument("--out", help="Write per-session results to this JSON-lines file")
+    args = parser.parse_args()
+    if not args.recordings and not args.script:
+        parser.error("give an export directory or --script")
+    if args.graph and not os.path.exists(args.graph):
+        parser.error(f"agent graph {args.graph} not found")
+    if args.script and args.model == "recorded":
+        parser.error("scripted sessions have no recorded responses; use --model stub or live")
+
+    recordings = load_script(args.script, args.limit) if args.script else load_recordings(args.recordings, args.limit)
+    print(f"📼 {len(recordings)} sessions, {sum(len(r.turns) for r in recordings)} turns to replay")
+    started = time.perf_counter()
+    results = asyncio.run(run_replay(recordings, args.model, args.graph, args.concurrency,
+                                     args.latency, args.token_delay))
+    print_report(results, time.perf_counter() - started)
+    if args.out:
+        with open(args.out, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        print(f"💾 Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,658 @@
+"""
+Shared tutoring session runtime.
+
+Owns the per-student conversation state (context, input items, current agent)
+and runs agent turns on one long-lived event loop in a background thread, so
+model clients and their connection pools survive across turns and Streamlit
+reruns. UIs call ``runtime.stream(...)`` from their own thread and receive
+simplified TurnEvents as the model streams; a turn keeps running to completion
+even if the UI stops consuming it (e.g. a Streamlit rerun), so session state
+never ends up half-updated. Idle sessions can be hibernated to disk and are
+restored on their next use, and several processes can share sessions through
+the same store (see session_hibernation.py and supervisor.py). New sessions
+can start from a pre-generated opening turn (see warm_pool.py).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+from context_access import VersionConflict, context_access, context_metrics
+from fast_path import FastPath, fast_path_enabled, fast_path_metrics, match_fast_path
+from learning_flow import HandoffRejected, flow_metrics
+from main import (
+    StudentLearningContext,
+    agent_registry,
+    call_tool,
+    get_model_router,
+    graph_path_for_session,
+)
+from parallel_tools import tool_metrics
+from prompt_cache import cached_tokens
+from session_export import get_session_exporter
+from session_hibernation import (
+    HibernationStore,
+    decode_session,
+    encode_session,
+    hibernation_metrics,
+    hibernation_settings,
+)
+from session_journal import JournalCursor, cursor_for, encode_delta, frame, replay
+from study_materials import default_materials_dir
+from telemetry import TEXT_DELTA_EVENT, streaming_metrics
+from warm_pool import OPENING_MESSAGE, Opening, WarmPool, warm_pool_size
+
+# TurnEvent kinds
+TEXT = "text"                # streamed text delta
+MESSAGE = "message"          # completed agent message
+HANDOFF = "handoff"          # text: "<source> → <target>"
+TOOL_CALL = "tool_call"      # text: tool name
+TOOL_RESULT = "tool_result"  # text: tool output
+RETRY = "retry"              # rejected handoff, the turn is replayed
+ERROR = "error"
+DONE = "done"
+
+# Agent a UI channel (page) starts with when the student arrives on it
+CHANNEL_AGENTS = {"screener": "screener", "learning": "teaching", "quiz": "quiz"}
+
+# Longest pause between two hibernation sweeps
+SWEEP_SECONDS = 30.0
+
+# Transcript roles shown as chat; "tool" and "meta" rows (tool calls, retries,
+# per-turn timings) are kept for export (see session_export.py)
+CHAT_ROLES = ("user", "assistant", "event")
+
+
+class ShuttingDown(RuntimeError):
+    """Raised for turns started after a graceful shutdown began"""
+
+
+class TurnGate:
+    """Counts in-flight agent turns so a shutdown can wait for them (see run_app.py)"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.inflight = 0
+        self.draining = False
+
+    @contextmanager
+    def track(self):
+        with self._cond:
+            if self.draining:
+                raise ShuttingDown("The tutor is restarting, please send your message again in a moment")
+            self.inflight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.inflight -= 1
+                self._cond.notify_all()
+
+    def drain(self, timeout: float) -> int:
+        """Refuse new turns and wait up to ``timeout`` seconds for running ones; returns those still running"""
+        with self._cond:
+            self.draining = True
+            self._cond.wait_for(lambda: self.inflight == 0, timeout)
+            return self.inflight
+
+
+turn_gate = TurnGate()
+
+
+@dataclass
+class TurnEvent:
+    kind: str
+    agent: str = ""
+    text: str = ""
+
+
+@dataclass
+class TutorSession:
+    """Conversation state of one student"""
+    session_id: str
+    graph_path: str
+    context: StudentLearningContext
+    current_agent: Any = None
+    input_items: List[Dict[str, Any]] = field(default_factory=list)
+    transcript: List[Dict[str, Any]] = field(default_factory=list)
+    turns: int = 0
+    last_active: float = field(default_factory=time.monotonic, repr=False)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+    _turn_started: float = field(default=0.0, repr=False)
+    _size: tuple = field(default=(-1, 0), repr=False)  # (turns, bytes) when last measured
+    _stored: int | None = field(default=None, repr=False)  # store version last written or read
+    _journal: JournalCursor | None = field(default=None, repr=False)  # what the shared store has of it
+    _export: bool = field(default=True, repr=False)  # False for warm pool scratch sessions
+
+    def messages(self, channel: str | None = None) -> List[Dict[str, Any]]:
+        """Chat transcript entries (no tool or turn rows), optionally only those for ``channel``"""
+        return [
+            m for m in self.transcript
+            if m["role"] in CHAT_ROLES and (channel is None or m["channel"] == channel)
+        ]
+
+    def _record(self, role: str, content: str, channel: str, agent: str = "", kind: str = "", **extra) -> None:
+        self.transcript.append({
+            "role": role, "kind": kind or role, "content": content, "agent": agent,
+            "channel": channel, "timestamp": datetime.now(), "turn": self.turns,
+            "elapsed_ms": (time.perf_counter() - self._turn_started) * 1000, **extra,
+        })
+
+    async def stream_turn(
+        self,
+        user_input: str | None = None,
+        agent_key: str | None = None,
+        channel: str = "",
+    ) -> AsyncIterator[TurnEvent]:
+        """Run one turn, optionally switching to the agent ``agent_key`` first"""
+        from agents import ItemHelpers, Runner
+
+        async with self._lock:
+            self.last_active = time.monotonic()
+            self.turns += 1
+            self._turn_started = time.perf_counter()
+            first_token_ms = None
+            if agent_key is not None:
+                self.current_agent = agent_registry.get(agent_key, self.graph_path)
+            elif self.current_agent is None:
+                self.current_agent = agent_registry.entry(self.graph_path)
+            if user_input:
+                self.input_items.append({"content": user_input, "role": "user"})
+                self._record("user", user_input, channel)
+
+            fast = None
+            if user_input and fast_path_enabled():
+                fast = match_fast_path(user_input, self.context, self.current_agent)
+                if fast is not None:
+                    reply = await self._run_fast_path(fast, channel)
+                    if reply is None:
+                        fast = None  # the tool failed, the model takes over
+                    else:
+                        for event in reply:
+                            yield event
+
+            # What a replayed attempt starts from: the tools of a rejected one may have run
+            before, _ = context_access.read(self.context)
+            rows = len(self.transcript)
+            for attempt in range(0 if fast and fast.template else 2):
+                try:
+                    with get_model_router().bind(self.context) as models:
+                        result = Runner.run_streamed(
+                            self.current_agent, self.input_items, context=self.context)
+
+                    current = self.current_agent.name
+                    async for event in streaming_metrics.track(result.stream_events(), self.current_agent,
+                                                               models=models):
+                        if event.type == "raw_response_event":
+                            if getattr(event.data, "type", None) == TEXT_DELTA_EVENT and event.data.delta:
+                                if first_token_ms is None:
+                                    first_token_ms = (time.perf_counter() - self._turn_started) * 1000
+                                yield TurnEvent(TEXT, current, event.data.delta)
+                        elif event.type == "agent_updated_stream_event":
+                            if event.new_agent.name != current:
+                                yield TurnEvent(HANDOFF, event.new_agent.name, f"{current} → {event.new_agent.name}")
+                                self._record("event", f"🔄 {current} → {event.new_agent.name}", channel,
+                                             current, kind="handoff", target=event.new_agent.name)
+                            current = event.new_agent.name
+                        elif event.type == "run_item_stream_event":
+                            item = event.item
+                            if item.type == "tool_call_item":
+                                name = getattr(item.raw_item, "name", "a tool")
+                                self._record("tool", getattr(item.raw_item, "arguments", ""), channel,
+                                             item.agent.name, kind="tool_call", tool=name)
+                                yield TurnEvent(TOOL_CALL, item.agent.name, name)
+                            elif item.type == "tool_call_output_item":
+                                self._record("tool", str(item.output), channel, item.agent.name, kind="tool_result")
+                                yield TurnEvent(TOOL_RESULT, item.agent.name, str(item.output))
+                            elif item.type == "message_output_item":
+                                text = ItemHelpers.text_message_output(item)
+                                self._record("assistant", text, channel, item.agent.name)
+                                yield TurnEvent(MESSAGE, item.agent.name, text)
+                    break
+                except HandoffRejected as e:
+                    # The handoff is filtered out on the replay (see learning_flow.py)
+                    if attempt:
+                        raise
+                    flow_metrics.incr("turns_recovered")
+                    context_access.restore(self.context, before)
+                    del self.transcript[rows:]
+                    self._record("meta", e.reason, channel, self.current_agent.name, kind="retry")
+                    yield TurnEvent(RETRY, self.current_agent.name, e.reason)
+
+            if fast and fast.template:
+                input_tokens = output_tokens = cached = 0
+            else:
+                self.input_items = result.to_input_list()
+                self.current_agent = result.last_agent
+                usage = result.context_wrapper.usage
+                input_tokens, output_tokens, cached = usage.input_tokens, usage.output_tokens, cached_tokens(usage)
+            self._record("meta", "", channel, self.current_agent.name, kind="turn", first_token_ms=first_token_ms,
+                         input_tokens=input_tokens, output_tokens=output_tokens, cached_tokens=cached,
+                         **({"fast_path": fast.intent} if fast else {}))
+            exporter = get_session_exporter()
+            if exporter and self._export:
+                await asyncio.to_thread(exporter.add_session, self)
+            self.last_active = time.monotonic()
+            yield TurnEvent(DONE, self.current_agent.name)
+
+    async def _run_fast_path(self, fast: FastPath, channel: str) -> List[TurnEvent] | None:
+        """Run a recognized tool call locally (see fast_path.py); None if the tool failed"""
+        agent = self.current_agent.name
+        try:
+            output = await call_tool(fast.tool, self.context, **fast.arguments)
+        except Exception as e:
+            fast_path_metrics.incr("tool_errors")
+            print(f"⚠️ Fast path {fast.intent} failed, asking the model instead: {e}")
+            return None
+        call_id = f"fast_{uuid.uuid4().hex[:20]}"
+        arguments = json.dumps(fast.arguments)
+        self.input_items += [
+            {"type": "function_call", "call_id": call_id, "name": fast.tool, "arguments": arguments},
+            {"type": "function_call_output", "call_id": call_id, "output": output},
+        ]
+        self._record("tool", arguments, channel, agent, kind="tool_call", tool=fast.tool)
+        self._record("tool", output, channel, agent, kind="tool_result")
+        events = [TurnEvent(TOOL_CALL, agent, fast.tool), TurnEvent(TOOL_RESULT, agent, output)]
+        if fast.template is not None:
+            text = fast.template(self.context, output)
+            self.input_items.append({"role": "assistant", "content": text})
+            self._record("assistant", text, channel, agent)
+            events += [TurnEvent(TEXT, agent, text), TurnEvent(MESSAGE, agent, text)]
+        fast_path_metrics.record(fast)
+        return events
+
+    async def adopt_opening(self, opening: Opening, channel: str = "") -> bool:
+        """Take over a pre-generated opening turn, unless this session already had a turn"""
+        async with self._lock:
+            agent = agent_registry.graph(self.graph_path).by_name.get(opening.agent)
+            if self.turns or agent is None:
+                return False
+            self.turns = 1
+            self.current_agent = agent
+            self.input_items = opening.input_items
+            now = datetime.now()
+            # The student waited for none of the generation time
+            self.transcript.extend(
+                {**row, "channel": channel, "timestamp": now, "elapsed_ms": 0.0,
+                 **({"first_token_ms": 0.0, "warm": True} if row["kind"] == "turn" else {})}
+                for row in opening.rows)
+            exporter = get_session_exporter()
+            if exporter:
+                await asyncio.to_thread(exporter.add_session, self)
+            self.last_active = time.monotonic()
+            return True
+
+
+class SessionRuntime:
+    """Sessions plus the background event loop their turns run on"""
+
+    def __init__(self):
+        self._sessions: Dict[str, TutorSession] = {}
+        self._hibernating: Dict[str, TutorSession] = {}  # being written to the store
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._configured = False
+        self.store: HibernationStore | None = None
+        self.idle_seconds: float | None = None
+        self.budget_bytes: int | None = None
+        self.shared = False
+        self.journal = True
+        self.warm_pool: WarmPool | None = None
+
+    def configure_hibernation(
+        self,
+        store: HibernationStore | None,
+        idle_seconds: float | None = None,
+        budget_bytes: int | None = None,
+        shared: bool = False,
+        journal: bool = True,
+    ) -> None:
+        """Hibernate sessions idle for ``idle_seconds`` and/or LRU ones over ``budget_bytes``
+
+        With ``shared``, sessions are also checkpointed to ``store`` after every
+        turn and reloaded when another process has written a newer version;
+        with ``journal`` a checkpoint only appends what changed (see
+        session_journal.py). Defaults come from ``YOURTEACHER_SESSION_*`` (see
+        session_hibernation.py) unless this is called before the runtime is
+        first used.
+        """
+        if shared and store is None:
+            raise ValueError("Sharing sessions between processes needs a store")
+        self.store, self.idle_seconds, self.budget_bytes = store, idle_seconds, budget_bytes
+        self.shared, self.journal = shared, journal
+        self._configured = True
+
+    def configure_warm_pool(self, max_size: int) -> None:
+        """Keep up to ``max_size`` pre-generated openings per agent graph (0 disables it)
+
+        Defaults to ``YOURTEACHER_WARM_POOL`` unless this is called before the
+        runtime is first used.
+        """
+        self.warm_pool = WarmPool(max_size, self._generate_opening) if max_size > 0 else None
+        if self.warm_pool is not None and self._loop is not None:
+            self.warm_pool.start(self._loop, self._opening_keys())
+
+    def _configure(self) -> None:
+        if not self._configured:
+            self.configure_hibernation(**hibernation_settings())
+            if self.warm_pool is None:
+                self.configure_warm_pool(warm_pool_size())
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(
+                        target=loop.run_forever, name="session-runtime", daemon=True).start()
+                    self._loop = loop
+                    self._configure()
+                    if self.idle_seconds is not None or self.budget_bytes is not None:
+                        asyncio.run_coroutine_threadsafe(self._sweep_forever(), loop)
+                    if self.warm_pool is not None:
+                        self.warm_pool.start(loop, self._opening_keys())
+        return self._loop
+
+    def session(self, session_id: str | None = None) -> TutorSession:
+        """Existing (or hibernated) session ``session_id``, or a new one"""
+        session_id = session_id or uuid.uuid4().hex[:16]
+        self._configure()
+        with self._lock:
+            session = self._sessions.get(session_id) or self._hibernating.pop(session_id, None)
+            if session is not None and self.shared and not session._lock.locked():
+                if self.store.version(session_id) not in (None, session._stored):
+                    # Another process ran a turn on this session since
+                    session = self._restore(session_id) or session
+                    hibernation_metrics.incr("reloaded")
+            if session is None and self.store is not None:
+                session = self._restore(session_id)
+            if session is None:
+                session = TutorSession(
+                    session_id=session_id,
+                    graph_path=graph_path_for_session(session_id),
+                    context=StudentLearningContext(
+                        session_id=session_id, materials_dir=default_materials_dir(session_id)),
+                )
+            self._sessions[session_id] = session
+            session.last_active = time.monotonic()
+            return session
+
+    def close_session(self, session_id: str) -> None:
+        exporter = get_session_exporter()
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or self._hibernating.pop(session_id, None)
+            if self.store is not None:
+                if session is None and exporter:
+                    session = self._restore(session_id)
+                self.store.discard(session_id)
+        if session and exporter:
+            exporter.add_session(session)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        """Resident and hibernated session counts plus hibernation, warm pool, fast path, tool call and context metrics"""
+        stats = {
+            "resident": len(self._sessions),
+            "hibernated": len(self.store) if self.store is not None else 0,
+            **hibernation_metrics.snapshot(),
+        }
+        if self.warm_pool is not None:
+            stats.update({f"warm_{name}": value for name, value in self.warm_pool.stats().items()})
+        if fast_path_enabled():
+            stats.update({f"fast_path_{name}": value for name, value in fast_path_metrics.snapshot().items()})
+        stats.update({f"tools_{name}": value for name, value in tool_metrics.snapshot().items()})
+        stats.update({f"context_{name}": value for name, value in context_metrics.snapshot().items()})
+        return stats
+
+    # WARM POOL
+
+    @staticmethod
+    def _opening_keys() -> List[tuple]:
+        """(graph path, agent key) of the openings UIs start sessions with"""
+        from agent_graph import parse_variants
+        from main import default_graph_path
+
+        variants = parse_variants(os.getenv("YOURTEACHER_AGENT_GRAPH_VARIANTS", ""))
+        paths = [path for _, path, _ in variants] or [default_graph_path()]
+        return [(path, CHANNEL_AGENTS["screener"]) for path in dict.fromkeys(paths)]
+
+    async def _generate_opening(self, graph_path: str, agent_key: str | None) -> Opening | None:
+        """Run the opening turn on a scratch session; None if it did more than greet"""
+        scratch_id = "warm-" + uuid.uuid4().hex[:11]
+        session = TutorSession(
+            session_id=scratch_id, graph_path=graph_path,
+            context=StudentLearningContext(session_id=scratch_id), _export=False)
+        fresh = session.context.model_dump()
+        events = []
+        async for event in session.stream_turn(OPENING_MESSAGE, agent_key):
+            if event.kind == TEXT and events and events[-1].kind == TEXT:
+                events[-1] = TurnEvent(TEXT, event.agent, events[-1].text + event.text)
+            else:
+                events.append(event)
+        # Tool calls or a changed context would not carry over to another student
+        if session.context.model_dump() != fresh or any(row["role"] == "tool" for row in session.transcript):
+            return None
+        return Opening(session.current_agent.name, session.input_items, session.transcript, events)
+
+    # HIBERNATION
+
+    def _restore(self, session_id: str) -> TutorSession | None:
+        """Rebuild a hibernated session (called with ``_lock`` held)"""
+        started = time.perf_counter()
+        stored = self.store.read_journal(session_id)
+        if stored is None:
+            return None
+        data, log, version = stored
+        try:
+            state = decode_session(data)
+            records = replay(state, log)
+            context = StudentLearningContext.model_validate(state["context"])
+            if state["quiz_results"] is not None:
+                context._quiz_results = state["quiz_results"]
+            if state["quiz_questions"] is not None:
+                context._quiz_questions = state["quiz_questions"]
+            agent = None
+            if state["agent"]:
+                # None (the entry agent) if the graph no longer has it
+                agent = agent_registry.graph(state["graph_path"]).by_name.get(state["agent"])
+        except (ValueError, KeyError, zlib.error) as e:
+            hibernation_metrics.incr("restore_failed")
+            print(f"⚠️ Could not restore session {session_id}: {e}")
+            return None
+        session = TutorSession(
+            session_id=session_id,
+            graph_path=state["graph_path"],
+            context=context,
+            current_agent=agent,
+            input_items=state["input_items"],
+            transcript=state["transcript"],
+            turns=state["turns"],
+            _stored=version,
+        )
+        if self.shared:
+            session._journal = cursor_for(session, len(data), len(log), records)
+        else:
+            # Only once rebuilt: a session that failed to restore stays on disk until it is written again
+            self.store.discard(session_id)
+        hibernation_metrics.restore_latency(started)
+        return session
+
+    async def _write(self, session: TutorSession) -> int | None:
+        """Write ``session`` to the store; returns the bytes written (None on a version conflict)
+
+        A shared store is only written over the version this process last
+        saw. With the journal, a session it already has gets a log record of
+        what changed instead of a new snapshot, until the log is due for
+        compaction.
+        """
+        context, cursor = session.context, session._journal
+        delta = self.shared and self.journal and cursor is not None and not cursor.due_compaction()
+        # Encoded on the loop thread, with the context locked against frontend threads
+        with context_access.locked(context):
+            dirty, _ = context_access.take_dirty(context)
+            data = encode_delta(session, cursor, dirty) if delta else encode_session(session)
+            if data is None:
+                return 0  # nothing changed since the last checkpoint
+            data = frame(data) if delta else data
+            written = cursor.advanced(session, len(data)) if delta else cursor_for(session, len(data))
+        try:
+            if not self.shared:
+                await asyncio.to_thread(self.store.write, session.session_id, data)
+                session._stored = self.store.version(session.session_id)
+                return len(data)
+            write = self.store.append_if if delta else self.store.write_if
+            session._stored = await asyncio.to_thread(write, session.session_id, data, session._stored)
+        except VersionConflict:
+            # Another process ran a turn on this session since; its copy is kept and reloaded on next use
+            hibernation_metrics.incr("checkpoint_conflicts")
+            print(f"⚠️ Session {session.session_id} was changed by another process, keeping that version")
+            return None
+        except BaseException:
+            context_access.mark_dirty(context, dirty)
+            raise
+        if self.journal:
+            session._journal = written
+        if delta:
+            hibernation_metrics.incr("checkpoint_deltas")
+        elif cursor is not None:
+            hibernation_metrics.incr("compactions")
+        return len(data)
+
+    async def _checkpoint(self, session: TutorSession) -> None:
+        """Write ``session`` to the shared store, keeping it resident"""
+        written = await self._write(session)
+        if written:
+            hibernation_metrics.incr("checkpoints")
+            hibernation_metrics.incr("bytes_written", written)
+
+    async def _hibernate(self, session: TutorSession, reason: str) -> bool:
+        """Write ``session`` to the store and drop it, unless a turn is running"""
+        with self._lock:
+            if self._sessions.get(session.session_id) is not session or session._lock.locked():
+                return False
+            del self._sessions[session.session_id]
+            self._hibernating[session.session_id] = session
+        # Encoded on the loop thread, so no turn can change the session meanwhile
+        written = await self._write(session)
+        with self._lock:
+            if self._hibernating.pop(session.session_id, None) is None:
+                # Used again (or closed) while being written; a shared store
+                # keeps the copy of a session that is still in use
+                if not self.shared or session.session_id not in self._sessions:
+                    self.store.discard(session.session_id)
+                return False
+        hibernation_metrics.incr(f"hibernated_{reason}")
+        if written:
+            hibernation_metrics.incr("bytes_written", written)
+        return True
+
+    @staticmethod
+    def _resident_size(session: TutorSession) -> int:
+        if session._size[0] != session.turns:
+            from memory_profile import session_footprint
+            session._size = (session.turns, session_footprint(session)["total"])
+        return session._size[1]
+
+    async def hibernate_idle(self) -> int:
+        """Hibernate idle sessions, then least recently used ones while over the budget"""
+        hibernated = 0
+        if self.idle_seconds is not None:
+            cutoff = time.monotonic() - self.idle_seconds
+            with self._lock:
+                idle = [s for s in self._sessions.values() if s.last_active <= cutoff]
+            for session in idle:
+                hibernated += await self._hibernate(session, "idle")
+        if self.budget_bytes is not None:
+            with self._lock:
+                sessions = sorted(self._sessions.values(), key=lambda s: s.last_active)
+            sizes = [self._resident_size(session) for session in sessions]
+            resident = sum(sizes)
+            for session, size in zip(sessions, sizes):
+                if resident <= self.budget_bytes:
+                    break
+                if await self._hibernate(session, "budget"):
+                    resident -= size
+                    hibernated += 1
+        return hibernated
+
+    async def _sweep_forever(self) -> None:
+        interval = SWEEP_SECONDS
+        if self.idle_seconds is not None:
+            interval = max(1.0, min(interval, self.idle_seconds / 4))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.hibernate_idle()
+            except Exception as e:
+                print(f"⚠️ Session hibernation sweep failed: {e}")
+
+    # TURNS
+
+    def run(self, coro):
+        """Run a coroutine on the runtime loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def turn(
+        self,
+        session_id: str,
+        user_input: str | None = None,
+        agent_key: str | None = None,
+        channel: str = "",
+    ) -> AsyncIterator[TurnEvent]:
+        """Run a turn on the calling loop (checkpointed when sessions are shared)"""
+        with turn_gate.track():
+            session = self.session(session_id)
+            opening = None
+            if self.warm_pool is not None and user_input == OPENING_MESSAGE and not session.turns:
+                self.loop  # the pool is refilled on the runtime loop
+                opening = self.warm_pool.take(session.graph_path, agent_key)
+            if opening is not None and await session.adopt_opening(opening, channel):
+                for event in opening.events:
+                    yield event
+            else:
+                async for event in session.stream_turn(user_input, agent_key, channel):
+                    yield event
+            if self.shared:
+                await self._checkpoint(session)
+
+    def stream(
+        self,
+        session_id: str,
+        user_input: str | None = None,
+        agent_key: str | None = None,
+        channel: str = "",
+    ) -> Iterator[TurnEvent]:
+        """Run a turn on the runtime loop, yielding its events in the calling thread"""
+        events: queue.Queue[TurnEvent | None] = queue.Queue()
+
+        async def pump():
+            try:
+                # The session is looked up on the loop, so it can't be
+                # hibernated before the turn holds its lock
+                async for event in self.turn(session_id, user_input, agent_key, channel):
+                    events.put(event)
+            except Exception as e:
+                events.put(TurnEvent(ERROR, text=str(e)))
+            finally:
+                events.put(None)
+
+        asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        while (event := events.get()) is not None:
+            yield event
+
+
+runtime = SessionRuntime()
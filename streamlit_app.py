@@ -5,20 +5,20 @@ from typing import Dict, Any, List
 import time
 from datetime import datetime
 
-# Import your educational system
+# Import your educational system (agents and model clients are built on first use)
 from main import (
     StudentLearningContext,
-    screener_agent,
-    teaching_agent,
-    quiz_agent,
-    Runner,
-    MessageOutputItem,
-    HandoffOutputItem,
-    ToolCallItem,
-    ToolCallOutputItem,
-    ItemHelpers
+    agent_registry,
+    get_endpoint_pool,
+    get_model_router,
+    graph_path_for_session
 )
-from openai.types.responses import ResponseTextDeltaEvent
+from context_access import context_access
+from learning_flow import HandoffRejected, flow_metrics
+from memory_profile import get_memory_profiler, streamlit_footprint
+from session_export import get_session_exporter, rows_from_history
+from session_runtime import ShuttingDown, turn_gate
+from telemetry import streaming_metrics
 
 # Page configuration
 st.set_page_config(
@@ -214,17 +214,23 @@ st.markdown("""
 def init_session_state():
     if 'conversation_history' not in st.session_state:
         st.session_state.conversation_history = []
+    if 'conversation_id' not in st.session_state:
+        st.session_state.conversation_id = uuid.uuid4().hex[:16]
+    if 'graph_path' not in st.session_state:
+        # Agent graph (flow / A/B variant) used for this session
+        st.session_state.graph_path = graph_path_for_session(
+            st.session_state.conversation_id)
     if 'current_agent' not in st.session_state:
-        st.session_state.current_agent = screener_agent
+        st.session_state.current_agent = agent_registry.entry(
+            st.session_state.graph_path)
     if 'context' not in st.session_state:
-        st.session_state.context = StudentLearningContext()
+        st.session_state.context = StudentLearningContext(
+            session_id=st.session_state.conversation_id)
     if 'input_items' not in st.session_state:
         st.session_state.input_items = [{
             "content": "Hello! I'm ready to start my personalized learning journey.",
             "role": "user"
         }]
-    if 'conversation_id' not in st.session_state:
-        st.session_state.conversation_id = uuid.uuid4().hex[:16]
     if 'system_initialized' not in st.session_state:
         st.session_state.system_initialized = False
 
@@ -302,8 +308,22 @@ def display_progress_tracker():
             st.warning("⏳ **Waiting for Teaching**")
 
 
-async def process_agent_interaction_streaming(user_input, progress_placeholder, message_placeholder):
+def export_history():
+    """Export new conversation history rows when YOURTEACHER_EXPORT_DIR is set"""
+    exporter = get_session_exporter()
+    if exporter:
+        session_id = st.session_state.conversation_id
+        exporter.add(session_id, rows_from_history(
+            session_id, st.session_state.conversation_history, exporter.exported(session_id)),
+            st.session_state.context)
+
+
+async def process_agent_interaction_streaming(user_input, progress_placeholder, message_placeholder,
+                                             retried=False):
     """Process interaction with the current agent using streaming"""
+    from agents import ItemHelpers, Runner
+    from openai.types.responses import ResponseTextDeltaEvent
+
     try:
         # Add user input to conversation
         if user_input:
@@ -319,12 +339,17 @@ async def process_agent_interaction_streaming(user_input, progress_placeholder,
                 "timestamp": datetime.now()
             })
 
-        # Use streaming runner
-        result = Runner.run_streamed(
-            st.session_state.current_agent,
-            st.session_state.input_items,
-            context=st.session_state.context
-        )
+        # Undone if the turn is replayed: its tools may have run before the rejected handoff
+        before, _ = context_access.read(st.session_state.context)
+        rows = len(st.session_state.conversation_history)
+
+        # Use streaming runner (context bound for per-turn model routing)
+        with get_model_router().bind(st.session_state.context) as models:
+            result = Runner.run_streamed(
+                st.session_state.current_agent,
+                st.session_state.input_items,
+                context=st.session_state.context
+            )
 
         # Process streaming events
         current_message = ""
@@ -332,7 +357,12 @@ async def process_agent_interaction_streaming(user_input, progress_placeholder,
 
         progress_placeholder.info("🔄 Agent is processing your request...")
 
-        async for event in result.stream_events():
+        events = result.stream_events()
+        def on_turn(turn):
+            # Kept per browser session for the sidebar; streaming_metrics is shared by all of them
+            st.session_state.last_turn = turn
+
+        async for event in streaming_metrics.track(events, st.session_state.current_agent, on_turn, models):
             # Handle raw response events for real-time text streaming
             if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
                 if event.data.delta:
@@ -422,6 +452,7 @@ async def process_agent_interaction_streaming(user_input, progress_placeholder,
         # Update for next iteration
         st.session_state.input_items = final_result.to_input_list()
         st.session_state.current_agent = final_result.last_agent
+        export_history()
 
         # Clear progress indicators
         progress_placeholder.empty()
@@ -429,14 +460,36 @@ async def process_agent_interaction_streaming(user_input, progress_placeholder,
 
         return True
 
+    except HandoffRejected as e:
+        if retried:
+            progress_placeholder.error(f"❌ An error occurred: {str(e)}")
+            message_placeholder.empty()
+            return False
+        # The rejected handoff is filtered out now; replay the same input once
+        flow_metrics.incr("turns_recovered")
+        context_access.restore(st.session_state.context, before)
+        del st.session_state.conversation_history[rows:]
+        progress_placeholder.info(f"↩️ {e.reason}, continuing with the current agent...")
+        return await process_agent_interaction_streaming(
+            None, progress_placeholder, message_placeholder, retried=True)
+
     except Exception as e:
         progress_placeholder.error(f"❌ An error occurred: {str(e)}")
         message_placeholder.empty()
         return False
 
 
-async def process_agent_interaction(user_input):
+async def process_agent_interaction(user_input, retried=False):
     """Fallback non-streaming function for compatibility"""
+    from agents import (
+        HandoffOutputItem,
+        ItemHelpers,
+        MessageOutputItem,
+        Runner,
+        ToolCallItem,
+        ToolCallOutputItem,
+    )
+
     try:
         # Add user input to conversation
         if user_input:
@@ -452,12 +505,17 @@ async def process_agent_interaction(user_input):
                 "timestamp": datetime.now()
             })
 
+        # Undone if the turn is replayed: its tools may have run before the rejected handoff
+        before, _ = context_access.read(st.session_state.context)
+        rows = len(st.session_state.conversation_history)
+
         # Run the agent (non-streaming fallback)
-        result = await Runner.run(
-            st.session_state.current_agent,
-            st.session_state.input_items,
-            context=st.session_state.context
-        )
+        with get_model_router().bind(st.session_state.context):
+            result = await Runner.run(
+                st.session_state.current_agent,
+                st.session_state.input_items,
+                context=st.session_state.context
+            )
 
         # Process results
         for new_item in result.new_items:
@@ -499,9 +557,19 @@ async def process_agent_interaction(user_input):
         # Update for next iteration
         st.session_state.input_items = result.to_input_list()
         st.session_state.current_agent = result.last_agent
+        export_history()
 
         return True
 
+    except HandoffRejected as e:
+        if retried:
+            st.error(f"❌ An error occurred: {str(e)}")
+            return False
+        flow_metrics.incr("turns_recovered")
+        context_access.restore(st.session_state.context, before)
+        del st.session_state.conversation_history[rows:]
+        return await process_agent_interaction(None, retried=True)
+
     except Exception as e:
         st.error(f"❌ An error occurred: {str(e)}")
         return False
@@ -581,6 +649,59 @@ def display_current_agent_info():
     """, unsafe_allow_html=True)
 
 
+def display_streaming_latency():
+    """Display time-to-first-token and inter-token latency percentiles"""
+    last_turn = st.session_state.get("last_turn")
+    if last_turn is None:
+        st.caption("No streamed turns yet.")
+        return
+
+    if last_turn.ttft is not None:
+        st.metric("⚡ Last TTFT", f"{last_turn.ttft * 1000:.0f} ms")
+    if last_turn.total is not None:
+        st.metric("⏱️ Last Turn", f"{last_turn.total * 1000:.0f} ms")
+
+    rows = []
+    for key, entry in sorted(streaming_metrics.summary().items()):
+        for metric, stats in entry.items():
+            if not isinstance(stats, dict):
+                continue
+            rows.append({
+                "agent | model": key,
+                "metric": metric,
+                "n": stats["count"],
+                "p50 ms": round(stats["p50"] * 1000, 1),
+                "p90 ms": round(stats["p90"] * 1000, 1),
+                "p99 ms": round(stats["p99"] * 1000, 1),
+            })
+    st.dataframe(rows, hide_index=True)
+
+    st.caption("🧭 Model routes")
+    routes = [{"route": key, **{k: round(v, 5) for k, v in entry.items()}}
+              for key, entry in sorted(get_model_router().metrics.summary().items())]
+    if routes:
+        st.dataframe(routes, hide_index=True)
+
+    st.caption("🚦 Learning flow handoffs")
+    st.dataframe([flow_metrics.snapshot()], hide_index=True)
+
+    endpoint_pool = get_endpoint_pool()
+    st.caption(f"🩺 Endpoint health (hedged requests: {endpoint_pool.hedged_requests})")
+    st.dataframe(endpoint_pool.health_table(), hide_index=True)
+
+
+def display_memory_footprint():
+    """Footprint of this browser session and top allocators (YOURTEACHER_MEMORY_PROFILE=1)"""
+    profiler = get_memory_profiler()
+    current, peak = profiler.traced()
+    st.caption(f"Traced: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)")
+    st.dataframe([{"part": part, "KB": round(size / 1024, 1)}
+                  for part, size in streamlit_footprint(st.session_state).items()], hide_index=True)
+    if st.button("Top allocators", use_container_width=True):
+        st.dataframe([{"KB": row["size"] / 1024, "site": row["site"]} for row in profiler.top(limit=15)],
+                     hide_index=True)
+
+
 def main():
     # Initialize session state
     init_session_state()
@@ -609,6 +730,15 @@ def main():
                 del st.session_state[key]
             st.rerun()
 
+        # Streaming latency telemetry
+        with st.expander("⏱️ Streaming Latency"):
+            display_streaming_latency()
+
+        # Memory of this session's state, when profiling is enabled
+        if get_memory_profiler():
+            with st.expander("🧠 Memory"):
+                display_memory_footprint()
+
         # Student profile (if available)
         if st.session_state.context.screening_complete:
             st.header("👤 Student Profile")
@@ -656,24 +786,28 @@ def main():
             progress_placeholder = st.empty()
             message_placeholder = st.empty()
 
-            # Use streaming processing
+            # Use streaming processing; a graceful shutdown waits for the turn
             try:
-                success = asyncio.run(
-                    process_agent_interaction_streaming(
-                        user_input.strip(),
-                        progress_placeholder,
-                        message_placeholder
-                    ))
-                if success:
-                    st.rerun()
-            except Exception as e:
-                st.error(
-                    f"Streaming failed, falling back to standard processing: {str(e)}")
-                # Fallback to non-streaming
-                success = asyncio.run(
-                    process_agent_interaction(user_input.strip()))
-                if success:
-                    st.rerun()
+                with turn_gate.track():
+                    try:
+                        success = asyncio.run(
+                            process_agent_interaction_streaming(
+                                user_input.strip(),
+                                progress_placeholder,
+                                message_placeholder
+                            ))
+                        if success:
+                            st.rerun()
+                    except Exception as e:
+                        st.error(
+                            f"Streaming failed, falling back to standard processing: {str(e)}")
+                        # Fallback to non-streaming
+                        success = asyncio.run(
+                            process_agent_interaction(user_input.strip()))
+                        if success:
+                            st.rerun()
+            except ShuttingDown as e:
+                st.warning(f"⏳ {e}")
 
     with col2:
         # Agent workflow diagram
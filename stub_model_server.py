@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub model server.
+
+Serves ``POST .../chat/completions`` (plain JSON and SSE streaming) with
+configurable latency and error injection, so the resilient client, replay and
+load tools can be exercised without a real provider. With ``--prefix-cache``
+it also reports the system prompt of a request whose system prompt and tools
+it has seen before as cached input tokens, like a provider's prompt cache.
+
+Usage:
+    python stub_model_server.py --port 8900 --latency 0.2 --error-rate 0.1
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+Responder = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def echo_responder(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Default reply: a short acknowledgement of the last user message"""
+    last_user = ""
+    for message in reversed(request.get("messages", [])):
+        if message.get("role") == "user":
+            content = message.get("content")
+            last_user = content if isinstance(content, str) else json.dumps(content)
+            break
+    return {"content": f"(stub) You said: {last_user[:200]}"}
+
+
+class StubModelServer:
+    """Minimal asyncio HTTP server speaking the chat completions protocol"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        token_delay: float = 0.0,
+        responder: Responder = echo_responder,
+        seed: int | None = None,
+        prefix_cache: bool = False,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_delay = token_delay
+        self.responder = responder
+        self.prefix_cache = prefix_cache
+        self._prefixes: set = set()
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1/"
+
+    async def start(self) -> "StubModelServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "StubModelServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            if method != "POST" or not path.rstrip("/").endswith("chat/completions"):
+                await self._send_json(writer, 404, {"error": {"message": f"No route {path}"}})
+                return
+
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if delay:
+                await asyncio.sleep(delay)
+            if self._random.random() < self.error_rate:
+                self.errors += 1
+                await self._send_json(writer, 500, {"error": {"message": "Injected stub failure"}})
+                return
+
+            request = json.loads(body or b"{}")
+            # Session of the call, when the client names it (YOURTEACHER_SESSION_HEADER, see model_routing.py)
+            request["_session_id"] = headers.get("x-yourteacher-session")
+            if self.prefix_cache:
+                request["_cached_tokens"] = self._cached_tokens(request)
+            reply = self.responder(request)
+            if request.get("stream"):
+                await self._send_stream(writer, request, reply)
+            else:
+                await self._send_json(writer, 200, self._completion(request, reply))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _cached_tokens(self, request: Dict[str, Any]) -> int:
+        """Tokens of the system prompt if this system prompt and tool set were seen before"""
+        messages = request.get("messages") or [{}]
+        if messages[0].get("role") != "system":
+            return 0
+        prefix = json.dumps([messages[0], request.get("tools")], sort_keys=True).encode()
+        digest = hashlib.sha256(prefix).digest()
+        if digest not in self._prefixes:
+            self._prefixes.add(digest)
+            return 0
+        return len(str(messages[0].get("content") or "").split())
+
+    @staticmethod
+    def _usage(request: Dict[str, Any], reply: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_tokens = sum(
+            len(str(message.get("content") or "").split())
+            for message in request.get("messages", []))
+        completion_tokens = len((reply.get("content") or "").split())
+        usage: Dict[str, Any] = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if "_cached_tokens" in request:
+            usage["prompt_tokens_details"] = {"cached_tokens": request["_cached_tokens"]}
+        return usage
+
+    @staticmethod
+    def _tool_calls(reply: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))},
+            }
+            for call in reply.get("tool_calls", [])
+        ]
+
+    def _completion(self, request: Dict[str, Any], reply: Dict[str, Any]) -> Dict[str, Any]:
+        message: Dict[str, Any] = {"role": "assistant", "content": reply.get("content")}
+        tool_calls = self._tool_calls(reply)
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": self._usage(request, reply),
+        }
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode()
+        reason = {200: "OK", 404: "Not Found", 500: "Internal Server Error"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _send_stream(self, writer: asyncio.StreamWriter, request: Dict[str, Any], reply: Dict[str, Any]) -> None:
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = request.get("model", "stub")
+
+        def chunk(delta: Dict[str, Any], finish_reason: str | None = None, usage=None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if usage is not None:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        writer.write(chunk({"role": "assistant", "content": ""}))
+
+        words = (reply.get("content") or "").split(" ")
+        for i, word in enumerate(w for w in words if w):
+            writer.write(chunk({"content": word if i == 0 else f" {word}"}))
+            await writer.drain()
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+
+        tool_calls = self._tool_calls(reply)
+        for index, call in enumerate(tool_calls):
+            writer.write(chunk({"tool_calls": [{"index": index, **call}]}))
+
+        writer.write(chunk({}, "tool_calls" if tool_calls else "stop"))
+        writer.write(chunk(None, usage=self._usage(request, reply)))
+        writer.write(b"data: [DONE]\n\n")
+        await writer.drain()
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    server = StubModelServer(
+        host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, token_delay=args.token_delay, prefix_cache=args.prefix_cache)
+    await server.start()
+    print(f"🧪 Stub model server listening on {server.base_url}")
+    print("💡 Use Ctrl+C to stop the server")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before responding")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Delay between streamed tokens")
+    parser.add_argument("--prefix-cache", action="store_true", help="Report repeated system prompts as cached tokens")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        print("\n🛑 Stub server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,639 @@
+"""
+Study material ingestion and retrieval.
+
+Uploaded PDF, PowerPoint and Word files are streamed page by page through text
+extraction and chunking into an on-disk index directory. Retrieval uses BM25
+over an inverted index whose arrays are NumPy files opened memory-mapped, so
+opening an index is cheap and lookups stay in the low milliseconds at 100k
+chunks. The teaching agent reaches it through the ``search_study_materials``
+tool.
+
+Index directory layout (all append-only except the postings):
+    chunks.txt     UTF-8 chunk texts, back to back
+    chunks.idx     int64 end offset of each chunk in chunks.txt
+    chunks.src     int32 (source id, page) per chunk
+    terms.u32      hashed term ids of each chunk (unique per chunk)
+    terms.tf       uint16 term frequencies aligned with terms.u32
+    terms.idx      int64 end offset of each chunk in terms.u32
+    postings_*.npy inverted index rebuilt by ``commit()``
+    manifest.json  sources, their content digests, chunk counts and BM25 statistics
+
+A file whose name and content are already indexed is skipped, so the same
+upload or ``ingest`` run twice does not index duplicate chunks.
+
+PDF extraction needs the optional ``pypdf`` package; DOCX and PPTX are read
+with the standard library. Large uploads go through material_ingest.py, which
+runs extraction and tokenization in a process pool.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple
+from xml.etree import ElementTree
+
+import numpy as np
+
+SUPPORTED_TYPES = ("pdf", "pptx", "docx", "txt", "md")
+
+TERM_BITS = 20  # hashed vocabulary of 2**20 buckets
+TERM_MASK = (1 << TERM_BITS) - 1
+
+CHUNK_WORDS = 160
+CHUNK_OVERLAP = 32
+
+BUILD_BLOCK = 1 << 20  # term entries processed at a time by commit()
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were will with".split())
+
+_STORE_FILES = ("chunks.txt", "chunks.idx", "chunks.src", "terms.u32", "terms.tf", "terms.idx")
+
+_DOCX_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+
+class MaterialsError(ValueError):
+    """Raised for unsupported or unreadable study material"""
+
+
+@dataclass(frozen=True)
+class Hit:
+    score: float
+    source: str
+    page: int
+    text: str
+
+
+# TEXT EXTRACTION
+
+def _pdf_pages(stream: BinaryIO) -> Iterator[Tuple[int, str]]:
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise MaterialsError("PDF uploads need the 'pypdf' package (pip install pypdf)") from e
+    reader = PdfReader(stream)
+    for number, page in enumerate(reader.pages, start=1):
+        yield number, page.extract_text() or ""
+
+
+def _docx_pages(stream: BinaryIO) -> Iterator[Tuple[int, str]]:
+    # Word has no stored page breaks; every ~40 paragraphs count as one page
+    with zipfile.ZipFile(stream) as archive:
+        with archive.open("word/document.xml") as xml:
+            paragraphs = []
+            page = 1
+            body = None
+            for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+                if event == "start":
+                    if element.tag == f"{_DOCX_NS}body":
+                        body = element
+                    continue
+                if element.tag != f"{_DOCX_NS}p":
+                    continue
+                text = "".join(node.text or "" for node in element.iter(f"{_DOCX_NS}t"))
+                # Drop parsed paragraphs so memory does not grow with the document
+                element.clear()
+                if body is not None:
+                    body.clear()
+                if text:
+                    paragraphs.append(text)
+                if len(paragraphs) >= 40:
+                    yield page, "\n".join(paragraphs)
+                    paragraphs = []
+                    page += 1
+            if paragraphs:
+                yield page, "\n".join(paragraphs)
+
+
+def _pptx_pages(stream: BinaryIO) -> Iterator[Tuple[int, str]]:
+    with zipfile.ZipFile(stream) as archive:
+        slides = sorted(
+            (name for name in archive.namelist()
+             if re.fullmatch(r"ppt/slides/slide\d+\.xml", name)),
+            key=lambda name: int(re.search(r"\d+", name.rsplit("/", 1)[1]).group()))
+        for number, name in enumerate(slides, start=1):
+            root = ElementTree.fromstring(archive.read(name))
+            yield number, " ".join(node.text or "" for node in root.iter(f"{_DRAWING_NS}t"))
+
+
+def _text_pages(stream: BinaryIO) -> Iterator[Tuple[int, str]]:
+    # Plain text: every 60 lines count as one page
+    lines = []
+    page = 1
+    for line in io.TextIOWrapper(stream, encoding="utf-8", errors="replace"):
+        lines.append(line)
+        if len(lines) >= 60:
+            yield page, "".join(lines)
+            lines = []
+            page += 1
+    if lines:
+        yield page, "".join(lines)
+
+
+_EXTRACTORS = {
+    "pdf": _pdf_pages,
+    "pptx": _pptx_pages,
+    "docx": _docx_pages,
+    "txt": _text_pages,
+    "md": _text_pages,
+}
+
+
+def extract_pages(name: str, stream: BinaryIO) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for an uploaded file, one page at a time"""
+    suffix = os.path.splitext(name)[1].lower().lstrip(".")
+    if suffix not in _EXTRACTORS:
+        raise MaterialsError(f"Unsupported file type '{suffix}'. Supported: {', '.join(SUPPORTED_TYPES)}")
+    try:
+        yield from _EXTRACTORS[suffix](stream)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise MaterialsError(f"Could not read '{name}': {e}") from e
+
+
+def chunk_pages(
+    pages: Iterable[Tuple[int, str]],
+    size: int = CHUNK_WORDS,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[Tuple[int, str]]:
+    """Split page texts into overlapping word windows; yields (page, chunk text)"""
+    step = max(1, size - overlap)
+    for page, text in pages:
+        words = text.split()
+        for start in range(0, max(len(words) - overlap, 1), step):
+            window = words[start:start + size]
+            if window:
+                yield page, " ".join(window)
+
+
+# TOKENIZATION
+
+def tokenize(text: str) -> List[int]:
+    """Hashed term ids (stable across processes) for the words in ``text``"""
+    return [zlib.crc32(word.encode()) & TERM_MASK
+            for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def term_counts(text: str) -> Tuple[np.ndarray, np.ndarray, int]:
+    """(unique term ids, their frequencies, token count) for one chunk"""
+    tokens = np.asarray(tokenize(text), dtype=np.uint32)
+    if tokens.size == 0:
+        return tokens, np.zeros(0, dtype=np.uint16), 0
+    terms, counts = np.unique(tokens, return_counts=True)
+    return terms, np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16), int(tokens.size)
+
+
+def content_digest(stream: BinaryIO) -> str:
+    """SHA-256 of a stream's content from the start, leaving it rewound"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(1 << 20), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _read_array(path: str, dtype) -> np.ndarray:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+# INDEX
+
+class ChunkWriter:
+    """Appends chunks to an index directory's chunk store (see MaterialIndex.writer)"""
+
+    def __init__(self, path: str, source_id: int):
+        self.source_id = source_id
+        self.added = 0
+        self.tokens = 0
+        self._sizes = {name: os.path.getsize(os.path.join(path, name))
+                       if os.path.exists(os.path.join(path, name)) else 0
+                       for name in _STORE_FILES}
+        self._text_end = self._sizes["chunks.txt"]
+        self._term_end = self._sizes["terms.u32"] // 4
+        self._files = {name: open(os.path.join(path, name), "ab") for name in _STORE_FILES}
+
+    def write(self, page: int, text: str, counts: Tuple[np.ndarray, np.ndarray, int] | None = None) -> None:
+        """Append one chunk; ``counts`` is its precomputed ``term_counts(text)``"""
+        terms, tfs, token_count = counts if counts is not None else term_counts(text)
+        encoded = text.encode("utf-8")
+        self._files["chunks.txt"].write(encoded)
+        self._text_end += len(encoded)
+        np.asarray([self._text_end], dtype=np.int64).tofile(self._files["chunks.idx"])
+        np.asarray([self.source_id, page], dtype=np.int32).tofile(self._files["chunks.src"])
+
+        terms.tofile(self._files["terms.u32"])
+        tfs.tofile(self._files["terms.tf"])
+        self._term_end += terms.size
+        np.asarray([self._term_end], dtype=np.int64).tofile(self._files["terms.idx"])
+
+        self.tokens += token_count
+        self.added += 1
+
+    def rollback(self) -> None:
+        for name, handle in self._files.items():
+            handle.truncate(self._sizes[name])
+        self.added = self.tokens = 0
+
+    def close(self) -> None:
+        for handle in self._files.values():
+            handle.close()
+
+
+class _Reader:
+    """Mapped postings and chunk texts of one committed version, closed after its last search"""
+
+    def __init__(self, index: "MaterialIndex"):
+        self.postings = {
+            name: np.load(index._file(f"postings_{name}.npy"), mmap_mode="r")
+            for name in ("offsets", "docs", "tf", "doclen")
+        }
+        self.text_ends = _read_array(index._file("chunks.idx"), np.int64)
+        self.sources = _read_array(index._file("chunks.src"), np.int32).reshape(-1, 2)
+        self.source_names = list(index.manifest["sources"])
+        self.avgdl = index.manifest["avgdl"] or 1.0
+        self.texts_fd = os.open(index._file("chunks.txt"), os.O_RDONLY)
+        self.users = 0
+        self.retired = False
+
+    def close(self) -> None:
+        os.close(self.texts_fd)
+
+
+class MaterialIndex:
+    """Append-only chunk store plus a memory-mapped BM25 inverted index"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._manifest_path = os.path.join(path, "manifest.json")
+        self._lock = threading.Lock()
+        self.manifest = self._read_manifest()
+        self._reader: _Reader | None = None
+        self._reader_lock = threading.Lock()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_manifest(self) -> Dict:
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                return json.load(f)
+        return {"version": 1, "sources": [], "chunks": 0, "tokens": 0, "committed": 0}
+
+    def _write_manifest(self) -> None:
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self._manifest_path)
+
+    def __len__(self) -> int:
+        return self.manifest["chunks"]
+
+    @property
+    def sources(self) -> List[str]:
+        return list(self.manifest["sources"])
+
+    def indexed(self, source: str, digest: str) -> bool:
+        """Whether ``source`` was already indexed with the content ``digest``"""
+        return digest in self.manifest.get("digests", {}).get(source, [])
+
+    # Writing
+
+    @contextlib.contextmanager
+    def writer(self, source: str, digest: str | None = None) -> Iterator["ChunkWriter"]:
+        """
+        Append chunks for ``source`` through the yielded writer. Everything written
+        is rolled back if the block raises; call ``commit()`` afterwards to make
+        the chunks searchable. ``digest`` (``content_digest`` of the file) is
+        recorded so ``indexed`` recognizes the file next time.
+        """
+        with self._lock:
+            sources = self.manifest["sources"]
+            source_id = sources.index(source) if source in sources else len(sources)
+            writer = ChunkWriter(self.path, source_id)
+            try:
+                yield writer
+            except BaseException:
+                writer.rollback()
+                raise
+            finally:
+                writer.close()
+
+            if source_id == len(sources):
+                sources.append(source)
+            if digest is not None:
+                self.manifest.setdefault("digests", {}).setdefault(source, []).append(digest)
+            self.manifest["chunks"] += writer.added
+            self.manifest["tokens"] += writer.tokens
+            self._write_manifest()
+
+    def append_chunks(self, source: str, chunks: Iterable[Tuple[int, str]]) -> int:
+        """Append (page, text) chunks for ``source``; call ``commit()`` to make them searchable"""
+        with self.writer(source) as writer:
+            for page, text in chunks:
+                writer.write(page, text)
+        return writer.added
+
+    def add_document(self, name: str, stream: BinaryIO) -> int:
+        """Extract, chunk and index an uploaded file; returns the number of chunks added
+
+        A file already indexed under ``name`` with the same content adds nothing.
+        """
+        if not stream.seekable():
+            stream = io.BytesIO(stream.read())
+        digest = content_digest(stream)
+        if self.indexed(name, digest):
+            return 0
+        with self.writer(name, digest) as writer:
+            for page, text in chunk_pages(extract_pages(name, stream)):
+                writer.write(page, text)
+        self.commit()
+        return writer.added
+
+    def commit(self) -> float:
+        """
+        Rebuild the inverted index from the chunk store; returns build seconds.
+
+        The store is read in blocks of ``BUILD_BLOCK`` term entries and the
+        postings are written out one term range at a time, so memory use does
+        not grow with the size of the store. New files replace the old ones
+        atomically, leaving readers that still map the old postings unaffected.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            chunk_count = self.manifest["chunks"]
+            ends = np.fromfile(self._file("terms.idx"), dtype=np.int64, count=chunk_count) \
+                if chunk_count else np.zeros(0, dtype=np.int64)
+            total = int(ends[-1]) if chunk_count else 0
+            buckets = 1 << TERM_BITS
+
+            # Pass 1: postings list lengths and chunk lengths
+            offsets = np.zeros(buckets + 1, dtype=np.int64)
+            doc_len = np.zeros(chunk_count, dtype=np.float32)
+            for block_terms, block_docs, block_tfs in self._term_blocks(ends):
+                offsets[1:] += np.bincount(block_terms, minlength=buckets)
+                first_doc = int(block_docs[0])
+                doc_len[first_doc:int(block_docs[-1]) + 1] += np.bincount(
+                    block_docs - first_doc, weights=block_tfs).astype(np.float32)
+            np.cumsum(offsets, out=offsets)
+
+            # Pass 2: one term range (about BUILD_BLOCK postings) at a time, in
+            # term order; blocks are read in chunk order so each list stays sorted.
+            tmp = {name: self._file(f"postings_{name}.tmp.npy") for name in ("offsets", "docs", "tf", "doclen")}
+            with open(tmp["docs"], "wb") as docs_out, open(tmp["tf"], "wb") as tf_out:
+                np.lib.format.write_array_header_1_0(
+                    docs_out, {"descr": "<i4", "fortran_order": False, "shape": (total,)})
+                np.lib.format.write_array_header_1_0(
+                    tf_out, {"descr": "<f4", "fortran_order": False, "shape": (total,)})
+                low = 0
+                while low < buckets:
+                    high = max(int(np.searchsorted(offsets, offsets[low] + BUILD_BLOCK, side="right")) - 1,
+                               low + 1)
+                    selected_terms, selected_docs, selected_tfs = [], [], []
+                    for block_terms, block_docs, block_tfs in self._term_blocks(ends):
+                        mask = (block_terms >= low) & (block_terms < high)
+                        selected_terms.append(block_terms[mask])
+                        selected_docs.append(block_docs[mask])
+                        selected_tfs.append(block_tfs[mask])
+                    if selected_terms:
+                        order = np.argsort(np.concatenate(selected_terms), kind="stable")
+                        np.concatenate(selected_docs)[order].tofile(docs_out)
+                        np.concatenate(selected_tfs)[order].astype(np.float32).tofile(tf_out)
+                    low = high
+            np.save(tmp["offsets"], offsets)
+            np.save(tmp["doclen"], doc_len)
+            for name, path in tmp.items():
+                os.replace(path, self._file(f"postings_{name}.npy"))
+
+            self.manifest["committed"] = chunk_count
+            self.manifest["avgdl"] = float(doc_len.mean()) if chunk_count else 0.0
+            self.manifest["build_seconds"] = time.perf_counter() - started
+            self._write_manifest()
+            self.close()
+        return self.manifest["build_seconds"]
+
+    def _term_blocks(self, ends: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """(term ids, chunk ids, term frequencies) blocks covering the committed chunks"""
+        total = int(ends[-1]) if ends.size else 0
+        if not total:
+            return
+        starts = np.concatenate(([0], ends[:-1]))
+        with open(self._file("terms.u32"), "rb") as terms, open(self._file("terms.tf"), "rb") as tfs:
+            for first in range(0, total, BUILD_BLOCK):
+                last = min(first + BUILD_BLOCK, total)
+                lo = int(np.searchsorted(ends, first, side="right"))
+                hi = int(np.searchsorted(ends, last - 1, side="right")) + 1
+                per_chunk = np.minimum(ends[lo:hi], last) - np.maximum(starts[lo:hi], first)
+                yield (np.fromfile(terms, dtype=np.uint32, count=last - first),
+                       np.repeat(np.arange(lo, hi, dtype=np.int32), per_chunk),
+                       np.fromfile(tfs, dtype=np.uint16, count=last - first))
+
+    # Reading
+
+    @contextlib.contextmanager
+    def _reading(self) -> Iterator[_Reader | None]:
+        """The current reader (None before the first commit), kept open until the block ends
+
+        ``close`` (called by ``commit`` and ``open_index``) only retires the
+        reader; searches still using it keep it until they finish.
+        """
+        with self._reader_lock:
+            if self._reader is None and self.manifest.get("committed"):
+                self._reader = _Reader(self)
+            reader = self._reader
+            if reader is not None:
+                reader.users += 1
+        try:
+            yield reader
+        finally:
+            if reader is not None:
+                with self._reader_lock:
+                    reader.users -= 1
+                    if reader.retired and not reader.users:
+                        reader.close()
+
+    def close(self) -> None:
+        with self._reader_lock:
+            reader, self._reader = self._reader, None
+            if reader is not None:
+                reader.retired = True
+                if not reader.users:
+                    reader.close()
+
+    def chunk_text(self, chunk: int) -> str:
+        with self._reading() as reader:
+            return self._chunk_text(reader, chunk)
+
+    @staticmethod
+    def _chunk_text(reader: _Reader, chunk: int) -> str:
+        ends = reader.text_ends
+        start = int(ends[chunk - 1]) if chunk else 0
+        raw = os.pread(reader.texts_fd, int(ends[chunk]) - start, start)
+        return raw.decode("utf-8", errors="replace")
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every committed chunk for ``query``"""
+        with self._reading() as reader:
+            return self._scores(reader, query)
+
+    @staticmethod
+    def _scores(reader: _Reader | None, query: str) -> np.ndarray:
+        if reader is None:
+            return np.zeros(0, dtype=np.float32)
+        offsets, docs, tfs, doc_len = (reader.postings[k] for k in ("offsets", "docs", "tf", "doclen"))
+        n = doc_len.shape[0]
+        avgdl = reader.avgdl
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            start, end = int(offsets[term]), int(offsets[term + 1])
+            if start == end:
+                continue
+            ids = docs[start:end]
+            tf = tfs[start:end]
+            df = end - start
+            idf = np.log1p((n - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[ids] / avgdl)
+            scores[ids] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 5) -> List[Hit]:
+        """Top ``k`` chunks for ``query`` by BM25 score"""
+        with self._reading() as reader:
+            scores = self._scores(reader, query)
+            if scores.size == 0:
+                return []
+            k = min(k, scores.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                Hit(
+                    score=float(scores[chunk]),
+                    source=reader.source_names[reader.sources[chunk, 0]],
+                    page=int(reader.sources[chunk, 1]),
+                    text=self._chunk_text(reader, int(chunk)),
+                )
+                for chunk in top if scores[chunk] > 0
+            ]
+
+
+_open_indexes: Dict[str, Tuple[float, MaterialIndex]] = {}
+_open_lock = threading.Lock()
+
+
+def open_index(path: str) -> MaterialIndex:
+    """Shared reader for ``path``, reopened only when its manifest changes"""
+    path = os.path.abspath(path)
+    manifest = os.path.join(path, "manifest.json")
+    stamp = os.stat(manifest).st_mtime_ns if os.path.exists(manifest) else 0
+    with _open_lock:
+        cached = _open_indexes.get(path)
+        if cached is None or cached[0] != stamp:
+            if cached is not None:
+                cached[1].close()
+            cached = (stamp, MaterialIndex(path))
+            _open_indexes[path] = cached
+        return cached[1]
+
+
+def default_materials_dir(session_id: str) -> str:
+    """Index directory for a session (under ``YOURTEACHER_MATERIALS_DIR``)"""
+    root = os.getenv("YOURTEACHER_MATERIALS_DIR", os.path.join(".yourteacher", "materials"))
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_-]", "_", session_id))
+
+
+# BENCHMARK
+
+def _synthetic_chunks(count: int, seed: int = 0) -> Iterator[Tuple[int, str]]:
+    rng = np.random.default_rng(seed)
+    # Zipf-distributed vocabulary, roughly like natural text
+    vocabulary = [f"w{i}" for i in range(50_000)]
+    ranks = np.minimum(rng.zipf(1.2, size=count * CHUNK_WORDS), len(vocabulary)) - 1
+    for i in range(count):
+        words = ranks[i * CHUNK_WORDS:(i + 1) * CHUNK_WORDS]
+        yield i // 4 + 1, " ".join(vocabulary[w] for w in words)
+
+
+def benchmark(path: str, chunks: int, queries: int) -> Dict[str, float]:
+    index = MaterialIndex(path)
+    if len(index) < chunks:
+        started = time.perf_counter()
+        index.append_chunks("synthetic.txt", _synthetic_chunks(chunks - len(index)))
+        print(f"📥 Appended {chunks} chunks in {time.perf_counter() - started:.1f}s")
+        index.commit()
+        print(f"🧱 Built postings in {index.manifest['build_seconds']:.2f}s")
+
+    index = open_index(path)
+    rng = np.random.default_rng(1)
+    timings = []
+    for _ in range(queries):
+        query = " ".join(f"w{w}" for w in rng.integers(0, 2000, size=4))
+        started = time.perf_counter()
+        index.search(query, k=5)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "chunks": float(len(index)),
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p99_ms": timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000,
+        "max_ms": timings[-1] * 1000,
+    }
+
+
+def main():
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Study material index tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="Add files to an index directory")
+    ingest.add_argument("index")
+    ingest.add_argument("files", nargs="+")
+    search = sub.add_parser("search", help="Query an index directory")
+    search.add_argument("index")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=5)
+    bench = sub.add_parser("bench", help="Lookup latency on a synthetic index")
+    bench.add_argument("--chunks", type=int, default=100_000)
+    bench.add_argument("--queries", type=int, default=500)
+    bench.add_argument("--index", help="Reuse this directory (default: temporary)")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        index = MaterialIndex(args.index)
+        for file_path in args.files:
+            with open(file_path, "rb") as f:
+                if index.indexed(os.path.basename(file_path), content_digest(f)):
+                    print(f"⏭️ {file_path}: already indexed")
+                    continue
+                added = index.add_document(os.path.basename(file_path), f)
+            print(f"✅ {file_path}: {added} chunks")
+    elif args.command == "search":
+        for hit in open_index(args.index).search(args.query, args.k):
+            print(f"[{hit.score:.2f}] {hit.source} p.{hit.page}: {hit.text[:160]}")
+    else:
+        path = args.index or tempfile.mkdtemp(prefix="yourteacher-index-")
+        result = benchmark(path, args.chunks, args.queries)
+        print(f"🔎 {int(result['chunks'])} chunks: p50 {result['p50_ms']:.2f} ms, "
+              f"p99 {result['p99_ms']:.2f} ms, max {result['max_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
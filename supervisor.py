@@ -0,0 +1,500 @@
+"""
+Multi-process supervisor with sticky session routing.
+
+One Streamlit process is one interpreter (one GIL) for every student. The
+supervisor starts N worker processes on ports ``port+1 .. port+N`` and a small
+asyncio reverse proxy on ``port``. The proxy gives each browser a
+``yourteacher_sid`` cookie and sends every connection (page requests and
+Streamlit's websocket) to the worker that cookie hashes to (rendezvous
+hashing: when a worker is down, only its sessions move, to their next
+choice). Routing is decided by the first request of a connection.
+
+Session ids are generated by the proxy and signed with
+``YOURTEACHER_SESSION_SECRET`` (a random secret per proxy when unset), so a
+client cannot pick another student's id or a path-like one: a missing,
+malformed or unsigned cookie is replaced by a fresh id before the request
+reaches a worker.
+
+Workers run with ``YOURTEACHER_SESSION_SHARED=1``: sessions are checkpointed
+to the shared session store after every turn (see session_hibernation.py),
+and frontend.py derives its session id from the cookie, so a session survives a
+worker restart or a move to another worker. Crashed workers are restarted.
+
+Usage:
+    python supervisor.py serve --workers 4 --port 8501
+    python supervisor.py bench --workers 1 2 4 --sessions 32 --turns 6
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from session_hibernation import valid_session_id
+
+SESSION_COOKIE = "yourteacher_sid"
+MAX_HEAD_BYTES = 64 * 1024
+DOWN_SECONDS = 2.0  # a worker that refused a connection is skipped this long
+RESTART_BACKOFF = (0.5, 30.0)  # first and longest delay before restarting a crashed worker
+
+Backend = Tuple[str, int]
+
+
+def rendezvous(session_id: str, backends: List[Backend]) -> List[Backend]:
+    """``backends`` in this session's order of preference"""
+    def score(backend: Backend) -> bytes:
+        return hashlib.blake2b(f"{session_id}|{backend[0]}:{backend[1]}".encode(), digest_size=8).digest()
+    return sorted(backends, key=score, reverse=True)
+
+
+def _session_secret() -> bytes:
+    secret = os.getenv("YOURTEACHER_SESSION_SECRET")
+    return secret.encode() if secret else secrets.token_bytes(32)
+
+
+def _cookie(head: bytes, name: str) -> str | None:
+    for line in head.split(b"\r\n")[1:]:
+        key, _, value = line.partition(b":")
+        if key.strip().lower() != b"cookie":
+            continue
+        for pair in value.decode("latin-1").split(";"):
+            cookie_name, _, cookie_value = pair.strip().partition("=")
+            if cookie_name == name and cookie_value:
+                return cookie_value
+    return None
+
+
+def _with_cookie(head: bytes, name: str, value: str) -> bytes:
+    """Request head with cookie ``name`` (wherever the client put it) replaced by ``value``"""
+    lines = [head.split(b"\r\n")[0]]
+    for line in head.split(b"\r\n")[1:]:
+        if not line:
+            continue
+        key, _, cookies = line.partition(b":")
+        if key.strip().lower() == b"cookie":
+            pairs = [pair.strip() for pair in cookies.decode("latin-1").split(";")]
+            pairs = [pair for pair in pairs if pair and pair.partition("=")[0] != name]
+            if not pairs:
+                continue
+            line = b"Cookie: " + "; ".join(pairs).encode("latin-1")
+        lines.append(line)
+    lines.append(f"Cookie: {name}={value}".encode())
+    return b"\r\n".join(lines) + b"\r\n\r\n"
+
+
+# PROXY
+
+class StickyProxy:
+    """Reverse proxy routing each session cookie to one backend"""
+
+    def __init__(self, backends: List[Backend], host: str = "127.0.0.1", port: int = 8501):
+        self.backends = backends
+        self.host = host
+        self.port = port
+        self._secret = _session_secret()
+        self.routed: Counter = Counter()
+        self._down_until: Dict[Backend, float] = {}
+        self._server: asyncio.base_events.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_HEAD_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _signature(self, token: str) -> str:
+        return hmac.new(self._secret, token.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def new_session_id(self) -> str:
+        token = secrets.token_hex(12)
+        return f"{token}-{self._signature(token)}"
+
+    def accepts(self, session_id: str | None) -> bool:
+        """True for ids this proxy generated"""
+        if not valid_session_id(session_id):
+            return False
+        token, _, signature = session_id.rpartition("-")
+        return bool(token) and hmac.compare_digest(signature, self._signature(token))
+
+    async def _connect(self, session_id: str):
+        now = time.monotonic()
+        ranked = rendezvous(session_id, self.backends)
+        # Workers marked down are only tried when every worker is
+        candidates = [b for b in ranked if self._down_until.get(b, 0) <= now] + \
+                     [b for b in ranked if self._down_until.get(b, 0) > now]
+        for backend in candidates:
+            try:
+                reader, writer = await asyncio.open_connection(*backend, limit=MAX_HEAD_BYTES)
+            except OSError:
+                self._down_until[backend] = now + DOWN_SECONDS
+                continue
+            self._down_until.pop(backend, None)
+            self.routed[backend] += 1
+            return reader, writer
+        return None
+
+    async def _handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        backend_writer = None
+        try:
+            head = await client_reader.readuntil(b"\r\n\r\n")
+            session_id = _cookie(head, SESSION_COOKIE)
+            new_session = not self.accepts(session_id)
+            if new_session:
+                session_id = self.new_session_id()
+                # The worker sees the new cookie (and not the client's) on this first request too
+                head = _with_cookie(head, SESSION_COOKIE, session_id)
+            connection = await self._connect(session_id)
+            if connection is None:
+                client_writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n"
+                                    b"Connection: close\r\n\r\n")
+                await client_writer.drain()
+                return
+            backend_reader, backend_writer = connection
+            backend_writer.write(head)
+            await backend_writer.drain()
+            if new_session:
+                response = await backend_reader.readuntil(b"\r\n\r\n")
+                client_writer.write(
+                    response[:-2]
+                    + f"Set-Cookie: {SESSION_COOKIE}={session_id}; Path=/; HttpOnly; SameSite=Lax\r\n\r\n".encode())
+            await asyncio.gather(
+                _pipe(client_reader, backend_writer), _pipe(backend_reader, client_writer))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            for writer in (backend_writer, client_writer):
+                if writer is not None:
+                    writer.close()
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+    except (ConnectionError, OSError):
+        writer.close()
+
+
+# WORKERS
+
+def streamlit_command(app: str, port: int) -> List[str]:
+    return [
+        sys.executable, "-m", "streamlit", "run", app,
+        "--server.port", str(port), "--server.address", "127.0.0.1",
+        "--server.headless", "true", "--browser.gatherUsageStats", "false",
+    ]
+
+
+def turn_worker_command(port: int) -> List[str]:
+    return [sys.executable, os.path.abspath(__file__), "turn-worker", "--port", str(port)]
+
+
+class Supervisor:
+    """Starts the worker processes and restarts the ones that exit"""
+
+    def __init__(self, commands: List[List[str]], env: Dict[str, str] | None = None):
+        self.commands = commands
+        self.env = {**os.environ, "YOURTEACHER_SESSION_SHARED": "1", **(env or {})}
+        self.processes: List[subprocess.Popen | None] = [None] * len(commands)
+        self.restarts = [0] * len(commands)
+        self._stopping = threading.Event()
+        self._watcher: threading.Thread | None = None
+
+    def _spawn(self, number: int) -> None:
+        env = {**self.env, "YOURTEACHER_WORKER": str(number)}
+        self.processes[number] = subprocess.Popen(self.commands[number], env=env)
+
+    def start(self) -> None:
+        for number in range(len(self.commands)):
+            self._spawn(number)
+        self._watcher = threading.Thread(target=self._watch, name="supervisor", daemon=True)
+        self._watcher.start()
+
+    def _watch(self) -> None:
+        delays = [RESTART_BACKOFF[0]] * len(self.commands)
+        while not self._stopping.wait(0.5):
+            for number, process in enumerate(self.processes):
+                if process is None or process.poll() is None:
+                    continue
+                print(f"⚠️ Worker {number} exited with {process.returncode}, restarting in {delays[number]:.1f}s")
+                if self._stopping.wait(delays[number]):
+                    return
+                delays[number] = min(delays[number] * 2, RESTART_BACKOFF[1])
+                self.restarts[number] += 1
+                self._spawn(number)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping.set()
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                process.wait(max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def wait_for_ports(backends: List[Backend], timeout: float = 120.0) -> None:
+    """Block until every backend accepts connections"""
+    import socket
+
+    deadline = time.monotonic() + timeout
+    for backend in backends:
+        while True:
+            try:
+                socket.create_connection(backend, timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Worker {backend[0]}:{backend[1]} did not start")
+                time.sleep(0.2)
+
+
+def serve(workers: int, port: int, app: str, host: str = "127.0.0.1") -> None:
+    backends = [("127.0.0.1", port + 1 + number) for number in range(workers)]
+    supervisor = Supervisor([streamlit_command(app, backend[1]) for backend in backends])
+    supervisor.start()
+    print(f"🎓 YourTeacher: {workers} workers ({app}) behind http://{host}:{port}")
+    # Stop the workers on SIGTERM too, not just Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    async def run_proxy():
+        proxy = StickyProxy(backends, host, port)
+        await proxy.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await proxy.close()
+
+    try:
+        asyncio.run(run_proxy())
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping workers")
+    finally:
+        supervisor.stop()
+
+
+# TURN WORKER (benchmark)
+# A minimal HTTP endpoint running one agent turn per request, so the benchmark
+# measures the runtime across processes without driving Streamlit's websocket.
+
+def run_turn_worker(port: int) -> None:
+    import json
+
+    from main import agent_registry, get_model_router
+    from session_runtime import runtime
+
+    get_model_router()
+    agent_registry.entry()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n")[1:]:
+                key, _, value = line.partition(b":")
+                if key.strip().lower() == b"content-length":
+                    length = int(value)
+            request = json.loads(await reader.readexactly(length)) if length else {}
+            text, agent = "", ""
+            async for event in runtime.turn(_cookie(head, SESSION_COOKIE) or "anonymous", request.get("message"),
+                                            request.get("agent_key"), request.get("channel", "")):
+                if event.kind == "message":
+                    text, agent = event.text, event.agent
+                elif event.kind == "error":
+                    raise RuntimeError(event.text)
+            status, body = "200 OK", {"agent": agent, "text": text, "worker": os.getenv("YOURTEACHER_WORKER")}
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            status, body = "500 Internal Server Error", {"error": f"{type(e).__name__}: {e}"}
+        data = json.dumps(body).encode()
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + data)
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+# BENCHMARK
+
+async def _post_turn(port: int, session_id: str, payload: Dict) -> Dict:
+    import json
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode()
+    writer.write(f"POST /turn HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {SESSION_COOKIE}={session_id}\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = response.split(b" ", 2)[1]
+    result = json.loads(response.partition(b"\r\n\r\n")[2] or b"{}")
+    if status != b"200":
+        raise RuntimeError(result.get("error", status.decode()))
+    return result
+
+
+async def _drive(proxy: StickyProxy, sessions: int, turns: int, seed: int) -> Dict:
+    import random
+
+    from load_generator import sample_persona, student_script
+    from session_runtime import CHANNEL_AGENTS
+
+    stats = {"turns": 0, "errors": 0, "latency": [], "workers": Counter(), "moved": 0, "last_error": None}
+
+    async def student(number: int) -> None:
+        rng = random.Random(seed * 1_000_003 + number)
+        session_id = proxy.new_session_id()
+        channel, worker = None, None
+        for turn_channel, message in student_script(sample_persona(rng), rng)[:turns]:
+            agent_key = CHANNEL_AGENTS[turn_channel] if turn_channel != channel else None
+            channel = turn_channel
+            started = time.perf_counter()
+            try:
+                result = await _post_turn(proxy.port, session_id, {
+                    "message": message, "agent_key": agent_key, "channel": turn_channel})
+            except Exception as e:
+                stats["errors"] += 1
+                stats["last_error"] = str(e)
+                continue
+            stats["latency"].append(time.perf_counter() - started)
+            stats["turns"] += 1
+            stats["workers"][result["worker"]] += 1
+            stats["moved"] += worker is not None and result["worker"] != worker
+            worker = result["worker"]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(student(number) for number in range(sessions)))
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def benchmark(worker_counts: List[int], sessions: int, turns: int, latency: float, token_delay: float) -> None:
+    import json
+    import multiprocessing
+    import tempfile
+
+    from load_generator import _serve_fake_model
+
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    model_process = context.Process(
+        target=_serve_fake_model, args=(port_queue, latency, token_delay), daemon=True)
+    model_process.start()
+    base_url = f"http://127.0.0.1:{port_queue.get(timeout=60)}/v1/"
+    env = {
+        "YOURTEACHER_MODEL_ENDPOINTS": json.dumps([{"name": "fake", "base_url": base_url}]),
+        "YOURTEACHER_HEDGE_DELAY": "60",
+        "YOURTEACHER_ANALYTICS_DIR": tempfile.mkdtemp(prefix="yourteacher-supervisor-"),
+        "YOURTEACHER_SESSION_DIR": tempfile.mkdtemp(prefix="yourteacher-sessions-"),
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "supervisor-bench",
+        "YOURTEACHER_EXPORT_DIR": "",
+    }
+    print(f"🧪 Fake tutor model at {base_url}, {os.cpu_count()} CPUs, "
+          f"{sessions} concurrent sessions x {turns} turns")
+    print(f"{'workers':>8} {'turns/s':>8} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}  per worker")
+    baseline = None
+    try:
+        for run, workers in enumerate(worker_counts):
+            backends = [("127.0.0.1", port) for port in _free_ports(workers)]
+            supervisor = Supervisor([turn_worker_command(port) for _, port in backends], env)
+            supervisor.start()
+            try:
+                wait_for_ports(backends)
+
+                async def measure():
+                    proxy = StickyProxy(backends, port=0)
+                    await proxy.start()
+                    try:
+                        return await _drive(proxy, sessions, turns, run)
+                    finally:
+                        await proxy.close()
+
+                stats = asyncio.run(measure())
+            finally:
+                supervisor.stop()
+            latencies = sorted(stats["latency"]) or [float("nan")]
+            rate = stats["turns"] / stats["seconds"]
+            baseline = baseline or rate / workers
+            print(f"{workers:>8} {rate:>8.1f} {rate / baseline:>7.2f}x "
+                  f"{latencies[len(latencies) // 2] * 1000:>8.0f} {latencies[int(len(latencies) * 0.95)] * 1000:>8.0f} "
+                  f"{stats['errors']:>7}  {' '.join(str(n) for _, n in sorted(stats['workers'].items()))}")
+            if stats["moved"]:
+                print(f"   ⚠️ {stats['moved']} turns landed on a different worker than the session's previous turn")
+            if stats["last_error"]:
+                print(f"   ⚠️ {stats['last_error']}")
+    finally:
+        model_process.terminate()
+
+
+def _free_ports(count: int) -> List[int]:
+    import socket
+
+    sockets = [socket.socket() for _ in range(count)]
+    for sock in sockets:
+        sock.bind(("127.0.0.1", 0))
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Multi-process supervisor with sticky session routing")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="Run N Streamlit workers behind the sticky proxy")
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serve_parser.add_argument("--port", type=int, default=8501)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--app", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend.py"))
+    bench = sub.add_parser("bench", help="Turns/s through the proxy for each worker count")
+    bench.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    bench.add_argument("--sessions", type=int, default=32, help="Concurrent sessions")
+    bench.add_argument("--turns", type=int, default=6, help="Turns per session")
+    bench.add_argument("--latency", type=float, default=0.05, help="Fake model latency per call (seconds)")
+    bench.add_argument("--token-delay", type=float, default=0.0, help="Fake model delay between tokens")
+    worker = sub.add_parser("turn-worker", help=argparse.SUPPRESS)
+    worker.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.workers, args.port, args.app, args.host)
+    elif args.command == "bench":
+        benchmark(args.workers, args.sessions, args.turns, args.latency, args.token_delay)
+    else:
+        run_turn_worker(args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Streaming telemetry for YourTeacher agent turns.
+
+Wraps the ``stream_events()`` iterator of a streamed run and records, per turn:
+request start, time to first text delta, inter-delta gaps, tool-call pauses and
+completion. Time spent waiting on the iterator (provider + SDK) is tracked
+separately from time spent inside our own event handling, so slow turns can be
+attributed to one or the other. Samples are aggregated per (agent, model).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+# Event type of openai.types.responses.ResponseTextDeltaEvent, compared by value
+# so this module can be imported without the OpenAI SDK
+TEXT_DELTA_EVENT = "response.output_text.delta"
+
+# Metrics recorded for each (agent, model) pair
+METRICS = (
+    "ttft",            # request start -> first text delta
+    "inter_delta",     # gap between consecutive text deltas
+    "tool_pause",      # tool call -> next text delta (or turn end)
+    "total",           # request start -> stream exhausted
+    "provider_wait",   # time blocked on the event iterator during the turn
+    "handler",         # time spent in our own event handling during the turn
+)
+
+PERCENTILES = (50, 90, 99)
+
+
+def _model_name(agent) -> str:
+    model = getattr(agent, "model", None)
+    if model is None:
+        return "default"
+    if isinstance(model, str):
+        return model
+    return getattr(model, "model", type(model).__name__)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1,
+                      int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[rank]
+
+
+class TurnTelemetry:
+    """Timing record for a single streamed agent turn"""
+
+    def __init__(self, agent, clock: Callable[[], float] = time.perf_counter, models: List[str] | None = None):
+        self._clock = clock
+        self._models = models  # models the turn's calls went to so far (ModelRouter.bind)
+        self.agent_name = agent.name
+        self.model = _model_name(agent)
+        self.started_at = clock()
+        self.first_delta_at: float | None = None
+        self.finished_at: float | None = None
+        self.deltas = 0
+        self.tool_calls = 0
+        self.handoffs = 0
+        self.provider_wait = 0.0
+        self.handler_time = 0.0
+        self.error: str | None = None
+        # (agent, model, metric, seconds)
+        self.samples: List[Tuple[str, str, str, float]] = []
+        self._last_delta_at: float | None = None
+        self._tool_pause_started: float | None = None
+
+    def _sample(self, metric: str, value: float) -> None:
+        if self._models:
+            self.model = self._models[-1]  # the routed model of the call in progress
+        self.samples.append((self.agent_name, self.model, metric, value))
+
+    def _close_tool_pause(self, now: float) -> None:
+        if self._tool_pause_started is not None:
+            self._sample("tool_pause", now - self._tool_pause_started)
+            self._tool_pause_started = None
+
+    def observe(self, event: Any, now: float | None = None) -> None:
+        """Update timings from one stream event"""
+        now = self._clock() if now is None else now
+
+        if event.type == "raw_response_event" and getattr(event.data, "type", None) == TEXT_DELTA_EVENT:
+            if not event.data.delta:
+                return
+            if self.first_delta_at is None:
+                self.first_delta_at = now
+                self._sample("ttft", now - self.started_at)
+            elif self._last_delta_at is not None and self._tool_pause_started is None:
+                self._sample("inter_delta", now - self._last_delta_at)
+            self._close_tool_pause(now)
+            self._last_delta_at = now
+            self.deltas += 1
+
+        elif event.type == "agent_updated_stream_event":
+            if event.new_agent.name != self.agent_name:
+                self.handoffs += 1
+            self.agent_name = event.new_agent.name
+            self.model = _model_name(event.new_agent)
+
+        elif event.type == "run_item_stream_event" and event.item.type == "tool_call_item":
+            self.tool_calls += 1
+            if self._tool_pause_started is None:
+                self._tool_pause_started = now
+
+    def finish(self, error: BaseException | None = None) -> None:
+        if self.finished_at is not None:
+            return
+        self.finished_at = self._clock()
+        self._close_tool_pause(self.finished_at)
+        self._sample("total", self.finished_at - self.started_at)
+        self._sample("provider_wait", self.provider_wait)
+        self._sample("handler", self.handler_time)
+        if error is not None:
+            self.error = type(error).__name__
+
+    @property
+    def ttft(self) -> float | None:
+        if self.first_delta_at is None:
+            return None
+        return self.first_delta_at - self.started_at
+
+    @property
+    def total(self) -> float | None:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "agent": self.agent_name,
+            "model": self.model,
+            "ttft": self.ttft,
+            "total": self.total,
+            "deltas": self.deltas,
+            "tool_calls": self.tool_calls,
+            "handoffs": self.handoffs,
+            "provider_wait": self.provider_wait,
+            "handler": self.handler_time,
+            "error": self.error,
+        }
+
+
+class StreamingMetrics:
+    """Thread-safe, bounded aggregation of turn telemetry per (agent, model)"""
+
+    def __init__(self, max_samples: int = 2000):
+        self._max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, str, str], deque] = defaultdict(
+            lambda: deque(maxlen=self._max_samples))
+        self._turns: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._errors: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def record(self, turn: TurnTelemetry) -> None:
+        with self._lock:
+            for agent_name, model, metric, value in turn.samples:
+                self._samples[(agent_name, model, metric)].append(value)
+            key = (turn.agent_name, turn.model)
+            self._turns[key] += 1
+            if turn.error:
+                self._errors[key] += 1
+
+    async def track(self, events: AsyncIterator[Any], agent,
+                    on_turn: Callable[[TurnTelemetry], None] | None = None,
+                    models: List[str] | None = None) -> AsyncIterator[Any]:
+        """
+        Wrap a ``stream_events()`` iterator, timing the turn it belongs to.
+
+        Time spent awaiting the next event counts as provider wait; time between
+        yielding an event and being asked for the next one counts as handler time.
+        ``on_turn`` receives the finished turn, e.g. to show it to the session
+        it belongs to (the metrics themselves are process-wide). ``models``,
+        from ``ModelRouter.bind``, attributes samples to the model each call
+        was routed to instead of the agent's configured model.
+        """
+        turn = TurnTelemetry(agent, models=models)
+        clock = turn._clock
+        error: BaseException | None = None
+        try:
+            while True:
+                wait_started = clock()
+                try:
+                    event = await events.__anext__()
+                except StopAsyncIteration:
+                    turn.provider_wait += clock() - wait_started
+                    break
+                received = clock()
+                turn.provider_wait += received - wait_started
+                turn.observe(event, received)
+                yield event
+                turn.handler_time += clock() - received
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            turn.finish(error)
+            self.record(turn)
+            if on_turn is not None:
+                on_turn(turn)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Percentile summary keyed by ``"agent | model"``"""
+        with self._lock:
+            snapshot = {key: sorted(values) for key, values in self._samples.items()}
+            turns = dict(self._turns)
+            errors = dict(self._errors)
+
+        result: Dict[str, Dict[str, Any]] = {}
+        for (agent_name, model, metric), values in snapshot.items():
+            entry = result.setdefault(f"{agent_name} | {model}", {
+                "turns": turns.get((agent_name, model), 0),
+                "errors": errors.get((agent_name, model), 0),
+            })
+            entry[metric] = {
+                "count": len(values),
+                **{f"p{p}": percentile(values, p) for p in PERCENTILES},
+            }
+        return result
+
+    def format_summary(self) -> str:
+        """Human readable table of the summary, in milliseconds"""
+        summary = self.summary()
+        if not summary:
+            return "No streaming turns recorded yet."
+
+        lines = []
+        for key, entry in sorted(summary.items()):
+            lines.append(f"{key}  (turns: {entry['turns']}, errors: {entry['errors']})")
+            for metric in METRICS:
+                stats = entry.get(metric)
+                if not stats:
+                    continue
+                pcts = "  ".join(
+                    f"p{p}={stats[f'p{p}'] * 1000:8.1f}ms" for p in PERCENTILES)
+                lines.append(f"  {metric:<14} n={stats['count']:<5} {pcts}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._turns.clear()
+            self._errors.clear()
+
+
+# Process-wide registry shared by the CLI and the Streamlit app
+streaming_metrics = StreamingMetrics()
@@ -0,0 +1,264 @@
+"""
+Warm pool of pre-generated session openings.
+
+Every new student starts with the same message to the screener ("Hello! I'm
+ready to start..."), so the first screen of a session is a full model turn
+the student waits for. With ``YOURTEACHER_WARM_POOL`` set, the session
+runtime generates openings ahead of time on scratch sessions, and the
+opening turn of a new session adopts one (agent, input items, transcript)
+instead of calling the model, so the greeting appears at once.
+
+Openings are kept per (agent graph, opening agent) and used once. The pool
+is refilled in the background; its target size follows the arrival rate of
+new sessions times the time one opening takes to generate (Little's law),
+capped at ``YOURTEACHER_WARM_POOL``, so a burst of arrivals does not drain it.
+
+Usage:
+    python warm_pool.py bench --students 40 --rate 2 --latency 0.5
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+OPENING_MESSAGE = "Hello! I'm ready to start my personalized learning journey."
+
+ARRIVAL_WINDOW = 60.0  # seconds of arrivals the rate is estimated from
+ARRIVAL_MIN_SPAN = 5.0  # shortest span a rate is computed over, so a first burst is not overestimated
+OPENING_TTL = 3600.0  # older openings are dropped (edited agent graph or instructions, new model)
+REFILL_SMOOTHING = 0.2  # weight of the latest generation time in its moving average
+
+Key = Tuple[str, str | None]  # (agent graph path, agent key of the opening turn)
+
+
+def warm_pool_size() -> int:
+    """Largest number of openings kept per agent graph (0: no warm pool)"""
+    return int(os.getenv("YOURTEACHER_WARM_POOL") or 0)
+
+
+@dataclass
+class Opening:
+    """Result of one opening turn, ready to be adopted by a new session"""
+    agent: str  # agent the conversation continues with
+    input_items: List[Dict[str, Any]]
+    rows: List[Dict[str, Any]]  # transcript rows
+    events: List[Any]  # session_runtime.TurnEvents replayed to the UI
+    created: float = field(default_factory=time.monotonic)
+
+
+class WarmPoolMetrics:
+    """Pool hit/miss counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "generated": 0,
+            "failed": 0,
+            "uncacheable": 0,
+            "expired": 0,
+        }
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            stats: Dict[str, float] = dict(self.counters)
+        served = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / served if served else 0.0
+        return stats
+
+
+class WarmPool:
+    """Pre-generated openings per agent graph, refilled on one event loop
+
+    ``take`` may be called from any thread; generation and the bookkeeping of
+    running refills happen on the loop given to ``start``.
+    """
+
+    def __init__(self, max_size: int, generate: Callable[[str, str | None], Awaitable[Opening | None]]):
+        self.max_size = max_size
+        self._generate = generate  # None when the opening cannot be reused (it changed the context)
+        self._openings: Dict[Key, deque[Opening]] = {}
+        self._arrivals: Dict[Key, deque[float]] = {}
+        self._refilling: Dict[Key, int] = {}
+        self._targets: Dict[Key, int] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.refill_seconds: float | None = None
+        self.metrics = WarmPoolMetrics()
+
+    def start(self, loop: asyncio.AbstractEventLoop, keys: List[Key]) -> None:
+        """Generate openings on ``loop``, starting with those for ``keys``"""
+        self._loop = loop
+        for key in keys:
+            self._openings.setdefault(key, deque())
+            self._arrivals.setdefault(key, deque())
+            loop.call_soon_threadsafe(self._refill, key)
+
+    def __len__(self) -> int:
+        return sum(len(openings) for openings in list(self._openings.values()))
+
+    def take(self, graph_path: str, agent_key: str | None) -> Opening | None:
+        """An opening for a new session (None on a miss); either way the pool is topped up"""
+        key = (graph_path, agent_key)
+        now = time.monotonic()
+        self._arrivals.setdefault(key, deque()).append(now)
+        openings = self._openings.setdefault(key, deque())
+        opening = None
+        while opening is None:
+            try:
+                opening = openings.popleft()
+            except IndexError:
+                break
+            if opening.created < now - OPENING_TTL:
+                self.metrics.incr("expired")
+                opening = None
+        self.metrics.incr("hits" if opening is not None else "misses")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._refill, key)
+        return opening
+
+    def target(self, key: Key) -> int:
+        """Openings to keep for ``key``: arrivals expected while one is generated, plus one"""
+        arrivals = self._arrivals.get(key) or deque()
+        now = time.monotonic()
+        while arrivals and arrivals[0] < now - ARRIVAL_WINDOW:
+            arrivals.popleft()
+        if not arrivals or self.refill_seconds is None:
+            return min(1, self.max_size)
+        rate = len(arrivals) / max(now - arrivals[0], ARRIVAL_MIN_SPAN)
+        return max(1, min(self.max_size, math.ceil(rate * self.refill_seconds) + 1))
+
+    def _refill(self, key: Key) -> None:
+        target = self._targets[key] = self.target(key)
+        missing = target - len(self._openings[key]) - self._refilling.get(key, 0)
+        for _ in range(missing):
+            task = self._loop.create_task(self._fill_one(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fill_one(self, key: Key) -> None:
+        self._refilling[key] = self._refilling.get(key, 0) + 1
+        started = time.perf_counter()
+        try:
+            opening = await self._generate(*key)
+        except Exception as e:
+            # Not retried until the next arrival, so a failing model is not hammered
+            self.metrics.incr("failed")
+            print(f"⚠️ Could not pre-generate a session opening: {e}")
+            return
+        finally:
+            self._refilling[key] -= 1
+        if opening is None:
+            self.metrics.incr("uncacheable")
+            return
+        seconds = time.perf_counter() - started
+        self.refill_seconds = seconds if self.refill_seconds is None else (
+            (1 - REFILL_SMOOTHING) * self.refill_seconds + REFILL_SMOOTHING * seconds)
+        self._openings[key].append(opening)
+        self.metrics.incr("generated")
+        self._refill(key)  # the target may have grown meanwhile
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self.metrics.snapshot(),
+            "size": len(self),
+            "target": sum(self._targets.values()),
+            "refill_seconds": self.refill_seconds or 0.0,
+        }
+
+
+# BENCHMARK
+
+def _first_turn_latencies(runtime, students: int, rate: float) -> List[float]:
+    """Seconds to the opening reply of ``students`` new sessions arriving ``rate`` per second"""
+    from session_runtime import CHANNEL_AGENTS
+
+    async def student(number: int) -> float:
+        await asyncio.sleep(number / rate)
+        started = time.perf_counter()
+        async for _ in runtime.turn(f"bench-{number}-{os.urandom(4).hex()}", OPENING_MESSAGE,
+                                    CHANNEL_AGENTS["screener"], "screener"):
+            pass
+        return time.perf_counter() - started
+
+    async def arrivals() -> List[float]:
+        return list(await asyncio.gather(*(student(number) for number in range(students))))
+
+    return runtime.run(arrivals())
+
+
+def benchmark(students: int, rate: float, max_size: int, latency: float, token_delay: float) -> None:
+    """Opening-turn latency of new sessions without and with a warm pool, against a fake model"""
+    import json
+    import multiprocessing
+
+    from load_generator import _serve_fake_model
+    from telemetry import percentile
+
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    server = context.Process(target=_serve_fake_model, args=(port_queue, latency, token_delay), daemon=True)
+    server.start()
+    os.environ["YOURTEACHER_MODEL_ENDPOINTS"] = json.dumps(
+        [{"name": "fake", "base_url": f"http://127.0.0.1:{port_queue.get(timeout=30)}/v1/"}])
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+    from session_runtime import SessionRuntime
+
+    try:
+        results = {}
+        for label, size in (("cold", 0), ("warm pool", max_size)):
+            runtime = SessionRuntime()
+            runtime.configure_hibernation(None)
+            runtime.configure_warm_pool(size)
+            runtime.run(asyncio.sleep(0))
+            if size:
+                # Let the pool fill its initial opening, as after a launcher warm-up
+                while not len(runtime.warm_pool):
+                    time.sleep(0.05)
+            else:
+                _first_turn_latencies(runtime, 1, rate)  # imports and connections
+            seconds = sorted(_first_turn_latencies(runtime, students, rate))
+            results[label] = seconds
+            line = (f"{label:>9}: p50 {percentile(seconds, 50) * 1000:7.1f} ms   "
+                    f"p95 {percentile(seconds, 95) * 1000:7.1f} ms")
+            if size:
+                stats = runtime.warm_pool.stats()
+                line += (f"   hits {stats['hits']}/{stats['hits'] + stats['misses']}, "
+                         f"target {stats['target']}, refill {stats['refill_seconds']:.2f}s")
+            print(line)
+        speedup = percentile(results["cold"], 50) / max(percentile(results["warm pool"], 50), 1e-6)
+        print(f"⚡ {students} new students at {rate:g}/s: first screen {speedup:.0f}x faster (p50)")
+    finally:
+        server.terminate()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Warm pool of pre-generated session openings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Compare opening-turn latency with and without a warm pool")
+    bench.add_argument("--students", type=int, default=40)
+    bench.add_argument("--rate", type=float, default=2.0, help="New students per second")
+    bench.add_argument("--size", type=int, default=8, help="Largest pool size")
+    bench.add_argument("--latency", type=float, default=0.5, help="Fake model time to first token")
+    bench.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    benchmark(args.students, args.rate, args.size, args.latency, args.token_delay)
+
+
+if __name__ == "__main__":
+    main()